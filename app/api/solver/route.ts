@@ -5,10 +5,83 @@ import path from "path";
 
 const execAsync = promisify(exec);
 
+// When set (e.g. http://127.0.0.1:8765), solves are sent to a running
+// `assign_secretaries.py --serve` daemon instead of spawning Python per request.
+const SOLVER_URL = process.env.SOLVER_URL;
+
+// Result document of a solved week, as printed by
+// `assign_secretaries.py --output json` and returned by the daemon
+// (scripts/lib/report.py result_document). Only the fields used here are typed.
+interface SolverResult {
+  week: string;
+  status: string;
+  objective: number | null;
+  best_bound: number | null;
+  wall_time: number;
+  stopped_by: "gap" | "plateau" | "filled" | null;
+  written: { inserted: number; updated: number; deleted: number; unchanged: number } | null;
+  summary: { medical_needs: number; filled: number; unfilled: number; admin: number; total: number };
+  [key: string]: unknown;
+}
+
+function solverResponse(result: SolverResult) {
+  return NextResponse.json({
+    success: true,
+    message: `${result.status} — ${result.summary.filled} besoins remplis, ${result.summary.unfilled} non remplis`,
+    result,
+  });
+}
+
+async function runWithDaemon(weekStart: string) {
+  const res = await fetch(`${SOLVER_URL}/solve`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ week: weekStart }),
+    signal: AbortSignal.timeout(120_000),
+  });
+  const data = await res.json();
+  if (!res.ok) throw new Error(data.error ?? `Solver daemon error (${res.status})`);
+
+  return solverResponse(data as SolverResult);
+}
+
+// Queues the week on the daemon and answers at once with the job status
+// ({"id", "state", "coalesced", ...}); poll it with GET /api/solver?job=<id>.
+async function submitToDaemon(weekStart: string) {
+  const res = await fetch(`${SOLVER_URL}/jobs`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ week: weekStart }),
+    signal: AbortSignal.timeout(10_000),
+  });
+  const data = await res.json();
+  if (!res.ok) throw new Error(data.error ?? `Solver daemon error (${res.status})`);
+
+  return NextResponse.json({ success: true, job: data }, { status: 202 });
+}
+
+// Streams the daemon's NDJSON events ({"event": "solution" | "result" |
+// "error"}) through to the client as they arrive.
+async function streamFromDaemon(weekStart: string) {
+  const res = await fetch(`${SOLVER_URL}/solve`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ week: weekStart, stream: true }),
+    signal: AbortSignal.timeout(120_000),
+  });
+  if (!res.ok || !res.body) {
+    const data = await res.json().catch(() => ({}));
+    throw new Error(data.error ?? `Solver daemon error (${res.status})`);
+  }
+  return new Response(res.body, {
+    headers: { "Content-Type": "application/x-ndjson", "Cache-Control": "no-cache" },
+  });
+}
+
 export async function POST(request: NextRequest) {
   try {
     const body = await request.json();
-    const { weekStart, clearProposed } = body;
+    const { weekStart, clearProposed, stream, async: queued } = body;
 
     if (!weekStart) {
       return NextResponse.json(
@@ -17,30 +90,36 @@ export async function POST(request: NextRequest) {
       );
     }
 
+    // Streaming needs the daemon; the script fallback answers with the final document only
+    if (SOLVER_URL && queued) return await submitToDaemon(weekStart);
+    if (SOLVER_URL && stream) return await streamFromDaemon(weekStart);
+    if (SOLVER_URL) return await runWithDaemon(weekStart);
+
     // Build command
     const scriptPath = path.join(process.cwd(), "scripts", "assign_secretaries.py");
-    const args = [`--week`, weekStart];
+    const args = [`--week`, weekStart, `--output`, `json`];
     if (clearProposed) args.push("--clear-proposed");
 
     const command = `python "${scriptPath}" ${args.join(" ")}`;
 
-    // Execute the Python solver
-    const { stdout, stderr } = await execAsync(command, {
-      cwd: process.cwd(),
-      timeout: 120_000, // 2 minute timeout
-      env: { ...process.env },
-    });
-
-    // Parse the output for status information
-    const lines = stdout.split("\n");
-    const statusLine = lines.find((l: string) => l.includes("OPTIMAL") || l.includes("FEASIBLE") || l.includes("INFEASIBLE"));
-
-    return NextResponse.json({
-      success: true,
-      message: statusLine ?? "Solver terminé",
-      stdout: stdout.slice(-1000), // Last 1000 chars
-      stderr: stderr ? stderr.slice(-500) : null,
-    });
+    // Execute the Python solver: the result document is on stdout,
+    // progress and report on stderr
+    let stdout: string;
+    try {
+      ({ stdout } = await execAsync(command, {
+        cwd: process.cwd(),
+        timeout: 120_000, // 2 minute timeout
+        maxBuffer: 16 * 1024 * 1024,
+        env: { ...process.env },
+      }));
+    } catch (err) {
+      // Non-zero exit: the script still prints {"status": "ERROR", "error"}
+      const out = (err as { stdout?: string }).stdout;
+      const parsed = out ? JSON.parse(out) : null;
+      throw new Error(parsed?.error ?? (err instanceof Error ? err.message : String(err)));
+    }
+
+    return solverResponse(JSON.parse(stdout) as SolverResult);
   } catch (error) {
     console.error("Solver error:", error);
 
@@ -53,3 +132,34 @@ export async function POST(request: NextRequest) {
     );
   }
 }
+
+// Job status and cancellation (daemon only): GET /api/solver?job=<id>[&wait=<s>]
+// returns the job status, with the result document once "done";
+// DELETE /api/solver?job=<id> cancels it.
+async function forwardJob(request: NextRequest, method: "GET" | "DELETE") {
+  if (!SOLVER_URL) {
+    return NextResponse.json({ error: "Jobs require the solver daemon (SOLVER_URL)" }, { status: 501 });
+  }
+  const jobId = request.nextUrl.searchParams.get("job");
+  if (!jobId) {
+    return NextResponse.json({ error: "job is required" }, { status: 400 });
+  }
+  const wait = method === "GET" ? request.nextUrl.searchParams.get("wait") : null;
+  const url = `${SOLVER_URL}/jobs/${encodeURIComponent(jobId)}${wait ? `?wait=${encodeURIComponent(wait)}` : ""}`;
+  try {
+    const res = await fetch(url, { method, signal: AbortSignal.timeout(70_000) });
+    return NextResponse.json(await res.json(), { status: res.status });
+  } catch (error) {
+    console.error("Solver job error:", error);
+    const errMsg = error instanceof Error ? error.message : "Unknown solver error";
+    return NextResponse.json({ error: errMsg }, { status: 500 });
+  }
+}
+
+export async function GET(request: NextRequest) {
+  return forwardJob(request, "GET");
+}
+
+export async function DELETE(request: NextRequest) {
+  return forwardJob(request, "DELETE");
+}
@@ -5,13 +5,28 @@ Usage:
     python scripts/assign_secretaries.py --week 2026-01-06
     python scripts/assign_secretaries.py --week 2026-01-06 --dry-run
     python scripts/assign_secretaries.py --week 2026-01-06 --verbose
+    python scripts/assign_secretaries.py --from 2026-01-05 --to 2026-03-30
+    python scripts/assign_secretaries.py --week 2026-01-05 --weeks 4
+    python scripts/assign_secretaries.py --week 2026-01-06 --warm-start
+    python scripts/assign_secretaries.py --week 2026-01-06 --decompose
+    python scripts/assign_secretaries.py --week 2026-01-06 --output json
+    python scripts/assign_secretaries.py --week 2026-01-06 --progress --persist-every 5
+    python scripts/assign_secretaries.py --week 2026-01-06 --gap 0.01 --plateau 5
+    python scripts/assign_secretaries.py --week 2026-01-06 --staged --time-limit 60
+    python scripts/assign_secretaries.py --week 2026-01-06 --diagnose
+    python scripts/assign_secretaries.py --repair --date 2026-01-07 --period AM
+    python scripts/assign_secretaries.py --week 2026-01-06 --rollback
+    python scripts/assign_secretaries.py --week 2026-01-06 --record weeks/{week}.snap
+    python scripts/assign_secretaries.py --replay weeks/2026-01-05.snap --time-limit 60
+    python scripts/assign_secretaries.py --serve --port 8765
+    python scripts/assign_secretaries.py --watch --debounce 5
 """
 
 import sys
 import os
 import argparse
-from datetime import date, timedelta
-from collections import defaultdict
+import contextlib
+import json
 
 # Add project root to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -21,45 +36,54 @@ from dotenv import load_dotenv
 # Load .env from project root
 load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env"))
 
-from lib.db import (
-    get_connection,
-    load_week_data,
-    create_admin_blocks,
-    load_admin_blocks,
-    clear_secretary_assignments,
-    write_assignments,
+from lib.db import get_connection
+from lib.cache import ReferenceCache, ResultCache
+from lib.model import SITE_MODELS
+from lib.decompose import BALANCE_MODES
+from lib.metrics import METRICS_FORMATS, write_metrics
+from lib.progress import print_progress
+from lib.runner import (
+    REPAIR_TIME_LIMIT, parse_week, week_range, repair_window, solve_week, solve_weeks, replay_week,
+    restore_previous_run,
 )
-from lib.model import build_model, solve_model
-from lib.report import print_report
-
-
-def build_availability_map(data):
-    """Build availability map from v_secretary_availability rows.
-
-    Returns: {staff_id: {date: set('AM','PM')}}
-    """
-    availability = defaultdict(lambda: defaultdict(set))
-    for row in data["availability"]:
-        sid = row["id_staff"]
-        d = row["date"]
-        if isinstance(d, str):
-            d = date.fromisoformat(d)
-        availability[sid][d].add(row["period"])
-    return dict(availability)
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Secretary assignment algorithm")
     parser.add_argument(
         "--week",
-        required=True,
         help="Monday of the week to process (YYYY-MM-DD)",
     )
+    parser.add_argument(
+        "--from",
+        dest="week_from",
+        help="First Monday of a multi-week batch (YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "--to",
+        dest="week_to",
+        help="Last Monday of a multi-week batch, inclusive (YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "--weeks",
+        type=int,
+        help="Number of consecutive weeks to process from --week/--from",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Parallel solver processes for multi-week runs (default: one per core)",
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
         help="Compute and report without inserting into database",
     )
+    parser.add_argument(
+        "--clear-proposed",
+        action="store_true",
+        help="Accepted for compatibility: previous SCHEDULE/ALGORITHM rows are always replaced",
+    )
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -68,102 +92,369 @@ def parse_args():
     parser.add_argument(
         "--time-limit",
         type=int,
-        default=30,
-        help="Solver time limit in seconds (default: 30)",
+        help=f"Solver time limit in seconds (default: 30, {REPAIR_TIME_LIMIT} with --repair or --watch)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore the local caches: always fetch reference tables and always solve",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Solve even if the week's data is unchanged since its last run",
+    )
+    parser.add_argument(
+        "--warm-start",
+        action="store_true",
+        help="Hint the solver with the week's previous ALGORITHM assignments",
+    )
+    parser.add_argument(
+        "--hint-previous-week",
+        action="store_true",
+        help="Also hint with the previous week's plan on the same weekdays",
+    )
+    parser.add_argument(
+        "--site-model",
+        choices=SITE_MODELS,
+        default="pairwise",
+        help="Encoding of the site-continuity objective (default: pairwise)",
+    )
+    parser.add_argument(
+        "--compare-site-models",
+        action="store_true",
+        help="Print model sizes for every site-continuity encoding before solving",
+    )
+    parser.add_argument(
+        "--decompose",
+        action="store_true",
+        help="Split the week into independent groups of secretaries and solve them in parallel",
+    )
+    parser.add_argument(
+        "--balance",
+        choices=BALANCE_MODES,
+        default="global",
+        help="Workload/pénibilité targets with --decompose: week-wide averages "
+             "(global, exact) or per group (component) (default: global)",
+    )
+    parser.add_argument(
+        "--staged",
+        action="store_true",
+        help="Solve medical fill, then quality (skills, preferences, sites, admin), "
+             "then fairness, each level kept by the next (instead of one weighted objective)",
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="Re-optimize only the half-days of --date/--period, keeping the week's "
+             "current plan everywhere else, and write only those half-days",
+    )
+    parser.add_argument(
+        "--date",
+        nargs="+",
+        dest="dates",
+        help="Day(s) to repair (YYYY-MM-DD, same week)",
+    )
+    parser.add_argument(
+        "--period",
+        choices=("AM", "PM"),
+        help="Repair only this period of --date (default: both)",
+    )
+    parser.add_argument(
+        "--rollback",
+        action="store_true",
+        help="Publish the week's previous solver run again instead of solving "
+             "(needs scripts/create-solver-runs.mjs)",
+    )
+    parser.add_argument(
+        "--gap",
+        type=float,
+        dest="relative_gap",
+        help="Stop once the objective is within this relative gap of the bound (e.g. 0.01)",
+    )
+    parser.add_argument(
+        "--absolute-gap",
+        type=float,
+        help="Stop once the objective is within this absolute gap of the bound",
+    )
+    parser.add_argument(
+        "--plateau",
+        type=float,
+        metavar="SECONDS",
+        help="Stop when no better solution was found for SECONDS",
+    )
+    parser.add_argument(
+        "--stop-when-filled",
+        action="store_true",
+        help="Stop as soon as every fillable medical need is filled",
+    )
+    parser.add_argument(
+        "--fairness-gap",
+        type=float,
+        help="With --stop-when-filled, also require every secretary's medical load "
+             "to be within this many half-days of the workload target",
+    )
+    parser.add_argument(
+        "--diagnose",
+        action="store_true",
+        help="When a week has no solution, search for a minimal set of "
+             "conflicting constraints (can take up to --time-limit more)",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Print every improving solution while the solver runs (single week)",
+    )
+    parser.add_argument(
+        "--persist-every",
+        type=float,
+        metavar="SECONDS",
+        help="Also publish the best solution so far (PROPOSED rows, as a solver run), at most once "
+             "every SECONDS, while the solver runs (single week)",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        help="Save each loaded week (data, availability, admin blocks) to PATH "
+             "for --replay; \"{week}\" in PATH is replaced by the week's Monday",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        help="Solve a week saved with --record, without database access "
+             "(nothing is written)",
+    )
+    parser.add_argument(
+        "--output",
+        choices=("text", "json"),
+        default="text",
+        help="json: print one result document on stdout (progress and report "
+             "go to stderr); several weeks give {\"weeks\": [...]} (default: text)",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=os.environ.get("SOLVER_METRICS_FILE"),
+        help="Export per-phase timings, query times, model size and peak RSS "
+             "to this file, also per --serve job and --watch repair "
+             "(default: $SOLVER_METRICS_FILE)",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=METRICS_FORMATS,
+        default="json",
+        help="json: append one JSON line per week; prometheus: rewrite the file "
+             "in text exposition format (default: json)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run as a long-lived solver daemon accepting jobs over HTTP",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Run until interrupted, repairing the half-days whose absences, needs or "
+             "manual assignments change (needs scripts/create-fn-notify-replan.mjs)",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=2.0,
+        metavar="SECONDS",
+        help="With --watch, wait for SECONDS without new changes before re-planning (default: 2)",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Daemon listen address (default: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=int(os.environ.get("SOLVER_PORT", 8765)),
+        help="Daemon listen port (default: $SOLVER_PORT or 8765)",
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.repair:
+        if not args.dates:
+            parser.error("--repair requires --date")
+        if args.week or args.week_from or args.weeks or args.decompose or args.replay or args.watch:
+            parser.error("--repair takes the week from --date and cannot be combined with "
+                         "--week, --from, --weeks, --decompose, --replay or --watch")
+    elif args.dates or args.period:
+        parser.error("--date and --period are only used with --repair")
+    elif args.replay:
+        if args.week or args.week_from or args.record or args.persist_every or args.watch:
+            parser.error("--replay cannot be combined with --week, --from, --record, "
+                         "--persist-every or --watch")
+    elif args.watch:
+        if args.week or args.week_from or args.weeks or args.decompose or args.record or args.serve:
+            parser.error("--watch takes the weeks from the changes and cannot be combined with "
+                         "--week, --from, --weeks, --decompose, --record or --serve")
+    elif not args.serve and not (args.week or args.week_from):
+        parser.error("--week or --from is required (unless --serve, --watch or --replay)")
+    if args.rollback and (not args.week or args.week_from or args.weeks or args.repair
+                          or args.replay or args.dry_run):
+        parser.error("--rollback takes a single --week and cannot be combined with "
+                     "--from, --weeks, --repair, --replay or --dry-run")
+    if args.week_to and not args.week_from:
+        parser.error("--to requires --from")
+    if args.fairness_gap is not None and not args.stop_when_filled:
+        parser.error("--fairness-gap requires --stop-when-filled")
+    if args.staged and (args.decompose or args.relative_gap is not None or args.absolute_gap is not None
+                        or args.plateau or args.stop_when_filled):
+        parser.error("--staged cannot be combined with --decompose or early stopping options")
+    # Component solves have no stop rule: the options would be silently ignored
+    if args.decompose and (args.relative_gap is not None or args.absolute_gap is not None
+                           or args.plateau or args.stop_when_filled):
+        parser.error("--decompose cannot be combined with early stopping options")
+    return args
 
 
-def main():
-    args = parse_args()
+def run_options(args):
+    """compute_week options from the command line."""
+    return {
+        "time_limit": args.time_limit or (REPAIR_TIME_LIMIT if args.repair or args.watch else 30),
+        "site_model": args.site_model,
+        "compare_sites": args.compare_site_models,
+        "decompose": args.decompose,
+        "balance": args.balance,
+        "relative_gap": args.relative_gap,
+        "absolute_gap": args.absolute_gap,
+        "plateau": args.plateau,
+        "stop_when_filled": args.stop_when_filled,
+        "fairness_gap": args.fairness_gap,
+        "staged": args.staged,
+        "diagnose": args.diagnose,
+        "verbose": args.verbose,
+    }
 
-    # Parse week start (must be a Monday)
-    week_start = date.fromisoformat(args.week)
-    if week_start.weekday() != 0:
-        print(f"Error: {args.week} is not a Monday (weekday={week_start.weekday()})")
-        print("Please provide a Monday date (e.g., 2026-01-06)")
-        sys.exit(1)
 
-    week_end = week_start + timedelta(days=6)
-    print(f"Semaine: {week_start} -> {week_end}")
+def run(args):
+    """Solve the requested weeks. Returns (weeks, {week_start: result})."""
+    solve_options = run_options(args)
+    listeners = [print_progress] if args.progress else []
+
+    if args.replay:
+        try:
+            result = replay_week(args.replay, listeners=listeners, **solve_options)
+        except OSError as e:
+            raise ValueError(f"Snapshot illisible: {e}")
+        week_start = result["document"]["week"]
+        return [week_start], {week_start: result}
+
+    repair = None
+    if args.repair:
+        try:
+            week_start, repair = repair_window(args.dates, period=args.period)
+        except ValueError as e:
+            raise ValueError(f"--date: {e}")
+        args.week = week_start.isoformat()
+
+    # Parse week start(s) (must be Mondays)
+    try:
+        first = parse_week(args.week_from or args.week)
+        last = parse_week(args.week_to) if args.week_to else None
+    except ValueError as e:
+        raise ValueError(f"{e}. Please provide a Monday date (e.g., 2026-01-05)")
+    weeks = week_range(first, last=last, count=args.weeks)
+    if args.record and len(weeks) > 1 and "{week}" not in args.record:
+        raise ValueError("--record needs \"{week}\" in its path to save several weeks")
+    reference_cache = None if args.no_cache else ReferenceCache()
+    result_cache = None if args.no_cache or args.force else ResultCache()
 
     # Connect
     conn = get_connection()
     try:
-        # Clear SCHEDULE+ALGORITHM secretary assignments before solving
-        if not args.dry_run:
-            deleted = clear_secretary_assignments(conn, week_start)
-            print(f"Nettoyage: {deleted} assignations SCHEDULE/ALGORITHM supprimées")
+        if args.rollback:
+            results = {weeks[0]: restore_previous_run(conn, weeks[0])}
+        elif len(weeks) == 1:
+            results = {weeks[0]: solve_week(
+                conn, weeks[0],
+                dry_run=args.dry_run,
+                reference_cache=reference_cache,
+                warm_start=args.warm_start,
+                hint_previous_week=args.hint_previous_week,
+                listeners=listeners,
+                persist_every=args.persist_every,
+                record=args.record,
+                result_cache=result_cache,
+                repair=repair,
+                **solve_options,
+            )}
         else:
-            print("[DRY RUN] Nettoyage ignoré (pas de suppression)")
-
-        # Load all data
-        print("Chargement des données...")
-        data = load_week_data(conn, week_start)
-        print(
-            f"  {len(data['secretaries'])} secrétaires, "
-            f"{len(data['needs'])} besoins (gap>0), "
-            f"{len(data['eligibility'])} éligibilités, "
-            f"{len(data['availability'])} disponibilités"
-        )
+            results = solve_weeks(
+                conn, weeks,
+                dry_run=args.dry_run,
+                jobs=args.jobs,
+                reference_cache=reference_cache,
+                warm_start=args.warm_start,
+                hint_previous_week=args.hint_previous_week,
+                record=args.record,
+                result_cache=result_cache,
+                **solve_options,
+            )
+    finally:
+        conn.close()
+    return weeks, results
 
-        # Check admin department exists
-        if data["admin_dept_id"] is None:
-            print("ERREUR: Département 'Administration' non trouvé!")
-            print("Exécutez: node run-sql.js prepare-admin-blocks.sql")
-            sys.exit(1)
-
-        # Create admin blocks for the week
-        created = create_admin_blocks(conn, week_start, data["admin_dept_id"])
-        if created:
-            print(f"  {len(created)} blocs ADMIN créés")
-
-        # Load admin blocks
-        admin_blocks = load_admin_blocks(conn, week_start)
-        print(f"  {len(admin_blocks)} blocs ADMIN pour la semaine")
-
-        # Build availability map from view data
-        print("Construction de la carte de disponibilité...")
-        availability = build_availability_map(data)
-
-        # Count available slots
-        total_slots = 0
-        for sid, days in availability.items():
-            for d, periods in days.items():
-                total_slots += len(periods)
-        print(f"  {total_slots} demi-journées disponibles au total")
-
-        # Build CP-SAT model
-        print("Construction du modèle CP-SAT...")
-        model, x, y, meta = build_model(
-            data, availability, admin_blocks, verbose=args.verbose
-        )
 
-        # Solve
-        print(f"Résolution (time limit: {args.time_limit}s)...")
-        result = solve_model(
-            model, x, y, data, meta,
-            time_limit=args.time_limit,
+def main():
+    args = parse_args()
+
+    if args.serve:
+        from lib.server import serve
+
+        serve(
+            host=args.host,
+            port=args.port,
+            default_time_limit=args.time_limit or 30,
             verbose=args.verbose,
+            metrics_file=args.metrics_file,
+            metrics_format=args.metrics_format,
         )
+        return
 
-        # Print report
-        print_report(data, result, availability)
+    if args.watch:
+        from lib.watcher import ReplanWatcher
 
-        # Write to database (unless dry-run)
-        if result["status"] in ("OPTIMAL", "FEASIBLE"):
-            all_assignments = result["assignments"] + result["admin_assignments"]
+        ReplanWatcher(
+            debounce=args.debounce,
+            dry_run=args.dry_run,
+            reference_cache=None if args.no_cache else ReferenceCache(),
+            listeners=[print_progress] if args.progress else [],
+            metrics_file=args.metrics_file,
+            metrics_format=args.metrics_format,
+            **run_options(args),
+        ).run()
+        return
 
-            if args.dry_run:
-                print(f"[DRY RUN] {len(all_assignments)} assignations NON insérées")
-            else:
-                inserted = write_assignments(conn, all_assignments)
-                print(f"{inserted} assignations insérées en base (source=ALGORITHM, status=PROPOSED)")
+    json_output = args.output == "json"
+    stdout = sys.stdout
+    try:
+        # With --output json, progress lines and the report go to stderr and
+        # stdout only carries the result document
+        with contextlib.redirect_stdout(sys.stderr) if json_output else contextlib.nullcontext():
+            weeks, results = run(args)
+    except ValueError as e:
+        if json_output:
+            json.dump({"status": "ERROR", "error": str(e)}, stdout)
+            stdout.write("\n")
         else:
-            print(f"Pas de solution trouvée (status={result['status']})")
+            print(f"ERREUR: {e}")
+        sys.exit(1)
 
-    finally:
-        conn.close()
+    if args.metrics_file:
+        write_metrics(
+            args.metrics_file,
+            [results[w]["metrics"] for w in weeks],
+            fmt=args.metrics_format,
+        )
+
+    if json_output:
+        documents = [results[w]["document"] for w in weeks]
+        json.dump(documents[0] if len(documents) == 1 else {"weeks": documents}, stdout)
+        stdout.write("\n")
 
 
 if __name__ == "__main__":
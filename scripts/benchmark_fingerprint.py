@@ -0,0 +1,82 @@
+"""
+Scaling check of the result cache fingerprint (lib.cache.instance_fingerprint)
+on synthetic weeks (no database).
+
+The result cache fingerprints every week before solving it, so its time
+must stay about linear in the size of the week. Exits with status 1 when
+the time per eligibility row grows more than SCALING times from the
+smallest to the largest week.
+
+Usage:
+    python scripts/benchmark_fingerprint.py
+    python scripts/benchmark_fingerprint.py --sizes 30,120,480
+"""
+
+import sys
+import os
+import argparse
+import time
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lib.cache import instance_fingerprint
+from lib.synthetic import generate_week
+
+# Largest allowed growth of the time per eligibility row, measured on weeks
+# where the fingerprint takes at least MIN_TIME seconds (shorter ones are noise)
+SCALING = 3.0
+MIN_TIME = 0.01
+
+
+def measure(size, seed):
+    """Fingerprint time of a synthetic week. Returns (eligibility rows, seconds)."""
+    instance = generate_week(size, seed=seed)
+    start = time.perf_counter()
+    instance_fingerprint(instance, {"time_limit": 30})
+    return len(instance["data"]["eligibility"]), time.perf_counter() - start
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Result cache fingerprint scaling check")
+    parser.add_argument(
+        "--sizes",
+        default="30,60,120,240",
+        help="Comma-separated numbers of secretaries of the synthetic weeks "
+             "(default: 30,60,120,240)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Random seed of the synthetic weeks (default: 0)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    print(f"{'Secr.':>6}  {'Éligib.':>8}  {'Empr.(s)':>9}  {'µs/ligne':>9}")
+    measured = []
+    for size in sizes:
+        rows, seconds = measure(size, args.seed)
+        print(f"{size:>6}  {rows:>8}  {seconds:>9.3f}  {seconds / max(rows, 1) * 1e6:>9.2f}")
+        if rows and seconds >= MIN_TIME:
+            measured.append((rows, seconds))
+
+    measured.sort()
+    if len(measured) < 2:
+        print("\nPas assez de mesures pour vérifier le passage à l'échelle")
+        return
+    (small_rows, small_time), (large_rows, large_time) = measured[0], measured[-1]
+    growth = (large_time / large_rows) / (small_time / small_rows)
+    if growth > SCALING:
+        print(f"\nRÉGRESSION: temps par éligibilité x{growth:.1f} (max x{SCALING:.0f})")
+        sys.exit(1)
+    print(f"\nLinéaire: temps par éligibilité x{growth:.1f} (max x{SCALING:.0f})")
+
+
+if __name__ == "__main__":
+    main()
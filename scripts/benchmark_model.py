@@ -0,0 +1,252 @@
+"""
+Scaling benchmark for the CP-SAT model, on synthetic weeks or weeks
+recorded with `assign_secretaries.py --record` (no database).
+
+Usage:
+    python scripts/benchmark_model.py
+    python scripts/benchmark_model.py --sizes 30,60,120,240 --time-limit 20
+    python scripts/benchmark_model.py --site-model pairwise compact
+    python scripts/benchmark_model.py --save bench.json
+    python scripts/benchmark_model.py --baseline bench.json
+    python scripts/benchmark_model.py --snapshot weeks/*.snap --baseline bench.json
+"""
+
+import sys
+import os
+import argparse
+import json
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Add project root to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ortools.sat.python import cp_model
+
+from lib.model import SITE_MODELS, build_model, model_stats, solve_model
+from lib.snapshot import load_instance
+from lib.synthetic import generate_week
+
+COLUMNS = [
+    # key, header, decimals (None: left-aligned text)
+    ("instance", "Instance", None),
+    ("size", "Secr.", 0),
+    ("site_model", "O3", None),
+    ("eligibility", "Éligib.", 0),
+    ("build_time", "Constr.(s)", 2),
+    ("variables", "Variables", 0),
+    ("constraints", "Contraintes", 0),
+    ("first_feasible", "1re sol.(s)", 2),
+    ("status", "Status", None),
+    ("objective", "Objectif", 0),
+    ("wall_time", "Rés.(s)", 2),
+    ("peak_rss_mb", "RSS max(Mo)", 0),
+]
+
+# Metrics compared against --baseline, with the relative change that counts
+# as a regression (time and memory are noisy, sizes and objective are not)
+REGRESSION_THRESHOLDS = {
+    "build_time": 0.25,
+    "variables": 0.0,
+    "constraints": 0.0,
+    "peak_rss_mb": 0.25,
+}
+
+
+class _FirstSolution(cp_model.CpSolverSolutionCallback):
+    """Records when the first feasible solution was found."""
+
+    def __init__(self):
+        super().__init__()
+        self.first = None
+
+    def on_solution_callback(self):
+        if self.first is None:
+            self.first = self.wall_time
+
+
+def run_case(source, site_model, time_limit, num_workers, seed):
+    """Generate (`source` is a number of secretaries) or load (`source` is a
+    snapshot path), build and solve one week. Runs in its own process so the
+    peak RSS (OR-Tools allocates outside the Python heap) belongs to it alone."""
+    if isinstance(source, int):
+        instance = generate_week(source, seed=seed)
+        name = f"synthetic-{source}"
+    else:
+        instance = load_instance(source)
+        name = os.path.basename(source)
+    data = instance["data"]
+
+    start = time.perf_counter()
+    model, x, y, meta = build_model(
+        data, instance["availability"], instance["admin_blocks"], site_model=site_model,
+    )
+    build_time = time.perf_counter() - start
+
+    monitor = _FirstSolution()
+    result = solve_model(
+        model, x, y, data, meta,
+        time_limit=time_limit,
+        num_workers=num_workers,
+        callback=monitor,
+    )
+
+    return {
+        "instance": name,
+        "size": len(data["secretaries"]),
+        "site_model": site_model,
+        "eligibility": len(data["eligibility"]),
+        "build_time": build_time,
+        **model_stats(model),
+        "first_feasible": monitor.first,
+        "status": result["status"],
+        "objective": result["objective"],
+        "wall_time": result["wall_time"],
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def print_table(rows):
+    widths = {
+        key: max([len(header)] + [len(_cell(row[key], decimals)) for row in rows])
+        for key, header, decimals in COLUMNS
+    }
+    print("  ".join(_align(header, widths[key], decimals) for key, header, decimals in COLUMNS))
+    for row in rows:
+        print("  ".join(
+            _align(_cell(row[key], decimals), widths[key], decimals)
+            for key, _header, decimals in COLUMNS
+        ))
+
+
+def _cell(value, decimals):
+    if value is None:
+        return "-"
+    if decimals is None:
+        return str(value)
+    return f"{value:.{decimals}f}"
+
+
+def _align(text, width, decimals):
+    return text.ljust(width) if decimals is None else text.rjust(width)
+
+
+def compare(rows, baseline):
+    """Print metrics that got worse than the baseline run. Returns the count."""
+    # Baselines saved before snapshots were supported have no "instance"
+    previous = {
+        (r.get("instance", f"synthetic-{r['size']}"), r["site_model"]): r for r in baseline
+    }
+    regressions = 0
+    for row in rows:
+        before = previous.get((row["instance"], row["site_model"]))
+        if before is None:
+            continue
+        for key, threshold in REGRESSION_THRESHOLDS.items():
+            if not before.get(key):
+                continue
+            change = (row[key] - before[key]) / before[key]
+            if change > threshold:
+                regressions += 1
+                print(
+                    f"  RÉGRESSION {row['instance']} ({row['site_model']}): "
+                    f"{key} {before[key]:.2f} -> {row[key]:.2f} ({change:+.0%})"
+                )
+        if before["objective"] is not None and row["objective"] is not None \
+                and row["status"] == before["status"] == "OPTIMAL" \
+                and row["objective"] != before["objective"]:
+            regressions += 1
+            print(
+                f"  OBJECTIF CHANGÉ {row['instance']} ({row['site_model']}): "
+                f"{before['objective']:.0f} -> {row['objective']:.0f}"
+            )
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Model scaling benchmark on synthetic and recorded weeks")
+    parser.add_argument(
+        "--sizes",
+        default="30,60,120,240",
+        help="Comma-separated numbers of secretaries of the synthetic weeks, "
+             "empty for none (default: 30,60,120,240)",
+    )
+    parser.add_argument(
+        "--snapshot",
+        nargs="+",
+        default=[],
+        metavar="PATH",
+        help="Also benchmark weeks recorded with assign_secretaries.py --record",
+    )
+    parser.add_argument(
+        "--site-model",
+        nargs="+",
+        choices=SITE_MODELS,
+        default=["pairwise"],
+        help="Site-continuity encoding(s) to benchmark (default: pairwise)",
+    )
+    parser.add_argument(
+        "--time-limit",
+        type=int,
+        default=10,
+        help="Solver time limit in seconds per case (default: 10)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="CP-SAT workers per case (default: 4)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Random seed of the synthetic weeks (default: 0)",
+    )
+    parser.add_argument(
+        "--save",
+        help="Write the results to this JSON file",
+    )
+    parser.add_argument(
+        "--baseline",
+        help="Compare against results previously written with --save; "
+             "exit with status 1 on regression",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    rows = []
+    for source in sizes + args.snapshot:
+        for site_model in args.site_model:
+            label = f"{source} secrétaires" if isinstance(source, int) else source
+            print(f"Benchmark: {label}, O3 {site_model}...", file=sys.stderr)
+            # A fresh process per case keeps peak memory measurements separate
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                rows.append(pool.submit(
+                    run_case, source, site_model, args.time_limit, args.workers, args.seed,
+                ).result())
+
+    print()
+    print_table(rows)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(rows, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nComparaison avec {args.baseline}:")
+        if compare(rows, baseline):
+            sys.exit(1)
+        print("  Aucune régression")
+
+
+if __name__ == "__main__":
+    main()
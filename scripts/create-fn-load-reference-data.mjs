@@ -0,0 +1,99 @@
+import "dotenv/config";
+import pg from "pg";
+
+const client = new pg.Client({ connectionString: process.env.DATABASE_URL });
+
+// Reference tables used by scripts/assign_secretaries.py, with a version
+// (md5 of the entry's rows) per entry. Entries whose version matches the one
+// passed in p_versions (the solver's local cache) are left out of "tables",
+// so an unchanged entry costs a 32-character hash instead of its rows.
+//
+// Returns {"versions": {name: md5}, "tables": {name: rows}}.
+const sql = `
+CREATE OR REPLACE FUNCTION fn_load_reference_data(
+  p_versions jsonb DEFAULT '{}'::jsonb
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+STABLE
+AS $fn$
+DECLARE
+  v_entries  jsonb;
+  v_versions jsonb := '{}'::jsonb;
+  v_tables   jsonb := '{}'::jsonb;
+  v_name     text;
+  v_rows     jsonb;
+  v_version  text;
+BEGIN
+  -- Every aggregate is ordered so an unchanged entry always hashes the same
+  v_entries := jsonb_build_object(
+    'departments', COALESCE((
+      SELECT jsonb_agg(to_jsonb(t) ORDER BY t.id_department)
+      FROM (
+        SELECT d.id_department, d.name, d.id_site, si.name AS site_name
+        FROM departments d JOIN sites si ON d.id_site = si.id_site
+      ) t
+    ), '[]'::jsonb),
+    'sites', COALESCE((
+      SELECT jsonb_agg(to_jsonb(s) ORDER BY s.id_site) FROM sites s
+    ), '[]'::jsonb),
+    'roles', COALESCE((
+      SELECT jsonb_agg(to_jsonb(r) ORDER BY r.id_role) FROM secretary_roles r
+    ), '[]'::jsonb),
+    'preferences', COALESCE((
+      SELECT jsonb_agg(to_jsonb(t) ORDER BY t.id_staff, t.target_type, t.id_site,
+                                            t.id_department, t.id_target_staff)
+      FROM (
+        SELECT sp.id_staff, sp.target_type, sp.id_site, sp.id_department,
+               sp.id_target_staff, sp.preference
+        FROM staff_preferences sp
+        JOIN staff s ON sp.id_staff = s.id_staff
+        WHERE s.id_primary_position = 2 AND s.is_active = true
+      ) t
+    ), '[]'::jsonb),
+    'admin_dept_id', to_jsonb((
+      SELECT id_department FROM departments WHERE name = 'Administration'
+      ORDER BY id_department LIMIT 1
+    )),
+    'all_secretaries', COALESCE((
+      SELECT jsonb_agg(to_jsonb(t) ORDER BY t.lastname, t.id_staff)
+      FROM (
+        SELECT s.id_staff, s.lastname, s.firstname
+        FROM staff s
+        WHERE s.id_primary_position = 2 AND s.is_active = true
+      ) t
+    ), '[]'::jsonb),
+    'skills', COALESCE((
+      SELECT jsonb_agg(to_jsonb(t) ORDER BY t.id_staff, t.id_skill)
+      FROM (
+        SELECT ss.id_staff, ss.id_skill
+        FROM staff_skills ss
+        JOIN staff s ON ss.id_staff = s.id_staff
+        WHERE s.id_primary_position = 2 AND s.is_active = true
+      ) t
+    ), '[]'::jsonb)
+  );
+
+  FOR v_name, v_rows IN SELECT key, value FROM jsonb_each(v_entries) LOOP
+    v_version := md5(v_rows::text);
+    v_versions := v_versions || jsonb_build_object(v_name, v_version);
+    IF p_versions ->> v_name IS DISTINCT FROM v_version THEN
+      v_tables := v_tables || jsonb_build_object(v_name, v_rows);
+    END IF;
+  END LOOP;
+
+  RETURN jsonb_build_object('versions', v_versions, 'tables', v_tables);
+END;
+$fn$;
+`;
+
+try {
+  await client.connect();
+  await client.query(sql);
+  console.log("✓ fn_load_reference_data created successfully");
+} catch (err) {
+  console.error("✗ Error:", err.message);
+  process.exit(1);
+} finally {
+  await client.end();
+}
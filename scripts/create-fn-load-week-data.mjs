@@ -0,0 +1,160 @@
+import "dotenv/config";
+import pg from "pg";
+
+const client = new pg.Client({ connectionString: process.env.DATABASE_URL });
+
+// Returns everything scripts/assign_secretaries.py needs for one week as a
+// single jsonb document, so the solver loads a week in one round trip.
+// Keys match the former per-query loader in scripts/lib/db.py.
+// The solver passes p_include_eligibility = false and streams the
+// eligibility rows from v_secretary_eligibility itself, with the same
+// columns and order (lib/db.py _ELIGIBILITY_SQL): they are most of the
+// week and a single jsonb document of them is held whole in memory.
+// With p_exclude_solver the gaps only count MANUAL secretary assignments:
+// the solver replaces the SCHEDULE (pre-materialized ADMIN) and ALGORITHM
+// (previous run) rows, counted per need by fn_solver_assignment_counts and
+// added back to the views' gap (needed - assigned).
+// Requires fn_load_reference_data (scripts/create-fn-load-reference-data.mjs).
+const sql = `
+DROP FUNCTION IF EXISTS fn_load_week_data(date, date, boolean);
+DROP FUNCTION IF EXISTS fn_load_week_data(date, date, boolean, boolean);
+
+CREATE OR REPLACE FUNCTION fn_solver_assignment_counts(
+  p_week_start date,
+  p_week_end   date
+)
+RETURNS TABLE (id_block int, id_skill int, id_role int, solver_rows int)
+LANGUAGE sql
+STABLE
+AS $fn$
+SELECT a.id_block, a.id_skill, a.id_role, count(*)::int
+FROM assignments a
+JOIN work_blocks wb ON a.id_block = wb.id_block
+WHERE a.assignment_type = 'SECRETARY'
+  AND a.source IN ('SCHEDULE', 'ALGORITHM')
+  AND a.status NOT IN ('CANCELLED', 'INVALIDATED')
+  AND wb.date BETWEEN p_week_start AND p_week_end
+GROUP BY a.id_block, a.id_skill, a.id_role
+$fn$;
+
+CREATE OR REPLACE FUNCTION fn_load_week_data(
+  p_week_start          date,
+  p_week_end            date,
+  p_include_reference   boolean DEFAULT true,
+  p_include_eligibility boolean DEFAULT true,
+  p_exclude_solver      boolean DEFAULT false
+)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $fn$
+SELECT jsonb_build_object(
+  -- 1. Secretary availability
+  'availability', COALESCE((
+    SELECT jsonb_agg(to_jsonb(t) ORDER BY t.id_staff, t.date, t.period)
+    FROM (
+      SELECT id_staff, lastname, firstname, date, period,
+             is_flexible, flexibility_pct::float AS flexibility_pct, full_day_only,
+             admin_target::int AS admin_target
+      FROM v_secretary_availability
+      WHERE date BETWEEN p_week_start AND p_week_end
+    ) t
+  ), '[]'::jsonb),
+
+  -- 2. Eligibility with pre-computed scores
+  'eligibility', CASE WHEN p_include_eligibility THEN COALESCE((
+    SELECT jsonb_agg(to_jsonb(t) ORDER BY t.id_staff, t.date, t.period)
+    FROM (
+      SELECT e.id_staff, e.lastname, e.firstname,
+             e.is_flexible, e.flexibility_pct::float AS flexibility_pct, e.full_day_only,
+             e.admin_target::int AS admin_target,
+             e.id_block, e.date, e.period, e.block_type,
+             e.department, e.site, e.skill_name, e.role_name,
+             e.id_skill, e.id_role,
+             (e.gap + CASE WHEN p_exclude_solver THEN COALESCE(s.solver_rows, 0) ELSE 0 END)::int AS gap,
+             e.id_department, e.id_site,
+             e.skill_preference, e.skill_score::int AS skill_score, e.base_score::int AS base_score,
+             e.eviter_site_score::int AS eviter_site_score,
+             e.eviter_dept_score::int AS eviter_dept_score,
+             e.eviter_staff_score::int AS eviter_staff_score,
+             e.prefere_site_score::int AS prefere_site_score,
+             e.prefere_dept_score::int AS prefere_dept_score,
+             e.prefere_staff_score::int AS prefere_staff_score,
+             e.need_type
+      FROM v_secretary_eligibility e
+      LEFT JOIN fn_solver_assignment_counts(p_week_start, p_week_end) s
+        ON s.id_block = e.id_block AND s.id_role = e.id_role
+       AND s.id_skill IS NOT DISTINCT FROM e.id_skill
+      WHERE e.date BETWEEN p_week_start AND p_week_end
+    ) t
+  ), '[]'::jsonb) ELSE '[]'::jsonb END,
+
+  -- 3. Staffing needs (gap > 0)
+  'needs', COALESCE((
+    SELECT jsonb_agg(to_jsonb(t))
+    FROM (
+      SELECT sn.id_block, sn.date, sn.period, sn.block_type,
+             sn.department, sn.site, sn.skill_name, sn.role_name,
+             sn.id_skill, sn.id_role, sn.needed::int AS needed,
+             (sn.assigned - x.solver_rows)::int AS assigned,
+             (sn.gap + x.solver_rows)::int AS gap,
+             wb.id_department, d.id_site
+      FROM v_staffing_needs sn
+      JOIN work_blocks wb ON sn.id_block = wb.id_block
+      JOIN departments d ON wb.id_department = d.id_department
+      LEFT JOIN fn_solver_assignment_counts(p_week_start, p_week_end) s
+        ON s.id_block = sn.id_block AND s.id_role = sn.id_role
+       AND s.id_skill IS NOT DISTINCT FROM sn.id_skill
+      CROSS JOIN LATERAL (
+        SELECT CASE WHEN p_exclude_solver THEN COALESCE(s.solver_rows, 0) ELSE 0 END AS solver_rows
+      ) x
+      WHERE sn.date BETWEEN p_week_start AND p_week_end AND sn.gap + x.solver_rows > 0
+    ) t
+  ), '[]'::jsonb),
+
+  -- 4. Existing MANUAL secretary assignments (preserved by solver)
+  'existing_assignments', COALESCE((
+    SELECT jsonb_agg(to_jsonb(t))
+    FROM (
+      SELECT a.id_block, a.id_staff, a.id_role, wb.date, wb.period
+      FROM assignments a
+      JOIN work_blocks wb ON a.id_block = wb.id_block
+      WHERE a.assignment_type = 'SECRETARY'
+        AND a.source = 'MANUAL'
+        AND a.status NOT IN ('CANCELLED', 'INVALIDATED')
+        AND wb.date BETWEEN p_week_start AND p_week_end
+    ) t
+  ), '[]'::jsonb),
+
+  -- 5. Doctor-activity mapping per block (for surgery id_linked_doctor)
+  'doctor_activities', COALESCE((
+    SELECT jsonb_agg(to_jsonb(t))
+    FROM (
+      SELECT a.id_assignment, a.id_block, a.id_staff, a.id_activity, ar.id_skill
+      FROM assignments a
+      JOIN activity_requirements ar ON ar.id_activity = a.id_activity
+      JOIN work_blocks wb ON a.id_block = wb.id_block
+      WHERE a.assignment_type = 'DOCTOR'
+        AND a.status NOT IN ('CANCELLED', 'INVALIDATED')
+        AND a.id_activity IS NOT NULL
+        AND wb.date BETWEEN p_week_start AND p_week_end
+    ) t
+  ), '[]'::jsonb)
+)
+|| CASE WHEN p_include_reference
+   -- 6. Reference data
+   THEN fn_load_reference_data() -> 'tables'
+   ELSE '{}'::jsonb END;
+$fn$;
+`;
+
+try {
+  await client.connect();
+  await client.query(sql);
+  console.log("✓ fn_load_week_data created successfully");
+} catch (err) {
+  console.error("✗ Error:", err.message);
+  process.exit(1);
+} finally {
+  await client.end();
+}
@@ -0,0 +1,91 @@
+import "dotenv/config";
+import pg from "pg";
+
+const client = new pg.Client({ connectionString: process.env.DATABASE_URL });
+
+// Notifies the solver watcher (assign_secretaries.py --watch) on channel
+// "solver_replan" when an input of the secretary plan changes: absences
+// (staff_leaves), needs (DOCTOR assignments) and MANUAL secretary
+// assignments. The payload is the affected range of half-days:
+//   {"table": "...", "start": "YYYY-MM-DD", "end": "YYYY-MM-DD", "period": "AM"|"PM"|"FULL_DAY"|null}
+// Identical payloads are sent once per transaction, so a bulk change
+// notifies once per half-day. The solver's own rows (source ALGORITHM)
+// never notify.
+const sql = `
+CREATE OR REPLACE FUNCTION fn_notify_replan_leave()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $fn$
+BEGIN
+  IF TG_OP <> 'INSERT' THEN
+    PERFORM pg_notify('solver_replan', json_build_object(
+      'table', TG_TABLE_NAME,
+      'start', OLD.start_date,
+      'end', OLD.end_date,
+      'period', OLD.period
+    )::text);
+  END IF;
+  IF TG_OP <> 'DELETE' THEN
+    PERFORM pg_notify('solver_replan', json_build_object(
+      'table', TG_TABLE_NAME,
+      'start', NEW.start_date,
+      'end', NEW.end_date,
+      'period', NEW.period
+    )::text);
+  END IF;
+  RETURN NULL;
+END;
+$fn$;
+
+CREATE OR REPLACE FUNCTION fn_notify_replan_assignment()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $fn$
+DECLARE
+  v_payload text;
+BEGIN
+  IF TG_OP <> 'INSERT'
+     AND (OLD.assignment_type = 'DOCTOR' OR OLD.source = 'MANUAL') THEN
+    SELECT json_build_object(
+      'table', TG_TABLE_NAME, 'start', wb.date, 'end', wb.date, 'period', wb.period
+    )::text INTO v_payload
+    FROM work_blocks wb WHERE wb.id_block = OLD.id_block;
+    IF v_payload IS NOT NULL THEN
+      PERFORM pg_notify('solver_replan', v_payload);
+    END IF;
+  END IF;
+  IF TG_OP <> 'DELETE'
+     AND (NEW.assignment_type = 'DOCTOR' OR NEW.source = 'MANUAL') THEN
+    SELECT json_build_object(
+      'table', TG_TABLE_NAME, 'start', wb.date, 'end', wb.date, 'period', wb.period
+    )::text INTO v_payload
+    FROM work_blocks wb WHERE wb.id_block = NEW.id_block;
+    IF v_payload IS NOT NULL THEN
+      PERFORM pg_notify('solver_replan', v_payload);
+    END IF;
+  END IF;
+  RETURN NULL;
+END;
+$fn$;
+
+DROP TRIGGER IF EXISTS trg_notify_replan ON staff_leaves;
+CREATE TRIGGER trg_notify_replan
+  AFTER INSERT OR UPDATE OR DELETE ON staff_leaves
+  FOR EACH ROW EXECUTE FUNCTION fn_notify_replan_leave();
+
+DROP TRIGGER IF EXISTS trg_notify_replan ON assignments;
+CREATE TRIGGER trg_notify_replan
+  AFTER INSERT OR UPDATE OR DELETE ON assignments
+  FOR EACH ROW EXECUTE FUNCTION fn_notify_replan_assignment();
+`;
+
+try {
+  await client.connect();
+  await client.query(sql);
+  console.log("✓ fn_notify_replan_leave, fn_notify_replan_assignment and triggers created successfully");
+} catch (err) {
+  console.error("✗ Error:", err.message);
+  process.exit(1);
+} finally {
+  await client.end();
+}
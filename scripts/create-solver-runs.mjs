@@ -0,0 +1,55 @@
+import "dotenv/config";
+import pg from "pg";
+
+const client = new pg.Client({ connectionString: process.env.DATABASE_URL });
+
+// Run-scoped staging area of the Python solver (scripts/lib/db.py):
+// each run's solution is first written to solver_run_assignments under a
+// STAGED solver_runs row, then published into assignments by one short
+// transaction. A published run keeps the week's full plan, so the
+// previous run (SUPERSEDED) can be published again to roll back without
+// re-solving. status: STAGED -> PUBLISHED -> SUPERSEDED | ROLLED_BACK.
+const sql = `
+CREATE TABLE IF NOT EXISTS solver_runs (
+  id_run        bigserial PRIMARY KEY,
+  week_start    date NOT NULL,
+  status        text NOT NULL DEFAULT 'STAGED'
+                CHECK (status IN ('STAGED', 'PUBLISHED', 'SUPERSEDED', 'ROLLED_BACK')),
+  slots         jsonb,
+  solver_status text,
+  objective     double precision,
+  -- lib.cache.instance_fingerprint of the solved week, when known
+  fingerprint   text,
+  created_at    timestamptz NOT NULL DEFAULT now(),
+  published_at  timestamptz
+);
+
+ALTER TABLE solver_runs ADD COLUMN IF NOT EXISTS fingerprint text;
+
+CREATE INDEX IF NOT EXISTS idx_solver_runs_week ON solver_runs (week_start, id_run);
+
+-- At most one published run per week
+CREATE UNIQUE INDEX IF NOT EXISTS idx_solver_runs_published
+  ON solver_runs (week_start) WHERE status = 'PUBLISHED';
+
+CREATE TABLE IF NOT EXISTS solver_run_assignments (
+  id_run           bigint NOT NULL REFERENCES solver_runs (id_run) ON DELETE CASCADE,
+  id_block         int NOT NULL,
+  id_staff         int NOT NULL,
+  id_role          int NOT NULL,
+  id_skill         int,
+  id_linked_doctor int,
+  PRIMARY KEY (id_run, id_block, id_staff)
+);
+`;
+
+try {
+  await client.connect();
+  await client.query(sql);
+  console.log("✓ solver_runs and solver_run_assignments created successfully");
+} catch (err) {
+  console.error("✗ Error:", err.message);
+  process.exit(1);
+} finally {
+  await client.end();
+}
@@ -0,0 +1,164 @@
+"""Local on-disk caches for the secretary assignment solver."""
+
+import hashlib
+import json
+import os
+import pickle
+import time
+
+from lib import model as _model
+from lib.db import load_reference_data
+from lib.eligibility import EligibilityTable, rows_digest
+from lib.records import Record
+
+# Default location, overridable with SOLVER_CACHE_DIR
+CACHE_DIR = os.environ.get(
+    "SOLVER_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache"),
+)
+
+
+def _read_pickle(path, default):
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return default
+
+
+def _write_pickle(path, value):
+    """Write atomically so a crashed or concurrent run never leaves a torn file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+class ReferenceCache:
+    """Reference tables (departments, sites, roles, preferences, admin
+    department, active secretaries, skills) cached on disk by version.
+
+    fn_load_reference_data hashes every entry server-side and only sends the
+    rows of entries whose hash differs from versions(), so a run re-fetches
+    just the tables that changed since the cache was written.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.path = os.path.join(cache_dir or CACHE_DIR, "reference.pickle")
+        self.entries = _read_pickle(self.path, {})  # name -> {"version", "rows"}
+
+    def versions(self):
+        return {name: entry["version"] for name, entry in self.entries.items()}
+
+    def merge(self, reference):
+        """Apply a fn_load_reference_data document and return the tables."""
+        changed = []
+        for name, rows in reference["tables"].items():
+            self.entries[name] = {"version": reference["versions"][name], "rows": rows}
+            changed.append(name)
+        # Entries the server no longer knows about
+        for name in set(self.entries) - set(reference["versions"]):
+            del self.entries[name]
+            changed.append(name)
+
+        if changed:
+            print(f"  Cache référence: {', '.join(sorted(changed))} rechargé(s)")
+            _write_pickle(self.path, self.entries)
+        return {name: entry["rows"] for name, entry in self.entries.items()}
+
+    def refresh(self, conn):
+        """Probe the server and return up-to-date reference tables."""
+        return self.merge(load_reference_data(conn, self.versions()))
+
+
+# Model source files: any change to them may change the solution (or, for
+# records.py, the shape of the stored one)
+_MODEL_SOURCES = ("model.py", "decompose.py", "records.py")
+
+# Solve options that do not change the problem (output, CPU split, job control)
+_NEUTRAL_OPTIONS = ("verbose", "compare_sites", "num_workers", "cancel")
+
+
+def _canonical_json(value):
+    """JSON text of `value` that does not depend on row order: sets and
+    lists are sorted, dates and decimals become strings.
+
+    Each item is serialized once and lists are sorted by that text, so the
+    cost stays proportional to the size of `value` (times a log).
+    """
+    if isinstance(value, Record):
+        value = value.as_dict()
+    if isinstance(value, dict):
+        items = sorted((str(k), _canonical_json(v)) for k, v in value.items())
+        return "{" + ",".join(f"{json.dumps(k)}:{v}" for k, v in items) + "}"
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return "[" + ",".join(sorted(_canonical_json(v) for v in value)) + "]"
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return json.dumps(value)
+    return json.dumps(str(value))
+
+
+def _eligibility_digest(data):
+    eligibility = data["eligibility"]
+    if isinstance(eligibility, EligibilityTable):
+        return eligibility.digest()
+    return rows_digest(eligibility)
+
+
+def instance_fingerprint(instance, solve_options):
+    """sha256 of what determines a week's solution: the loaded data,
+    availability and admin blocks, the model's weight constants and source,
+    and the solve options.
+
+    Hints are left out: they only guide the search.
+    """
+    weights = {
+        name: value for name, value in vars(_model).items()
+        if name.isupper() and isinstance(value, (int, float))
+    }
+    sources = hashlib.sha256()
+    for name in _MODEL_SOURCES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), "rb") as f:
+            sources.update(f.read())
+    document = {
+        # Eligibility, by far the largest input, is hashed on its own
+        "data": {**instance["data"], "eligibility": _eligibility_digest(instance["data"])},
+        "availability": instance["availability"],
+        "admin_blocks": instance["admin_blocks"],
+        "weights": weights,
+        "model_source": sources.hexdigest(),
+        "options": {k: v for k, v in solve_options.items() if k not in _NEUTRAL_OPTIONS},
+    }
+    return hashlib.sha256(_canonical_json(document).encode()).hexdigest()
+
+
+class ResultCache:
+    """Last solver result of each week, keyed by instance_fingerprint.
+
+    A week whose inputs did not change since its last run gets that run's
+    result back instead of being solved again. Only solutions are stored.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.dir = os.path.join(cache_dir or CACHE_DIR, "results")
+
+    def _path(self, week_start):
+        return os.path.join(self.dir, f"{week_start.isoformat()}.pickle")
+
+    def get(self, week_start, fingerprint):
+        """The stored result of the week if it was computed from `fingerprint`."""
+        entry = _read_pickle(self._path(week_start), None)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+        return entry["result"]
+
+    def put(self, week_start, fingerprint, result):
+        if result["status"] not in ("OPTIMAL", "FEASIBLE"):
+            return
+        stored = {k: v for k, v in result.items() if k not in ("metrics", "document", "written")}
+        _write_pickle(self._path(week_start), {
+            "fingerprint": fingerprint,
+            "stored_at": time.time(),
+            "result": stored,
+        })
@@ -1,187 +1,202 @@
 """Database loading for secretary assignment algorithm."""
 
+import contextlib
+import io
 import os
 import psycopg2
 import psycopg2.extras
 from datetime import date, timedelta
 
+from lib.eligibility import EligibilityTable
+from lib.metrics import query
+from lib.records import Secretary
+
 
 def get_connection():
+    # DATABASE_SSLMODE=disable for a local Postgres without TLS
     return psycopg2.connect(
         os.environ["DATABASE_URL"],
-        sslmode="require",
+        sslmode=os.environ.get("DATABASE_SSLMODE", "require"),
         cursor_factory=psycopg2.extras.RealDictCursor,
     )
 
 
-def load_week_data(conn, week_start: date):
-    """Load all data needed for one week of assignment, using SQL views."""
-    week_end = week_start + timedelta(days=6)
+# First key of the per-week advisory locks (the second is the Monday's
+# ordinal), so they do not collide with other users of advisory locks
+_WEEK_LOCK_CLASS = 0x5EC7
 
-    cur = conn.cursor()
-    data = {}
-
-    # 1. Secretary availability (from v_secretary_availability)
-    cur.execute(
-        """SELECT id_staff, lastname, firstname, date, period,
-                  is_flexible, flexibility_pct::float, full_day_only,
-                  admin_target::int
-           FROM v_secretary_availability
-           WHERE date BETWEEN %s AND %s
-           ORDER BY id_staff, date, period""",
-        (week_start, week_end),
-    )
-    data["availability"] = cur.fetchall()
-
-    # 2. Eligibility with pre-computed scores (from v_secretary_eligibility)
-    cur.execute(
-        """SELECT id_staff, lastname, firstname,
-                  is_flexible, flexibility_pct::float, full_day_only, admin_target::int,
-                  id_block, date, period, block_type,
-                  department, site, skill_name, role_name,
-                  id_skill, id_role, gap,
-                  id_department, id_site,
-                  skill_preference, skill_score::int, base_score::int,
-                  eviter_site_score::int, eviter_dept_score::int, eviter_staff_score::int,
-                  prefere_site_score::int, prefere_dept_score::int, prefere_staff_score::int,
-                  need_type
-           FROM v_secretary_eligibility
-           WHERE date BETWEEN %s AND %s
-           ORDER BY id_staff, date, period""",
-        (week_start, week_end),
-    )
-    data["eligibility"] = cur.fetchall()
-
-    # 3. Distinct secretaries (from availability)
-    cur.execute(
-        """SELECT DISTINCT id_staff, lastname, firstname,
-                  is_flexible, flexibility_pct::float, full_day_only,
-                  admin_target::int
-           FROM v_secretary_availability
-           WHERE date BETWEEN %s AND %s
-           ORDER BY lastname""",
-        (week_start, week_end),
-    )
-    data["secretaries"] = cur.fetchall()
-
-    # 4. Staffing needs (for the report)
-    cur.execute(
-        """SELECT sn.id_block, sn.date, sn.period, sn.block_type,
-                  sn.department, sn.site, sn.skill_name, sn.role_name,
-                  sn.id_skill, sn.id_role,
-                  sn.needed::int, sn.assigned::int, sn.gap::int,
-                  wb.id_department, d.id_site
-           FROM v_staffing_needs sn
-           JOIN work_blocks wb ON sn.id_block = wb.id_block
-           JOIN departments d ON wb.id_department = d.id_department
-           WHERE sn.date BETWEEN %s AND %s AND sn.gap > 0""",
-        (week_start, week_end),
-    )
-    data["needs"] = cur.fetchall()
-
-    # 5. Existing MANUAL secretary assignments (preserved by solver)
-    cur.execute(
-        """SELECT a.id_block, a.id_staff, a.id_role, wb.date, wb.period
-           FROM assignments a
-           JOIN work_blocks wb ON a.id_block = wb.id_block
-           WHERE a.assignment_type = 'SECRETARY'
-             AND a.source = 'MANUAL'
-             AND a.status NOT IN ('CANCELLED', 'INVALIDATED')
-             AND wb.date BETWEEN %s AND %s""",
-        (week_start, week_end),
-    )
-    data["existing_assignments"] = cur.fetchall()
 
-    # 6. Reference data (for report)
-    cur.execute(
-        """SELECT d.id_department, d.name, d.id_site, si.name AS site_name
-           FROM departments d JOIN sites si ON d.id_site = si.id_site"""
-    )
-    data["departments"] = cur.fetchall()
+class WeekLocked(ValueError):
+    """Another session is solving the week (see week_lock)."""
 
-    cur.execute("SELECT * FROM sites ORDER BY id_site")
-    data["sites"] = cur.fetchall()
 
-    cur.execute("SELECT * FROM secretary_roles ORDER BY id_role")
-    data["roles"] = cur.fetchall()
+@contextlib.contextmanager
+def week_lock(conn, week_start: date):
+    """Hold the week's advisory lock for the duration of a run, so two runs
+    (CLI, daemon, watcher) never rewrite the same week's rows at once.
 
-    # 7. Staff preferences (for report EVITER display)
-    cur.execute(
-        """SELECT sp.id_staff, sp.target_type, sp.id_site, sp.id_department,
-                  sp.id_target_staff, sp.preference
-           FROM staff_preferences sp
-           JOIN staff s ON sp.id_staff = s.id_staff
-           WHERE s.id_primary_position = 2 AND s.is_active = true"""
-    )
-    data["preferences"] = cur.fetchall()
-
-    # 8. Doctor-activity mapping per block (for surgery id_linked_doctor)
-    cur.execute(
-        """SELECT a.id_assignment, a.id_block, a.id_staff, a.id_activity,
-                  ar.id_skill
-           FROM assignments a
-           JOIN activity_requirements ar ON ar.id_activity = a.id_activity
-           JOIN work_blocks wb ON a.id_block = wb.id_block
-           WHERE a.assignment_type = 'DOCTOR'
-             AND a.status NOT IN ('CANCELLED', 'INVALIDATED')
-             AND a.id_activity IS NOT NULL
-             AND wb.date BETWEEN %s AND %s""",
-        (week_start, week_end),
-    )
-    data["doctor_activities"] = cur.fetchall()
+    The lock belongs to the session, not to a transaction: it survives the
+    run's commits and rollbacks. Raises WeekLocked without waiting when
+    another session holds it.
+    """
+    key = (_WEEK_LOCK_CLASS, week_start.toordinal())
+    cur = conn.cursor()
+    with query("week_lock"):
+        cur.execute("SELECT pg_try_advisory_lock(%s, %s) AS locked", key)
+        locked = cur.fetchone()["locked"]
+        conn.rollback()
+    if not locked:
+        raise WeekLocked(f"La semaine {week_start} est déjà en cours de résolution par une autre session")
+    try:
+        yield
+    finally:
+        # A dropped connection has released the lock with its session
+        if not conn.closed:
+            conn.rollback()
+            cur = conn.cursor()
+            cur.execute("SELECT pg_advisory_unlock(%s, %s)", key)
+            conn.rollback()
+
+
+# Columns of fn_load_week_data's "eligibility" rows, in
+# lib.eligibility.FIELDS order, with p_exclude_solver's gap: the previous
+# SCHEDULE/ALGORITHM rows are added back (the solver replaces them)
+_ELIGIBILITY_SQL = """SELECT e.id_staff, e.lastname, e.firstname,
+       e.is_flexible, e.flexibility_pct::float AS flexibility_pct, e.full_day_only,
+       e.admin_target::int AS admin_target,
+       e.id_block, e.date, e.period, e.block_type,
+       e.department, e.site, e.skill_name, e.role_name,
+       e.id_skill, e.id_role, (e.gap + COALESCE(s.solver_rows, 0))::int AS gap,
+       e.id_department, e.id_site,
+       e.skill_preference, e.skill_score::int AS skill_score, e.base_score::int AS base_score,
+       e.eviter_site_score::int AS eviter_site_score,
+       e.eviter_dept_score::int AS eviter_dept_score,
+       e.eviter_staff_score::int AS eviter_staff_score,
+       e.prefere_site_score::int AS prefere_site_score,
+       e.prefere_dept_score::int AS prefere_dept_score,
+       e.prefere_staff_score::int AS prefere_staff_score,
+       e.need_type
+  FROM v_secretary_eligibility e
+  LEFT JOIN fn_solver_assignment_counts(%(week_start)s, %(week_end)s) s
+    ON s.id_block = e.id_block AND s.id_role = e.id_role
+   AND s.id_skill IS NOT DISTINCT FROM e.id_skill
+ WHERE e.date BETWEEN %(week_start)s AND %(week_end)s
+ ORDER BY e.id_staff, e.date, e.period"""
+
+# Eligibility rows fetched per round trip of the server-side cursor
+ELIGIBILITY_FETCH = 5000
+
+
+def _stream_eligibility(conn, week_start: date, week_end: date):
+    """The week's eligibility rows as an EligibilityTable, read through a
+    server-side cursor: only ELIGIBILITY_FETCH plain tuples are in memory
+    at a time besides the table itself. Runs in the caller's transaction."""
+    cur = conn.cursor("eligibility", cursor_factory=psycopg2.extensions.cursor)
+    cur.itersize = ELIGIBILITY_FETCH
+    try:
+        cur.execute(_ELIGIBILITY_SQL, {"week_start": week_start, "week_end": week_end})
+        table = EligibilityTable()
+        for values in cur:
+            table.append(values)
+    finally:
+        cur.close()
+    return table
+
+
+def load_week_data(conn, week_start: date, reference=None, reference_cache=None):
+    """Load all data needed for one week of assignment.
+
+    fn_load_week_data (scripts/create-fn-load-week-data.mjs) returns the week
+    as a single jsonb document built from the SQL views, except eligibility:
+    its rows are streamed from v_secretary_eligibility into a columnar
+    lib.eligibility.EligibilityTable (see _stream_eligibility). Reference
+    tables are taken from `reference` when given, refreshed through
+    `reference_cache` in the same query when given (see
+    lib.cache.ReferenceCache), and included in the document otherwise.
+    """
+    week_end = week_start + timedelta(days=6)
 
-    # 9. Admin department ID
-    cur.execute(
-        "SELECT id_department FROM departments WHERE name = 'Administration' LIMIT 1"
-    )
-    row = cur.fetchone()
-    data["admin_dept_id"] = row["id_department"] if row else None
-
-    # 10. All active secretaries (including those without availability this week)
-    cur.execute(
-        """SELECT s.id_staff, s.lastname, s.firstname
-           FROM staff s
-           WHERE s.id_primary_position = 2 AND s.is_active = true
-           ORDER BY s.lastname"""
-    )
-    data["all_secretaries"] = cur.fetchall()
-
-    # 11. Staff skills (for report - who has no skills)
-    cur.execute(
-        """SELECT ss.id_staff, ss.id_skill
-           FROM staff_skills ss
-           JOIN staff s ON ss.id_staff = s.id_staff
-           WHERE s.id_primary_position = 2 AND s.is_active = true"""
-    )
-    data["skills"] = cur.fetchall()
+    cur = conn.cursor()
+
+    # Gaps only count MANUAL assignments: the previous SCHEDULE/ALGORITHM
+    # rows are the plan being replaced (p_exclude_solver)
+    with query("fn_load_week_data"):
+        if reference is None and reference_cache is not None:
+            cur.execute(
+                "SELECT fn_load_week_data(%s, %s, false, false, true) AS payload,"
+                " fn_load_reference_data(%s) AS reference",
+                (week_start, week_end, psycopg2.extras.Json(reference_cache.versions())),
+            )
+        else:
+            cur.execute(
+                "SELECT fn_load_week_data(%s, %s, %s, false, true) AS payload, NULL AS reference",
+                (week_start, week_end, reference is None),
+            )
+        row = cur.fetchone()
+    with query("stream_eligibility"):
+        eligibility = _stream_eligibility(conn, week_start, week_end)
+    conn.rollback()
+
+    data = row["payload"]
+    data["eligibility"] = eligibility
+    if row["reference"] is not None:
+        reference = reference_cache.merge(row["reference"])
+    if reference is not None:
+        data.update(reference)
+
+    # Distinct secretaries, derived from availability rows
+    secretaries = {}
+    for row in data["availability"]:
+        if row["id_staff"] not in secretaries:
+            secretaries[row["id_staff"]] = Secretary.from_row(row)
+    data["secretaries"] = sorted(secretaries.values(), key=lambda s: s.lastname)
 
     return data
 
 
+def load_reference_data(conn, versions=None):
+    """Load week-independent reference tables (departments, sites, roles,
+    preferences, admin department, active secretaries, skills).
+
+    fn_load_reference_data (scripts/create-fn-load-reference-data.mjs)
+    returns {"versions": {name: md5}, "tables": {name: rows}} where "tables"
+    omits the entries whose version is already in `versions`. See
+    lib.cache.ReferenceCache.
+    """
+    cur = conn.cursor()
+    with query("fn_load_reference_data"):
+        cur.execute(
+            "SELECT fn_load_reference_data(%s) AS reference",
+            (psycopg2.extras.Json(versions or {}),),
+        )
+        return cur.fetchone()["reference"]
+
+
 def create_admin_blocks(conn, week_start: date, admin_dept_id: int):
     """Create 1 ADMIN work_block per date+period for the week."""
     week_end = week_start + timedelta(days=6)
     cur = conn.cursor()
 
-    cur.execute(
-        """INSERT INTO work_blocks (id_department, date, period, block_type, id_calendar)
-           SELECT %s, c.date, p.period::varchar, 'ADMIN', c.id_calendar
-           FROM calendar c
-           CROSS JOIN (VALUES ('AM'), ('PM')) AS p(period)
-           WHERE c.date BETWEEN %s AND %s
-             AND c.day_of_week NOT IN ('SUN')
-             AND NOT c.is_holiday
-             AND NOT EXISTS (
-               SELECT 1 FROM work_blocks wb
-               WHERE wb.block_type = 'ADMIN'
-                 AND wb.date = c.date
-                 AND wb.period = p.period::varchar
-             )
-           RETURNING id_block, date, period""",
-        (admin_dept_id, week_start, week_end),
-    )
-    created = cur.fetchall()
-    conn.commit()
+    with query("create_admin_blocks"):
+        cur.execute(
+            """INSERT INTO work_blocks (id_department, date, period, block_type, id_calendar)
+               SELECT %s, c.date, p.period::varchar, 'ADMIN', c.id_calendar
+               FROM calendar c
+               CROSS JOIN (VALUES ('AM'), ('PM')) AS p(period)
+               WHERE c.date BETWEEN %s AND %s
+                 AND c.day_of_week NOT IN ('SUN')
+                 AND NOT c.is_holiday
+                 AND NOT EXISTS (
+                   SELECT 1 FROM work_blocks wb
+                   WHERE wb.block_type = 'ADMIN'
+                     AND wb.date = c.date
+                     AND wb.period = p.period::varchar
+                 )
+               RETURNING id_block, date, period""",
+            (admin_dept_id, week_start, week_end),
+        )
+        created = cur.fetchall()
+        conn.commit()
     return created
 
 
@@ -189,61 +204,372 @@ def load_admin_blocks(conn, week_start: date):
     """Load existing ADMIN blocks for the week."""
     week_end = week_start + timedelta(days=6)
     cur = conn.cursor()
-    cur.execute(
-        """SELECT wb.id_block, wb.date, wb.period, wb.id_department
-           FROM work_blocks wb
-           WHERE wb.block_type = 'ADMIN'
-             AND wb.date BETWEEN %s AND %s""",
-        (week_start, week_end),
-    )
-    return cur.fetchall()
+    with query("load_admin_blocks"):
+        cur.execute(
+            """SELECT wb.id_block, wb.date, wb.period, wb.id_department
+               FROM work_blocks wb
+               WHERE wb.block_type = 'ADMIN'
+                 AND wb.date BETWEEN %s AND %s""",
+            (week_start, week_end),
+        )
+        return cur.fetchall()
 
 
-def clear_secretary_assignments(conn, week_start: date):
-    """Delete all non-MANUAL secretary assignments for the week.
+def load_previous_assignments(conn, week_start: date):
+    """Load the ALGORITHM secretary assignments currently stored for the week.
 
-    Removes SCHEDULE (pre-materialized ADMIN) and ALGORITHM (previous solver)
-    so the solver can recreate everything from scratch. MANUAL are preserved.
+    Used as CP-SAT solution hints for warm-started re-solves.
     """
     week_end = week_start + timedelta(days=6)
     cur = conn.cursor()
-    cur.execute(
-        """DELETE FROM assignments
-           WHERE assignment_type = 'SECRETARY'
-             AND source IN ('SCHEDULE', 'ALGORITHM')
-             AND id_block IN (
-               SELECT id_block FROM work_blocks WHERE date BETWEEN %s AND %s
-             )""",
-        (week_start, week_end),
-    )
-    deleted = cur.rowcount
-    conn.commit()
-    return deleted
+    with query("load_previous_assignments"):
+        cur.execute(
+            """SELECT a.id_block, a.id_staff, a.id_role, a.id_skill,
+                      wb.date, wb.period, wb.id_department
+               FROM assignments a
+               JOIN work_blocks wb ON a.id_block = wb.id_block
+               WHERE a.assignment_type = 'SECRETARY'
+                 AND a.source = 'ALGORITHM'
+                 AND a.status NOT IN ('CANCELLED', 'INVALIDATED')
+                 AND wb.date BETWEEN %s AND %s""",
+            (week_start, week_end),
+        )
+        return cur.fetchall()
+
+
+def load_planned_weeks(conn, first: date, last: date):
+    """Mondays of the weeks between `first` and `last` that have ALGORITHM
+    secretary assignments, i.e. a plan to keep current."""
+    cur = conn.cursor()
+    with query("load_planned_weeks"):
+        cur.execute(
+            """SELECT DISTINCT date_trunc('week', wb.date)::date AS week_start
+               FROM assignments a
+               JOIN work_blocks wb ON a.id_block = wb.id_block
+               WHERE a.assignment_type = 'SECRETARY'
+                 AND a.source = 'ALGORITHM'
+                 AND a.status NOT IN ('CANCELLED', 'INVALIDATED')
+                 AND wb.date BETWEEN %s AND %s""",
+            (first, last),
+        )
+        return {row["week_start"] for row in cur.fetchall()}
+
+
+# Rows per COPY statement when staging a solution, to bound the client
+# buffer on very large batches
+COPY_CHUNK = 10000
+
+# Half-days of the write: every one of the week unless %(all_slots)s
+_IN_SLOTS = """(%(all_slots)s OR (wb.date, wb.period) IN (
+         SELECT d, p FROM unnest(%(dates)s::date[], %(periods)s::text[]) AS slot(d, p)
+       ))"""
+
+# Applies a staged solution ({staged}: a query of id_block, id_staff,
+# id_role, id_skill, id_linked_doctor rows) to the week's stored
+# SCHEDULE/ALGORITHM rows in one statement: rows missing from the solution
+# are deleted, rows that differ are updated, new rows inserted. publish_run
+# applies a run's rows with it (see _publish).
+_MERGE_ASSIGNMENTS_SQL = """WITH staged AS (
+     SELECT n.*
+     FROM ({staged}) n
+     JOIN work_blocks wb ON n.id_block = wb.id_block
+     WHERE """ + _IN_SLOTS + """
+   ),
+   stored AS (
+     SELECT a.id_assignment, a.id_block, a.id_staff, a.id_role, a.id_skill,
+            a.id_linked_doctor, a.source, a.status
+     FROM assignments a
+     JOIN work_blocks wb ON a.id_block = wb.id_block
+     WHERE a.assignment_type = 'SECRETARY'
+       AND a.source IN ('SCHEDULE', 'ALGORITHM')
+       AND wb.date BETWEEN %(week_start)s AND %(week_end)s
+       AND """ + _IN_SLOTS + """
+     FOR UPDATE OF a
+   ),
+   deleted AS (
+     DELETE FROM assignments a
+     USING stored s
+     WHERE a.id_assignment = s.id_assignment
+       AND NOT EXISTS (
+         SELECT 1 FROM staged n
+         WHERE n.id_block = s.id_block AND n.id_staff = s.id_staff
+       )
+     RETURNING 1
+   ),
+   updated AS (
+     UPDATE assignments a SET
+       id_role = n.id_role, id_skill = n.id_skill,
+       id_linked_doctor = n.id_linked_doctor,
+       source = 'ALGORITHM', status = 'PROPOSED', updated_at = now()
+     FROM stored s
+     JOIN staged n ON n.id_block = s.id_block AND n.id_staff = s.id_staff
+     WHERE a.id_assignment = s.id_assignment
+       AND (s.id_role, s.id_skill, s.id_linked_doctor, s.source::text, s.status::text)
+           IS DISTINCT FROM (n.id_role, n.id_skill, n.id_linked_doctor, 'ALGORITHM', 'PROPOSED')
+     RETURNING 1
+   ),
+   inserted AS (
+     INSERT INTO assignments (id_block, id_staff, assignment_type, id_role, id_skill,
+                              id_linked_doctor, source, status)
+     SELECT n.id_block, n.id_staff, 'SECRETARY', n.id_role, n.id_skill,
+            n.id_linked_doctor, 'ALGORITHM', 'PROPOSED'
+     FROM staged n
+     WHERE NOT EXISTS (
+       SELECT 1 FROM stored s WHERE s.id_block = n.id_block AND s.id_staff = n.id_staff
+     )
+     ON CONFLICT (id_block, id_staff) DO UPDATE SET
+       id_role = EXCLUDED.id_role, id_skill = EXCLUDED.id_skill,
+       id_linked_doctor = EXCLUDED.id_linked_doctor,
+       source = EXCLUDED.source, status = EXCLUDED.status
+     RETURNING 1
+   )
+   SELECT (SELECT count(*) FROM inserted) AS inserted,
+          (SELECT count(*) FROM updated) AS updated,
+          (SELECT count(*) FROM deleted) AS deleted,
+          (SELECT count(*) FROM staged) AS staged"""
+
+# Solution rows of a solver run
+_RUN_ROWS_SQL = """SELECT id_block, id_staff, id_role, id_skill, id_linked_doctor
+     FROM solver_run_assignments WHERE id_run = %(id_run)s"""
+
+_STAGED_COLUMNS = ("id_block", "id_staff", "id_role", "id_skill", "id_linked_doctor")
+
+
+def _copy_rows(cur, table, columns, rows):
+    """COPY `rows` (tuples of ints or None) into `table`, COPY_CHUNK rows
+    per statement."""
+    for start in range(0, len(rows), COPY_CHUNK):
+        buffer = io.StringIO()
+        for row in rows[start:start + COPY_CHUNK]:
+            buffer.write("\t".join(r"\N" if v is None else str(v) for v in row))
+            buffer.write("\n")
+        buffer.seek(0)
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def _solution_rows(assignments):
+    """{(id_block, id_staff): (id_role, id_skill, id_linked_doctor)} of a
+    solution."""
+    wanted = {}
+    for a in assignments:
+        # chk_secretary requires id_role NOT NULL for SECRETARY type; default to 1 (Standard)
+        role_id = a.id_role if a.id_role is not None else 1
+        wanted[(a.id_block, a.id_staff)] = (role_id, a.id_skill, a.id_linked_doctor)
+    return wanted
+
 
+def _slot_params(week_start: date, slots):
+    ordered = sorted(slots or ())
+    return {
+        "week_start": week_start,
+        "week_end": week_start + timedelta(days=6),
+        "all_slots": slots is None,
+        "dates": [d for d, _period in ordered],
+        "periods": [period for _d, period in ordered],
+    }
 
-def write_assignments(conn, assignments):
-    """Batch insert secretary assignments."""
-    if not assignments:
-        return 0
 
+def _merge(cur, week_start: date, staged, slots=None, params=None):
+    """Run _MERGE_ASSIGNMENTS_SQL with the rows of the `staged` query
+    (using `params`) as the solution, within `slots` when given.
+
+    Returns {"inserted", "updated", "deleted", "unchanged"} counts.
+    """
+    with query("merge_assignments"):
+        cur.execute(
+            _MERGE_ASSIGNMENTS_SQL.format(staged=staged),
+            {**(params or {}), **_slot_params(week_start, slots)},
+        )
+        counts = dict(cur.fetchone())
+    counts["unchanged"] = counts.pop("staged") - counts["inserted"] - counts["updated"]
+    return counts
+
+
+# Runs kept per week besides the published one, for rollback_week
+RUN_HISTORY = 5
+
+
+def stage_run(conn, week_start: date, assignments, slots=None, solver_status=None,
+              objective=None, fingerprint=None):
+    """Save a solution as a STAGED solver run (see
+    scripts/create-solver-runs.mjs) without touching the week's plan.
+
+    The whole solution is staged; `slots` (a set of (date, period)) limits
+    what publish_run writes. `fingerprint` is the result cache's fingerprint
+    of the solved week (see load_published_run). Commits; returns the run id.
+    """
+    wanted = _solution_rows(assignments)
     cur = conn.cursor()
-    values = []
-    params = []
-    for i, a in enumerate(assignments):
-        values.append("(%s, %s, 'SECRETARY', %s, %s, %s, 'ALGORITHM', 'PROPOSED')")
-        # chk_secretary requires id_role NOT NULL for SECRETARY type; default to 1 (Standard)
-        role_id = a["id_role"] if a["id_role"] is not None else 1
-        params.extend([a["id_block"], a["id_staff"], role_id, a.get("id_skill"), a.get("id_linked_doctor")])
-
-    sql = (
-        "INSERT INTO assignments (id_block, id_staff, assignment_type, id_role, id_skill, id_linked_doctor, source, status) "
-        "VALUES " + ", ".join(values) + " "
-        "ON CONFLICT (id_block, id_staff) DO UPDATE SET "
-        "id_role = EXCLUDED.id_role, id_skill = EXCLUDED.id_skill, "
-        "id_linked_doctor = EXCLUDED.id_linked_doctor, "
-        "source = EXCLUDED.source, status = EXCLUDED.status"
+    with query("stage_run"):
+        cur.execute(
+            """INSERT INTO solver_runs (week_start, slots, solver_status, objective, fingerprint)
+               VALUES (%s, %s, %s, %s, %s) RETURNING id_run""",
+            (
+                week_start,
+                psycopg2.extras.Json(sorted([d.isoformat(), p] for d, p in slots))
+                if slots is not None else None,
+                solver_status,
+                objective,
+                fingerprint,
+            ),
+        )
+        run_id = cur.fetchone()["id_run"]
+        _copy_rows(
+            cur, "solver_run_assignments", ("id_run",) + _STAGED_COLUMNS,
+            [(run_id,) + key + values for key, values in wanted.items()],
+        )
+        conn.commit()
+    return run_id
+
+
+def _publish(cur, run, slots):
+    """Merge `run` into its week (only `slots` when given) and make it the
+    week's PUBLISHED run. Returns the merge counts."""
+    week_start = run["week_start"]
+    params = {"id_run": run["id_run"], **_slot_params(week_start, slots)}
+    counts = _merge(cur, week_start, _RUN_ROWS_SQL, slots=slots, params=params)
+    if slots is not None:
+        # Outside its half-days the week kept its plan: record that one
+        # instead, so that publishing this run again restores the whole week
+        with query("complete_run"):
+            cur.execute(
+                """DELETE FROM solver_run_assignments r
+                   USING work_blocks wb
+                   WHERE r.id_run = %(id_run)s
+                     AND wb.id_block = r.id_block
+                     AND NOT """ + _IN_SLOTS,
+                params,
+            )
+            cur.execute(
+                """INSERT INTO solver_run_assignments
+                     (id_run, id_block, id_staff, id_role, id_skill, id_linked_doctor)
+                   SELECT %(id_run)s, a.id_block, a.id_staff, a.id_role, a.id_skill,
+                          a.id_linked_doctor
+                   FROM assignments a
+                   JOIN work_blocks wb ON a.id_block = wb.id_block
+                   WHERE a.assignment_type = 'SECRETARY'
+                     AND a.source IN ('SCHEDULE', 'ALGORITHM')
+                     AND a.status NOT IN ('CANCELLED', 'INVALIDATED')
+                     AND wb.date BETWEEN %(week_start)s AND %(week_end)s
+                     AND NOT """ + _IN_SLOTS,
+                params,
+            )
+    with query("swap_runs"):
+        cur.execute(
+            """UPDATE solver_runs SET status = 'SUPERSEDED'
+               WHERE week_start = %s AND status = 'PUBLISHED'""",
+            (week_start,),
+        )
+        cur.execute(
+            """UPDATE solver_runs SET status = 'PUBLISHED', published_at = now()
+               WHERE id_run = %s""",
+            (run["id_run"],),
+        )
+    return counts
+
+
+def publish_run(conn, run_id, replaces=None):
+    """Publish a STAGED run: swap the week's proposed assignments for the
+    run's in one short transaction, so readers see either the previous
+    plan or the new one, never a partial write. The week's previous
+    PUBLISHED run becomes SUPERSEDED (see rollback_week) and runs beyond
+    RUN_HISTORY are deleted.
+
+    `replaces` is an earlier run of the same solve (an incumbent, see
+    lib.progress.IncumbentWriter): it is deleted instead of becoming
+    SUPERSEDED, so rolling back skips a solve's intermediate solutions.
+
+    Returns {"inserted", "updated", "deleted", "unchanged", "run"} counts.
+    """
+    cur = conn.cursor()
+    with query("lock_run"):
+        cur.execute(
+            "SELECT id_run, week_start, slots, status FROM solver_runs WHERE id_run = %s FOR UPDATE",
+            (run_id,),
+        )
+        run = cur.fetchone()
+    if run is None or run["status"] != "STAGED":
+        conn.rollback()
+        raise ValueError(f"Run {run_id} introuvable ou déjà publié")
+    slots = None
+    if run["slots"] is not None:
+        slots = {(date.fromisoformat(d), p) for d, p in run["slots"]}
+
+    counts = _publish(cur, run, slots)
+    if replaces is not None and replaces != run_id:
+        with query("drop_replaced_run"):
+            cur.execute(
+                "DELETE FROM solver_runs WHERE id_run = %s AND week_start = %s",
+                (replaces, run["week_start"]),
+            )
+    with query("prune_runs"):
+        cur.execute(
+            """DELETE FROM solver_runs
+               WHERE week_start = %(week_start)s AND status <> 'PUBLISHED'
+                 AND id_run NOT IN (
+                   SELECT id_run FROM solver_runs
+                   WHERE week_start = %(week_start)s AND status <> 'PUBLISHED'
+                   ORDER BY id_run DESC LIMIT %(keep)s
+                 )""",
+            {"week_start": run["week_start"], "keep": RUN_HISTORY},
+        )
+    with query("commit_assignments"):
+        conn.commit()
+    counts["run"] = run_id
+    return counts
+
+
+def load_published_run(conn, week_start: date):
+    """The week's PUBLISHED run as {"id_run", "objective", "fingerprint"},
+    None without one."""
+    cur = conn.cursor()
+    with query("load_published_run"):
+        cur.execute(
+            """SELECT id_run, objective, fingerprint FROM solver_runs
+               WHERE week_start = %s AND status = 'PUBLISHED'""",
+            (week_start,),
+        )
+        row = cur.fetchone()
+    conn.rollback()
+    return row
+
+
+def rollback_week(conn, week_start: date):
+    """Publish the week's previous run again (the latest SUPERSEDED one
+    before the published one), without re-solving. The published run
+    becomes ROLLED_BACK.
+
+    Returns the merge counts with the restored "run"; raises ValueError
+    when the week has no previous run.
+    """
+    cur = conn.cursor()
+    with query("lock_runs"):
+        cur.execute(
+            """SELECT id_run, week_start, status FROM solver_runs
+               WHERE week_start = %s AND status IN ('PUBLISHED', 'SUPERSEDED')
+               ORDER BY id_run DESC
+               FOR UPDATE""",
+            (week_start,),
+        )
+        runs = cur.fetchall()
+    current = next((r for r in runs if r["status"] == "PUBLISHED"), None)
+    previous = next(
+        (r for r in runs if r["status"] == "SUPERSEDED"
+         and (current is None or r["id_run"] < current["id_run"])),
+        None,
     )
-    cur.execute(sql, params)
-    inserted = cur.rowcount
-    conn.commit()
-    return inserted
+    if previous is None:
+        conn.rollback()
+        raise ValueError(f"Aucun run précédent à restaurer pour la semaine {week_start}")
+
+    # A published run holds the whole week: restore all of it
+    counts = _publish(cur, previous, None)
+    if current is not None:
+        cur.execute(
+            "UPDATE solver_runs SET status = 'ROLLED_BACK' WHERE id_run = %s",
+            (current["id_run"],),
+        )
+    with query("commit_assignments"):
+        conn.commit()
+    counts["run"] = previous["id_run"]
+    return counts
@@ -0,0 +1,278 @@
+"""Split a week into independent sub-problems and solve them concurrently.
+
+Hard constraints C1 and C3–C7 and every objective term only involve one
+secretary's variables, once the O4/O9 balance targets are constants. Two
+secretaries are therefore only coupled by a need whose C2 capacity can bind,
+i.e. a need with more eligible secretaries than its gap. The connected
+components of that staff–need graph are independent models whose optima add
+up to the optimum of the full week.
+
+Admin needs are left out of that graph: every secretary available on a
+half-day is eligible for its admin block, so they would link almost the
+whole week into one component. They are linking constraints instead, whose
+capacity is split between the models (admin_shares). When an admin block
+has more eligible secretaries than its capacity, the split is a
+restriction of the week: a merged plan is a plan of the week, but no longer
+proven optimal, and a model may find none where the week has one. The full
+model is then solved instead.
+"""
+
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.eligibility import EligibilityTable
+from lib.model import build_model, solve_model, add_solution_hints, unfilled_needs
+
+# Components with fewer x variables than this are solved together in one
+# model: independent anyway, and it saves one CP-SAT setup per tiny component.
+MIN_COMPONENT_VARS = 200
+
+# O4/O9 targets in a component: "global" keeps the full week's averages
+# (exact decomposition), "component" recomputes them per component (relaxed).
+BALANCE_MODES = ("global", "component")
+
+
+def find_components(x, y, meta):
+    """Group secretaries into components coupled by medical needs only
+    (admin needs are split with admin_shares).
+
+    Returns a list of staff id sets, largest first.
+    """
+    parent = {}
+
+    def find(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    def union(a, b):
+        parent[find(a)] = find(b)
+
+    for sid, _ni in x:
+        parent.setdefault(sid, sid)
+    for sid, _d in y:
+        parent.setdefault(sid, sid)
+
+    for need in meta["all_needs"]:
+        if need.kind == "ADMIN":
+            continue  # Linking constraint, see admin_shares
+        eligible = [
+            sid for sid in meta["eligible_by_need"].get(need.index, [])
+            if (sid, need.index) in x
+        ]
+        if len(eligible) <= need.gap:
+            continue  # C2 cannot bind: no coupling
+        for sid in eligible[1:]:
+            union(sid, eligible[0])
+
+    components = defaultdict(set)
+    for sid in parent:
+        components[find(sid)].add(sid)
+    return sorted(components.values(), key=len, reverse=True)
+
+
+def admin_shares(groups, x, meta, secretaries):
+    """Split the capacity of each admin need between the groups.
+
+    Where an admin need's eligible secretaries fit in its gap (or all belong
+    to one group), every group keeps the full gap. Otherwise each group
+    first gets its secretaries forced onto the block by C6 (not flexible,
+    no other need on that half-day), then a share of the rest of the gap in
+    proportion to its other eligible secretaries (largest remainders round
+    up).
+
+    Returns ([{id_block: gap} per group], exact), `exact` False when some
+    capacity had to be split.
+    """
+    group_of = {sid: g for g, staff_ids in enumerate(groups) for sid in staff_ids}
+    flexible = {s.id_staff for s in secretaries if s.is_flexible}
+    options = defaultdict(int)  # (sid, date, period) -> needs
+    for sid, ni in x:
+        need = meta["all_needs"][ni]
+        options[(sid, need.date, need.period)] += 1
+
+    shares = [{} for _ in groups]
+    exact = True
+    for need in meta["all_needs"]:
+        if need.kind != "ADMIN":
+            continue
+        counts = defaultdict(int)
+        forced = defaultdict(int)
+        for sid in meta["eligible_by_need"].get(need.index, []):
+            if (sid, need.index) not in x:
+                continue
+            counts[group_of[sid]] += 1
+            if sid not in flexible and options[(sid, need.date, need.period)] == 1:
+                forced[group_of[sid]] += 1
+        if len(counts) < 2 or sum(counts.values()) <= need.gap:
+            continue
+        exact = False
+        split = _split(
+            max(need.gap - sum(forced.values()), 0),
+            {g: count - forced[g] for g, count in counts.items()},
+        )
+        for g in counts:
+            shares[g][need.id_block] = forced[g] + split[g]
+    return shares, exact
+
+
+def _split(total, weights):
+    """`total` split in proportion to `weights`, largest remainders first."""
+    weight = sum(weights.values())
+    if not weight:
+        return {key: 0 for key in weights}
+    quotas = {key: total * w / weight for key, w in weights.items()}
+    split = {key: int(quota) for key, quota in quotas.items()}
+    rest = total - sum(split.values())
+    for key in sorted(quotas, key=lambda k: quotas[k] - split[k], reverse=True)[:rest]:
+        split[key] += 1
+    return split
+
+
+def _group_components(components, vars_by_staff):
+    """Merge small components so each group is worth its own CP-SAT model."""
+    groups = []
+    small = set()
+    for comp in components:
+        if sum(vars_by_staff[sid] for sid in comp) >= MIN_COMPONENT_VARS:
+            groups.append(comp)
+        else:
+            small |= comp
+    if small:
+        groups.append(small)
+    return groups
+
+
+def _restrict(data, availability_map, staff_ids):
+    """Week data and availability limited to the given secretaries."""
+    sub = dict(data)
+    sub["secretaries"] = [s for s in data["secretaries"] if s.id_staff in staff_ids]
+    sub["eligibility"] = EligibilityTable.of(data["eligibility"]).for_staff(staff_ids)
+    sub["availability"] = [a for a in data["availability"] if a["id_staff"] in staff_ids]
+    sub["existing_assignments"] = [
+        ea for ea in data["existing_assignments"] if ea["id_staff"] in staff_ids
+    ]
+    # Needs without eligible secretary are reported from the full model
+    sub["needs"] = []
+    sub_availability = {
+        sid: days for sid, days in availability_map.items() if sid in staff_ids
+    }
+    return sub, sub_availability
+
+
+def _merge_status(statuses):
+    for status in ("MODEL_INVALID", "INFEASIBLE", "UNKNOWN"):
+        if status in statuses:
+            return status
+    return "OPTIMAL" if all(s == "OPTIMAL" for s in statuses) else "FEASIBLE"
+
+
+def solve_decomposed(data, availability_map, admin_blocks, model, x, y, meta,
+                     time_limit=30, num_workers=None, site_model="pairwise",
+                     balance="global", hints=None, verbose=False, cancel=None):
+    """Solve each independent component of a built week model concurrently.
+
+    `model`, `x`, `y` and `meta` come from build_model on the full week; x,
+    y and meta define the components, the O4/O9 averages (balance="global")
+    and the unfilled needs report. `cancel` (lib.progress.Cancellation)
+    stops every component solve. Returns a result dict shaped like
+    solve_model's; with split admin capacities it is at best FEASIBLE,
+    without a bound, and `model` is solved instead (with the same time
+    limit) when a component finds no solution.
+    """
+    vars_by_staff = defaultdict(int)
+    for sid, _ni in x:
+        vars_by_staff[sid] += 1
+
+    components = find_components(x, y, meta)
+    groups = _group_components(components, vars_by_staff)
+    shares, exact = admin_shares(groups, x, meta, data["secretaries"])
+    print(
+        f"  Décomposition: {len(components)} composantes indépendantes, "
+        f"{len(groups)} modèles (plus grand: {len(components[0]) if components else 0} secrétaires)"
+    )
+    if not exact:
+        print("  Capacité admin répartie entre les modèles: solution non prouvée optimale")
+
+    averages = meta["averages"] if balance == "global" else None
+    cpus = num_workers or os.cpu_count() or 1
+    threads = max(1, min(len(groups), cpus))
+    workers_per_model = max(1, cpus // threads)
+
+    def solve_group(staff_ids, share):
+        sub_data, sub_availability = _restrict(data, availability_map, staff_ids)
+        sub_admin_blocks = [
+            {**ab, "gap": share[ab["id_block"]]} if ab["id_block"] in share else ab
+            for ab in admin_blocks
+        ]
+        model, sub_x, sub_y, sub_meta = build_model(
+            sub_data, sub_availability, sub_admin_blocks,
+            site_model=site_model,
+            averages=averages,
+        )
+        if hints:
+            add_solution_hints(model, sub_x, sub_y, sub_meta, hints)
+        return solve_model(
+            model, sub_x, sub_y, sub_data, sub_meta,
+            time_limit=time_limit,
+            num_workers=workers_per_model,
+            verbose=verbose,
+            cancel=cancel,
+        )
+
+    # CP-SAT releases the GIL while solving, so threads run the solves in parallel
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(solve_group, groups, shares))
+
+    statuses = [r["status"] for r in results]
+    if not exact and ("INFEASIBLE" in statuses or "UNKNOWN" in statuses):
+        print("  Pas de solution avec la capacité admin répartie: résolution du modèle complet")
+        if hints:
+            add_solution_hints(model, x, y, meta, hints)
+        result = solve_model(
+            model, x, y, data, meta,
+            time_limit=time_limit,
+            num_workers=cpus,
+            verbose=verbose,
+            cancel=cancel,
+        )
+        result["components"] = len(components)
+        return result
+
+    result = {
+        "status": _merge_status([r["status"] for r in results]),
+        "objective": None,
+        "best_bound": None,
+        "wall_time": max((r["wall_time"] for r in results), default=0.0),
+        "assignments": [],
+        "admin_assignments": [],
+        "unfilled": [],
+        "flexible_days": {},
+        "stopped_by": None,
+        "components": len(components),
+    }
+    if result["status"] not in ("OPTIMAL", "FEASIBLE"):
+        return result
+
+    result["objective"] = sum(r["objective"] for r in results)
+    if exact:
+        result["best_bound"] = sum(r["best_bound"] for r in results)
+    elif result["status"] == "OPTIMAL":
+        result["status"] = "FEASIBLE"
+    for r in results:
+        result["assignments"].extend(r["assignments"])
+        result["admin_assignments"].extend(r["admin_assignments"])
+        result["flexible_days"].update(r["flexible_days"])
+
+    need_index = {
+        (n.id_block, n.id_skill, n.id_role): n.index
+        for n in meta["all_needs"]
+    }
+    filled_by_need = defaultdict(int)
+    for a in result["assignments"]:
+        filled_by_need[need_index[(a.id_block, a.id_skill, a.id_role)]] += 1
+    result["unfilled"] = unfilled_needs(meta, filled_by_need)
+
+    return result
@@ -0,0 +1,179 @@
+"""Columnar storage of a week's eligibility rows.
+
+Eligibility is by far the largest input of a week: one row per (secretary,
+need) pair, with about 30 columns that mostly repeat the same names,
+dates and flags. EligibilityTable keeps each column in one array instead
+of a dict per row: integer ids and scores in array("q"), every other
+column as array("i") indexes into a table of its distinct values (names,
+dates, periods, flags), so a repeated string is stored once.
+
+lib.db streams the rows in from a server-side cursor; build_model reads
+the columns it needs with columns(). Lists of row dicts (synthetic weeks,
+snapshots recorded before this format) are converted with of().
+"""
+
+import hashlib
+from array import array
+from datetime import date
+
+# Columns of v_secretary_eligibility rows, in lib.db._ELIGIBILITY_SQL order
+FIELDS = (
+    "id_staff", "lastname", "firstname",
+    "is_flexible", "flexibility_pct", "full_day_only", "admin_target",
+    "id_block", "date", "period", "block_type",
+    "department", "site", "skill_name", "role_name",
+    "id_skill", "id_role", "gap", "id_department", "id_site",
+    "skill_preference", "skill_score", "base_score",
+    "eviter_site_score", "eviter_dept_score", "eviter_staff_score",
+    "prefere_site_score", "prefere_dept_score", "prefere_staff_score",
+    "need_type",
+)
+
+# Integer columns; every other column is interned
+INTEGER_FIELDS = frozenset((
+    "id_staff", "admin_target", "id_block", "id_skill", "id_role", "gap",
+    "id_department", "id_site", "skill_score", "base_score",
+    "eviter_site_score", "eviter_dept_score", "eviter_staff_score",
+    "prefere_site_score", "prefere_dept_score", "prefere_staff_score",
+))
+
+# NULL in an integer column
+_NULL = -(2 ** 63)
+
+
+class EligibilityTable:
+    """Eligibility rows stored by column (see the module docstring)."""
+
+    def __init__(self, fields=FIELDS):
+        self.fields = tuple(fields)
+        self._columns = [
+            array("q") if field in INTEGER_FIELDS else array("i") for field in self.fields
+        ]
+        # Interned columns: distinct values, and value -> position
+        self._values = {f: [] for f in self.fields if f not in INTEGER_FIELDS}
+        self._positions = {f: {} for f in self._values}
+        self._nullable = set()
+
+    @classmethod
+    def from_rows(cls, rows, fields=None):
+        """Table of a list of row dicts (all with the same keys)."""
+        if fields is None:
+            fields = tuple(rows[0]) if rows else FIELDS
+        table = cls(fields)
+        for row in rows:
+            table.append([row[field] for field in table.fields])
+        return table
+
+    @classmethod
+    def of(cls, eligibility):
+        """`eligibility` as a table: tables are returned as they are."""
+        return eligibility if isinstance(eligibility, cls) else cls.from_rows(eligibility)
+
+    def append(self, values):
+        """Add one row, given as its values in `fields` order."""
+        for field, column, value in zip(self.fields, self._columns, values):
+            if field in INTEGER_FIELDS:
+                if value is None:
+                    self._nullable.add(field)
+                    value = _NULL
+                column.append(value)
+                continue
+            positions = self._positions[field]
+            position = positions.get(value)
+            if position is None:
+                position = positions[value] = len(self._values[field])
+                # Dates arrive as ISO strings from JSON: parse each one once
+                if field == "date" and isinstance(value, str):
+                    value = date.fromisoformat(value)
+                self._values[field].append(value)
+            column.append(position)
+
+    def __len__(self):
+        return len(self._columns[0]) if self._columns else 0
+
+    def column(self, field):
+        """Iterator over the values of one column (empty for a column an
+        empty table does not have)."""
+        if field not in self.fields and not len(self):
+            return iter(())
+        column = self._columns[self.fields.index(field)]
+        if field in INTEGER_FIELDS:
+            if field in self._nullable:
+                return (None if value == _NULL else value for value in column)
+            return iter(column)
+        return map(self._values[field].__getitem__, column)
+
+    def columns(self, *fields):
+        """Iterator over the rows as tuples of the given columns."""
+        return zip(*(self.column(field) for field in fields))
+
+    def row(self, i):
+        """Row `i` as a dict."""
+        row = {}
+        for field, column in zip(self.fields, self._columns):
+            value = column[i]
+            if field in INTEGER_FIELDS:
+                row[field] = None if value == _NULL else value
+            else:
+                row[field] = self._values[field][value]
+        return row
+
+    def to_rows(self):
+        """Every row as a dict (for code that needs them all at once)."""
+        return [self.row(i) for i in range(len(self))]
+
+    def digest(self):
+        """sha256 of the rows that does not depend on their order (see
+        rows_digest)."""
+        fields = sorted(self.fields)
+        columns = []
+        for field in fields:
+            if field == "date":
+                # ISO strings, as in JSON rows
+                iso = [d.isoformat() for d in self._values[field]]
+                columns.append(map(iso.__getitem__, self._columns[self.fields.index(field)]))
+            else:
+                columns.append(self.column(field))
+        return _digest(fields, zip(*columns))
+
+    def take(self, indexes):
+        """New table with the rows at `indexes` (sharing the value tables)."""
+        table = EligibilityTable(self.fields)
+        table._columns = [array(column.typecode, map(column.__getitem__, indexes))
+                          for column in self._columns]
+        table._values = self._values
+        table._positions = self._positions
+        table._nullable = set(self._nullable)
+        return table
+
+    def for_staff(self, staff_ids):
+        """New table with the rows of the given secretaries."""
+        return self.take([
+            i for i, sid in enumerate(self.column("id_staff")) if sid in staff_ids
+        ])
+
+
+def rows_digest(rows):
+    """EligibilityTable.digest() of a list of row dicts, without building
+    the table: sha256 of the rows, independent of the order of the rows and
+    of their keys, computed one row at a time."""
+    if not rows:
+        return EligibilityTable().digest()
+    fields = sorted(rows[0])
+    values = (tuple(row[field] for field in fields) for row in rows)
+    if "date" in fields:
+        at = fields.index("date")
+        values = (
+            v if isinstance(v[at], str) else v[:at] + (v[at].isoformat(),) + v[at + 1:]
+            for v in values
+        )
+    return _digest(fields, values)
+
+
+def _digest(fields, rows):
+    # Sum of the row hashes: the same for any order of the rows
+    total = 0
+    for values in rows:
+        total += int.from_bytes(hashlib.sha256(repr(values).encode()).digest(), "big")
+    document = repr(fields).encode() + (total % 2 ** 256).to_bytes(32, "big")
+    return hashlib.sha256(document).hexdigest()
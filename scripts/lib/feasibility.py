@@ -0,0 +1,264 @@
+"""Infeasibility detection for the hard constraints of a week.
+
+precheck() runs before the solve: counting and matching bounds over the
+built model's variables that catch the usual conflicts between C4 (exact
+number of flexible days), C3/C5 (full days), C6 (every available half-day
+worked), C7 (same person AM/PM) and C2 (need capacity) in milliseconds,
+where CP-SAT can spend its whole time limit before giving up. The checks
+are necessary conditions only: a week that passes can still be infeasible.
+
+diagnose() is the slow, complete counterpart: it solves the week with one
+assumption literal per (rule, secretary) group and shrinks CP-SAT's
+infeasible core to a minimal set of groups that cannot hold together.
+"""
+
+from collections import defaultdict
+from datetime import date
+
+from ortools.sat.python import cp_model
+
+from lib.model import build_model
+
+RULES = {
+    "C2": "capacité du besoin",
+    "C3": "jours flexibles en journée entière",
+    "C4": "nombre exact de jours flexibles",
+    "C5": "journée entière",
+    "C6": "demi-journées disponibles toutes travaillées",
+    "C7": "même personne AM/PM",
+    "O4": "écart de pénibilité borné à 50",
+    "O8": "déficit admin borné à 10",
+    "O9": "écart de charge borné à 20",
+}
+
+
+def _to_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _issue(rule, message, sec=None, day=None, period=None):
+    return {
+        "rule": rule,
+        "id_staff": sec.id_staff if sec else None,
+        "name": f"{sec.lastname} {sec.firstname}" if sec else None,
+        "date": day,
+        "period": period,
+        "message": message,
+    }
+
+
+def precheck(x, y, data, meta, availability_map):
+    """Cheap necessary conditions for the week to be feasible.
+
+    Returns a list of issues ({"rule", "id_staff", "name", "date", "period",
+    "message"}), empty when no conflict was found.
+    """
+    all_needs = meta["all_needs"]
+    secretaries = {s.id_staff: s for s in data["secretaries"]}
+    existing_slots = {
+        (ea["id_staff"], _to_date(ea["date"]), ea["period"]) for ea in data["existing_assignments"]
+    }
+
+    slot_needs = defaultdict(list)  # (sid, date, period) -> [need index]
+    for sid, ni in x:
+        need = all_needs[ni]
+        slot_needs[(sid, need.date, need.period)].append(ni)
+
+    # Variables the model forces to 0, with the rule doing it
+    zero = {}
+
+    # C7: secretaries eligible for only one period of a same-person day
+    needs_by_dept_role_day = defaultdict(lambda: {"AM": [], "PM": []})
+    for need in all_needs:
+        if need.kind == "MEDICAL" and need.id_role in (2, 3):
+            key = (need.date, need.id_department, need.id_role)
+            needs_by_dept_role_day[key][need.period].append(need.index)
+    for periods in needs_by_dept_role_day.values():
+        if not periods["AM"] or not periods["PM"]:
+            continue
+        eligible = {
+            period: {sid for ni in nis for sid in meta["eligible_by_need"].get(ni, [])}
+            for period, nis in periods.items()
+        }
+        for period, other in (("AM", "PM"), ("PM", "AM")):
+            for sid in eligible[period] - eligible[other]:
+                for ni in periods[period]:
+                    if (sid, ni) in x:
+                        zero[(sid, ni)] = "C7"
+
+    # C5 / C3: full-day secretaries with work possible on one period only
+    for (sid, d, period), nis in slot_needs.items():
+        sec = secretaries.get(sid)
+        if sec is None or not sec.full_day_only:
+            continue
+        if sec.is_flexible and (sid, d) not in y:
+            continue
+        other = "PM" if period == "AM" else "AM"
+        if not slot_needs.get((sid, d, other)):
+            for ni in nis:
+                zero[(sid, ni)] = "C3" if sec.is_flexible else "C5"
+
+    def open_needs(sid, d, period):
+        return [ni for ni in slot_needs.get((sid, d, period), []) if (sid, ni) not in zero]
+
+    def blocked_by(sid, d, period):
+        return sorted({zero[(sid, ni)] for ni in slot_needs.get((sid, d, period), [])})
+
+    issues = []
+    # Secretaries that must work a slot: (date, period) -> [sid]
+    mandatory = defaultdict(list)
+
+    for sid, sec in secretaries.items():
+        days = availability_map.get(sid, {})
+
+        if not sec.is_flexible:
+            # C6: every available half-day with candidate needs is worked
+            for d, periods in days.items():
+                for period in periods:
+                    if (sid, d, period) in existing_slots or not slot_needs.get((sid, d, period)):
+                        continue
+                    if open_needs(sid, d, period):
+                        mandatory[(d, period)].append(sid)
+                        continue
+                    rules = " et ".join(blocked_by(sid, d, period))
+                    issues.append(_issue(
+                        "C6",
+                        f"doit travailler {d} {period} mais {rules} interdit toutes ses affectations",
+                        sec, d, period,
+                    ))
+            continue
+
+        # C4: enough usable days for the exact number of flexible days
+        available_days = sorted(d for (s, d) in y if s == sid)
+        if not available_days:
+            continue
+        target = round(len(available_days) * float(sec.flexibility_pct))
+        usable = []
+        for d in available_days:
+            # C6 ties every available half-day with candidates to y, C3 the day
+            slots = [
+                period for period in days.get(d, ())
+                if (sid, d, period) not in existing_slots and slot_needs.get((sid, d, period))
+            ]
+            if any(not open_needs(sid, d, period) for period in slots):
+                continue
+            if sec.full_day_only:
+                if open_needs(sid, d, "AM") and open_needs(sid, d, "PM"):
+                    usable.append((d, slots))
+            elif any(open_needs(sid, d, period) for period in ("AM", "PM")):
+                usable.append((d, slots))
+        if len(usable) < target:
+            issues.append(_issue(
+                "C4",
+                f"doit travailler {target} jour(s) mais seuls {len(usable)} sur "
+                f"{len(available_days)} sont possibles",
+                sec,
+            ))
+        elif len(usable) == target:
+            # No choice left: every usable day is worked
+            for d, slots in usable:
+                for period in slots:
+                    mandatory[(d, period)].append(sid)
+
+    # C2 vs C6: the secretaries that must work a slot need distinct places
+    for (d, period), sids in sorted(mandatory.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+        options = {sid: open_needs(sid, d, period) for sid in sids}
+        unmatched = _unmatched(options, {ni: all_needs[ni].gap for nis in options.values() for ni in nis})
+        if unmatched:
+            names = ", ".join(
+                f"{secretaries[sid].lastname} {secretaries[sid].firstname}" for sid in unmatched[:5]
+            )
+            more = f" (+{len(unmatched) - 5})" if len(unmatched) > 5 else ""
+            issues.append(_issue(
+                "C2",
+                f"{len(sids)} secrétaires doivent travailler {d} {period} mais seules "
+                f"{len(sids) - len(unmatched)} places sont compatibles; sans place: {names}{more}",
+                day=d, period=period,
+            ))
+
+    return issues
+
+
+def _unmatched(options, capacity):
+    """Secretaries left without a need in a maximum assignment of
+    secretaries to needs (need ni takes at most capacity[ni])."""
+    assigned = defaultdict(list)  # need index -> [sid]
+
+    def place(sid, seen):
+        for ni in options[sid]:
+            if ni in seen:
+                continue
+            seen.add(ni)
+            if len(assigned[ni]) < capacity[ni]:
+                assigned[ni].append(sid)
+                return True
+            for other in assigned[ni]:
+                if place(other, seen):
+                    assigned[ni].remove(other)
+                    assigned[ni].append(sid)
+                    return True
+        return False
+
+    # Most constrained first keeps the augmenting paths short
+    return [sid for sid in sorted(options, key=lambda s: len(options[s])) if not place(sid, set())]
+
+
+def diagnose(data, availability_map, admin_blocks, time_limit=30):
+    """Find a minimal set of constraint groups that cannot hold together.
+
+    Returns a list of {"rule", "description", "id_staff", "name", "need"}
+    groups, or None when the week is feasible (or the time ran out first).
+    """
+    groups = {}
+    model, _x, _y, meta = build_model(data, availability_map, admin_blocks, groups=groups)
+    model.clear_objective()
+    secretaries = {s.id_staff: s for s in data["secretaries"]}
+    by_literal = {literal.index: key for key, literal in groups.items()}
+
+    solver = cp_model.CpSolver()
+    # Infeasible cores are only reported by a single worker
+    solver.parameters.num_workers = 1
+
+    def infeasible(keys, seconds):
+        model.clear_assumptions()
+        model.add_assumptions([groups[key] for key in keys])
+        solver.parameters.max_time_in_seconds = seconds
+        return solver.solve(model) == cp_model.INFEASIBLE
+
+    if not infeasible(list(groups), time_limit / 2):
+        return None
+    core = [by_literal[index] for index in solver.sufficient_assumptions_for_infeasibility()]
+
+    # Deletion filter: drop every group the conflict does not need. A core
+    # found on the way replaces `core`, so each pass walks a fresh copy and
+    # skips the groups it already lost; a group found needed stays needed.
+    per_try = max(time_limit / 2 / max(len(core), 1), 0.5)
+    needed = set()
+    shrunk = True
+    while shrunk:
+        shrunk = False
+        for key in list(core):
+            if key not in core or key in needed:
+                continue
+            trial = [k for k in core if k != key]
+            if trial and infeasible(trial, per_try):
+                smaller = [by_literal[index] for index in solver.sufficient_assumptions_for_infeasibility()]
+                core = smaller if smaller else trial
+                shrunk = True
+            else:
+                needed.add(key)
+
+    conflict = []
+    for rule, key in sorted(core, key=lambda k: (k[0], str(k[1]))):
+        entry = {"rule": rule, "description": RULES[rule], "id_staff": None, "name": None, "need": None}
+        if rule == "C2":
+            need = meta["all_needs"][key]
+            entry["need"] = (
+                f"{need.date} {need.period} {need.department} {need.skill_name}"
+            )
+        else:
+            sec = secretaries[key]
+            entry["id_staff"] = key
+            entry["name"] = f"{sec.lastname} {sec.firstname}"
+        conflict.append(entry)
+    return conflict
@@ -0,0 +1,186 @@
+"""Solve jobs of the daemon: queue, coalescing, status and cancellation.
+
+The daemon keeps its jobs in memory (there is one daemon per database):
+a job is queued, then running, then done, failed or cancelled. A single
+worker thread runs them in order, since each CP-SAT solve already uses
+several threads. Submitting a job identical to one still queued or running
+(same week, same options) returns that job instead of starting another
+run: two planners clicking "solve" on the same week get one solve and the
+same result. Cancelling a running job stops its CP-SAT search
+(lib.progress.Cancellation) and its final solution is not written. With
+"persist_every", the incumbents published before the cancel stay: the
+week keeps the last one as its PUBLISHED solver run, and rollback_week
+restores the plan from before the job.
+"""
+
+import collections
+import json
+import threading
+import time
+import traceback
+import uuid
+
+from lib.progress import Cancellation, SolveCancelled
+
+FINISHED = ("done", "failed", "cancelled")
+
+# Finished jobs kept for status requests
+HISTORY = 100
+
+
+def job_key(week_start, options):
+    """What makes two jobs the same run: the week and the options that
+    change its result."""
+    plain = {
+        key: sorted(map(str, value)) if key == "repair" else value
+        for key, value in options.items()
+        if key not in ("result_cache", "listeners", "cancel")
+    }
+    plain["force"] = options.get("result_cache") is None
+    return week_start.isoformat(), json.dumps(plain, sort_keys=True, default=str)
+
+
+class Job:
+    """One requested solve and its outcome."""
+
+    def __init__(self, week_start, options):
+        self.id = uuid.uuid4().hex
+        self.week_start = week_start
+        self.options = options
+        self.key = job_key(week_start, options)
+        self.state = "queued"
+        self.requests = 1
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = None
+        self.document = None
+        self.error = None
+        self.exception = None
+        self.cancellation = Cancellation()
+        self.finished = threading.Event()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener):
+        """Also send this job's improving solutions to `listener`."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def __call__(self, event, extract):
+        # SolutionMonitor listener: fan out to the subscribers
+        self.progress = event
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(event, extract)
+
+    def status(self, result=True):
+        """JSON status document; `result` includes the result document."""
+        status = {
+            "id": self.id,
+            "week": self.week_start.isoformat(),
+            "state": self.state,
+            "requests": self.requests,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+            "error": self.error,
+        }
+        if result:
+            status["result"] = self.document
+        return status
+
+
+class JobQueue:
+    """Runs jobs one at a time on a worker thread.
+
+    `run(job)` does the work and returns the job's result document; it
+    should pass job.cancellation and job (as listener) to the solve.
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self._jobs = collections.OrderedDict()  # id -> Job, oldest first
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread = threading.Thread(target=self._work, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, week_start, options):
+        """Queue a job. Returns (job, coalesced): an identical job still
+        queued or running is returned instead of a new one."""
+        job = Job(week_start, options)
+        with self._lock:
+            for other in self._jobs.values():
+                if other.key == job.key and other.state not in FINISHED \
+                        and not other.cancellation.cancelled:
+                    other.requests += 1
+                    return other, True
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._wake.notify()
+        return job, False
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job. Returns the job, None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED:
+                return job
+            if job.state == "queued":
+                self._queue.remove(job)
+                self._finish(job, "cancelled")
+                return job
+        # Running: the solve raises SolveCancelled and the worker finishes it
+        job.cancellation.cancel()
+        return job
+
+    def _finish(self, job, state, document=None, error=None):
+        job.state = state
+        job.document = document
+        job.error = error
+        job.finished_at = time.time()
+        job.finished.set()
+        finished = [j for j in self._jobs.values() if j.state in FINISHED]
+        for old in finished[:max(len(finished) - HISTORY, 0)]:
+            del self._jobs[old.id]
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._wake.wait()
+                job = self._queue.popleft()
+                job.state = "running"
+                job.started_at = time.time()
+            try:
+                document = self.run(job)
+            except SolveCancelled as e:
+                job.exception = e
+                outcome = ("cancelled", None, None)
+            except Exception as e:
+                traceback.print_exc()
+                job.exception = e
+                outcome = ("failed", None, str(e))
+            else:
+                outcome = ("done", document, None)
+            with self._lock:
+                self._finish(job, *outcome)
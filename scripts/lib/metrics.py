@@ -0,0 +1,171 @@
+"""Per-run timing and size metrics for the secretary assignment solver.
+
+A RunMetrics collector is made current with collect(); phase() and query()
+blocks then record into it from anywhere below (runner, model, db) without
+threading it through every call, and are no-ops when no collector is
+active. compute_week collects into its own RunMetrics because it may run in
+a worker process; the caller merges that into the week's metrics.
+"""
+
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+METRICS_FORMATS = ("json", "prometheus")
+
+_current = ContextVar("solver_metrics", default=None)
+
+
+class RunMetrics:
+    """Timings, SQL queries and model size for one week's run."""
+
+    def __init__(self, week_start=None):
+        self.week_start = week_start
+        self.started_at = time.time()
+        self.phases = {}  # name -> seconds (summed when a phase repeats)
+        self.queries = []  # [{"name", "seconds"}], in execution order
+        self.model = {}  # variables, constraints, ...
+        self.status = None
+        self.worker_peak_rss_mb = 0.0  # compute_week run in a pool worker
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def merge(self, other):
+        """Add the metrics of a to_dict() document (e.g. compute_week's)."""
+        for name, seconds in other["phases"].items():
+            self.add_phase(name, seconds)
+        self.queries.extend(other["queries"])
+        self.model.update(other["model"])
+        self.status = other["status"] or self.status
+        self.worker_peak_rss_mb = max(self.worker_peak_rss_mb, other["peak_rss_mb"])
+
+    def to_dict(self):
+        return {
+            "week": self.week_start.isoformat() if self.week_start else None,
+            "started_at": self.started_at,
+            "status": self.status,
+            "total_seconds": time.time() - self.started_at,
+            "phases": self.phases,
+            "queries": self.queries,
+            "model": self.model,
+            "peak_rss_mb": max(peak_rss_mb(), self.worker_peak_rss_mb),
+        }
+
+
+@contextmanager
+def collect(metrics):
+    """Make `metrics` the collector of phase()/query() in this context."""
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def phase(name):
+    """Time a pipeline phase (load_week_data, build_model, solve, ...)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+@contextmanager
+def query(name):
+    """Time one SQL statement (execute + fetch)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.queries.append({"name": name, "seconds": time.perf_counter() - start})
+
+
+def record_phase(name, seconds):
+    """Record a phase the caller timed itself."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_phase(name, seconds)
+
+
+def record_model(**stats):
+    """Record model size figures (variables, constraints, ...)."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.model.update(stats)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and its finished children."""
+    usage = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def write_metrics(path, runs, fmt="json"):
+    """Export the metrics of a run (one to_dict() per week).
+
+    "json" appends one JSON line per week to `path`. "prometheus" rewrites
+    `path` in the text exposition format, atomically, for node_exporter's
+    textfile collector.
+    """
+    if fmt == "json":
+        with open(path, "a") as f:
+            for run in runs:
+                f.write(json.dumps(run, default=str) + "\n")
+        return
+
+    lines = [
+        "# HELP solver_phase_seconds Time spent in each solver phase.",
+        "# TYPE solver_phase_seconds gauge",
+    ]
+    for run in runs:
+        for name, seconds in run["phases"].items():
+            lines.append(f'solver_phase_seconds{{week="{run["week"]}",phase="{name}"}} {seconds:.6f}')
+    lines += [
+        "# HELP solver_query_seconds Time spent in each SQL query.",
+        "# TYPE solver_query_seconds gauge",
+    ]
+    for run in runs:
+        totals = {}
+        for q in run["queries"]:
+            totals[q["name"]] = totals.get(q["name"], 0.0) + q["seconds"]
+        for name, seconds in totals.items():
+            lines.append(f'solver_query_seconds{{week="{run["week"]}",query="{name}"}} {seconds:.6f}')
+    lines += [
+        "# HELP solver_model_size Size of the CP-SAT model.",
+        "# TYPE solver_model_size gauge",
+    ]
+    for run in runs:
+        for name, value in run["model"].items():
+            lines.append(f'solver_model_size{{week="{run["week"]}",item="{name}"}} {value}')
+    lines += [
+        "# HELP solver_run_seconds Total wall time of the run.",
+        "# TYPE solver_run_seconds gauge",
+    ]
+    for run in runs:
+        lines.append(f'solver_run_seconds{{week="{run["week"]}",status="{run["status"]}"}} {run["total_seconds"]:.6f}')
+    lines += [
+        "# HELP solver_peak_rss_megabytes Peak resident memory of the solver process.",
+        "# TYPE solver_peak_rss_megabytes gauge",
+        f"solver_peak_rss_megabytes {max((r['peak_rss_mb'] for r in runs), default=0):.1f}",
+        "# HELP solver_last_run_timestamp_seconds Unix time the run started.",
+        "# TYPE solver_last_run_timestamp_seconds gauge",
+        f"solver_last_run_timestamp_seconds {min((r['started_at'] for r in runs), default=0):.0f}",
+    ]
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
@@ -1,9 +1,15 @@
 """CP-SAT model for secretary assignment."""
 
+import contextlib
+import time
 from ortools.sat.python import cp_model
 from collections import defaultdict
 from datetime import date
 
+from lib.eligibility import EligibilityTable
+from lib.metrics import phase, record_phase
+from lib.records import Assignment, Need
+
 # --- Weight constants (priority order) ---
 FILL_BONUS = 200          # O1: prefer medical over admin
 SKILL_MULT = 5            # O2: skill_score * SKILL_MULT (range 50-200, gap=50 between levels)
@@ -15,22 +21,58 @@ ADMIN_TARGET_PENALTY = -20  # O7: per-unit admin deficit
 WORKLOAD_DEV_PENALTY = -3   # O8: per-unit workload deviation
 ADMIN_FILL_BONUS = 5      # O7b: per admin assignment
 
+# O3 encodings: "pairwise" = one cross literal per (AM site, PM site) pair,
+# "compact" = one cross literal per secretary and day (same optimum)
+SITE_MODELS = ("pairwise", "compact")
+
+# solve_staged: objectives optimized in turn, with their share of the time limit
+STAGES = (("fill", 0.3), ("quality", 0.4), ("fairness", 0.3))
+
+_STATUS_NAMES = {
+    cp_model.OPTIMAL: "OPTIMAL",
+    cp_model.FEASIBLE: "FEASIBLE",
+    cp_model.INFEASIBLE: "INFEASIBLE",
+    cp_model.MODEL_INVALID: "MODEL_INVALID",
+    cp_model.UNKNOWN: "UNKNOWN",
+}
+
 
-def build_model(data, availability_map, admin_blocks, verbose=False):
+def build_model(data, availability_map, admin_blocks, site_model="pairwise",
+                averages=None, groups=None, verbose=False):
     """
     Build the CP-SAT model for secretary assignment.
 
     Data comes from SQL views:
     - data["eligibility"]: pre-filtered eligible (staff, need) pairs with scores
+      (a lib.eligibility.EligibilityTable, or a list of row dicts)
     - data["availability"]: resolved availability per staff/date/period
     - data["secretaries"]: distinct secretaries with settings
 
+    `averages` ({"penibilite", "workload"}) overrides the O4/O9 targets that
+    are otherwise derived from `data` (used when solving a sub-problem).
+
+    With `groups` (a dict, filled here), the hard constraints C2-C7 and the
+    bounds of the O4/O8/O9 deviation variables are only enforced if their
+    group's literal is true: groups[(rule, key)] -> BoolVar, with key the
+    id_staff, or the need index for C2. Used by lib.feasibility to find
+    which rules conflict.
+
     Returns: (model, x_vars, y_vars, meta)
     """
     model = cp_model.CpModel()
 
+    def hard(constraint, rule, key):
+        """Add a hard constraint, guarded by its group literal with `groups`."""
+        ct = model.add(constraint)
+        if groups is not None:
+            literal = groups.get((rule, key))
+            if literal is None:
+                literal = groups[(rule, key)] = model.new_bool_var(f"group_{rule}_{key}")
+            ct.only_enforce_if(literal)
+        return ct
+
     secretaries = data["secretaries"]
-    sec_by_id = {s["id_staff"]: s for s in secretaries}
+    sec_by_id = {s.id_staff: s for s in secretaries}
 
     # Role hardship weights
     role_weight = {r["id_role"]: r.get("hardship_weight", 1) for r in data["roles"]}
@@ -48,76 +90,54 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
 
     # --- Build indexed need list ---
     # Key by (id_block, id_skill, id_role) — a block can need multiple skills
+    eligibility = EligibilityTable.of(data["eligibility"])
     medical_needs = {}
-    for e in data["eligibility"]:
-        nkey = (e["id_block"], e["id_skill"], e["id_role"])
+    for i, nkey in enumerate(eligibility.columns("id_block", "id_skill", "id_role")):
         if nkey not in medical_needs:
-            medical_needs[nkey] = {
-                "id_block": e["id_block"],
-                "date": _to_date(e["date"]),
-                "period": e["period"],
-                "block_type": e["block_type"],
-                "id_department": e["id_department"],
-                "id_site": e["id_site"],
-                "id_skill": e["id_skill"],
-                "id_role": e["id_role"],
-                "gap": e["gap"],
-                "department": e["department"],
-                "site": e["site"],
-                "skill_name": e["skill_name"],
-                "role_name": e["role_name"],
-                "_type": "MEDICAL",
-            }
+            need = Need.from_row(eligibility.row(i))
+            need.date = _to_date(need.date)
+            need.kind = "MEDICAL"
+            medical_needs[nkey] = need
 
     # Also add needs from data["needs"] that have no eligible secretary
     for n in data["needs"]:
         nkey = (n["id_block"], n["id_skill"], n["id_role"])
         if nkey not in medical_needs:
-            medical_needs[nkey] = {
-                "id_block": n["id_block"],
-                "date": _to_date(n["date"]),
-                "period": n["period"],
-                "block_type": n["block_type"],
-                "id_department": n["id_department"],
-                "id_site": n.get("id_site") or dept_site.get(n["id_department"]),
-                "id_skill": n["id_skill"],
-                "id_role": n["id_role"],
-                "gap": n["gap"],
-                "department": n["department"],
-                "site": n["site"],
-                "skill_name": n["skill_name"],
-                "role_name": n["role_name"],
-                "_type": "MEDICAL",
-            }
+            need = Need.from_row(n)
+            need.date = _to_date(need.date)
+            need.id_site = need.id_site or dept_site.get(need.id_department)
+            need.kind = "MEDICAL"
+            medical_needs[nkey] = need
 
     # All needs indexed: medical first, then admin
     all_needs = []
     need_to_index = {}  # (id_block, id_skill, id_role) -> index
     for nkey, need in medical_needs.items():
-        need["_index"] = len(all_needs)
-        need_to_index[nkey] = need["_index"]
+        need.index = len(all_needs)
+        need_to_index[nkey] = need.index
         all_needs.append(need)
 
     admin_need_start = len(all_needs)
     for ab in admin_blocks:
-        need = {
-            "_index": len(all_needs),
-            "_type": "ADMIN",
-            "id_block": ab["id_block"],
-            "date": _to_date(ab["date"]),
-            "period": ab["period"],
-            "block_type": "ADMIN",
-            "id_department": ab["id_department"],
-            "id_site": dept_site.get(ab["id_department"]),
-            "id_skill": None,
-            "id_role": 1,
-            "gap": 30,
-            "department": "Administration",
-            "site": "N/A",
-            "skill_name": "Admin",
-            "role_name": "Standard",
-        }
-        need_to_index[(ab["id_block"], None, 1)] = need["_index"]
+        need = Need(
+            index=len(all_needs),
+            kind="ADMIN",
+            id_block=ab["id_block"],
+            date=_to_date(ab["date"]),
+            period=ab["period"],
+            block_type="ADMIN",
+            id_department=ab["id_department"],
+            id_site=dept_site.get(ab["id_department"]),
+            id_skill=None,
+            id_role=1,
+            # lib.decompose passes its share of the capacity in "gap"
+            gap=ab.get("gap", 30),
+            department="Administration",
+            site="N/A",
+            skill_name="Admin",
+            role_name="Standard",
+        )
+        need_to_index[(ab["id_block"], None, 1)] = need.index
         all_needs.append(need)
 
     # --- Create x variables ---
@@ -128,6 +148,12 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
     eligible_by_need = defaultdict(list)
     needs_by_staff_slot = defaultdict(list)
 
+    # Per-staff indexes, filled while creating x so objective blocks never
+    # scan every (secretary, need) pair
+    medical_vars_by_staff = defaultdict(list)  # sid -> [(need_index, var)]
+    admin_vars_by_staff = defaultdict(list)  # sid -> [var]
+    medical_vars_by_slot_site = defaultdict(list)  # (sid, date, period, site) -> [var]
+
     # Decomposed scores per (staff_id, need_index)
     skill_score_map = {}
     prefere_score_map = {}
@@ -135,14 +161,16 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
     eviter_groups = defaultdict(list)
 
     # Medical variables: one per eligibility row
-    for e in data["eligibility"]:
-        sid = e["id_staff"]
-        nkey = (e["id_block"], e["id_skill"], e["id_role"])
-        ni = need_to_index.get(nkey)
+    for (sid, id_block, id_skill, id_role, need_date, need_period, skill_score,
+         prefere_site, prefere_dept, prefere_staff,
+         eviter_site, eviter_dept, eviter_staff, id_site, id_department) in eligibility.columns(
+            "id_staff", "id_block", "id_skill", "id_role", "date", "period", "skill_score",
+            "prefere_site_score", "prefere_dept_score", "prefere_staff_score",
+            "eviter_site_score", "eviter_dept_score", "eviter_staff_score",
+            "id_site", "id_department"):
+        ni = need_to_index.get((id_block, id_skill, id_role))
         if ni is None:
             continue
-        need_date = _to_date(e["date"])
-        need_period = e["period"]
 
         if (sid, need_date, need_period) in existing_slots:
             continue
@@ -153,30 +181,30 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
             x[key] = var
             eligible_by_need[ni].append(sid)
             needs_by_staff_slot[(sid, need_date, need_period)].append(ni)
+            medical_vars_by_staff[sid].append((ni, var))
+            medical_vars_by_slot_site[
+                (sid, need_date, need_period, all_needs[ni].id_site)
+            ].append(var)
 
             # Store decomposed scores
-            skill_score_map[key] = e["skill_score"]
-            prefere_score_map[key] = (
-                e["prefere_site_score"]
-                + e["prefere_dept_score"]
-                + e["prefere_staff_score"]
-            )
+            skill_score_map[key] = skill_score
+            prefere_score_map[key] = prefere_site + prefere_dept + prefere_staff
 
             # Track EVITER violations for progressive penalty
-            if e["eviter_site_score"] < 0:
-                eviter_groups[(sid, "SITE", e["id_site"])].append(key)
-            if e["eviter_dept_score"] < 0:
-                eviter_groups[(sid, "DEPT", e["id_department"])].append(key)
-            if e["eviter_staff_score"] < 0:
-                eviter_groups[(sid, "STAFF", e["id_block"])].append(key)
+            if eviter_site < 0:
+                eviter_groups[(sid, "SITE", id_site)].append(key)
+            if eviter_dept < 0:
+                eviter_groups[(sid, "DEPT", id_department)].append(key)
+            if eviter_staff < 0:
+                eviter_groups[(sid, "STAFF", id_block)].append(key)
 
     # Admin variables: any available secretary can do admin
     for need in all_needs:
-        if need["_type"] != "ADMIN":
+        if need.kind != "ADMIN":
             continue
-        ni = need["_index"]
-        need_date = need["date"]
-        need_period = need["period"]
+        ni = need.index
+        need_date = need.date
+        need_period = need.period
 
         for sid in availability_map:
             if need_period not in availability_map[sid].get(need_date, set()):
@@ -190,15 +218,16 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
                 x[key] = var
                 eligible_by_need[ni].append(sid)
                 needs_by_staff_slot[(sid, need_date, need_period)].append(ni)
+                admin_vars_by_staff[sid].append(var)
 
     # --- Flexible day variables ---
-    flexible_secs = [s for s in secretaries if s["is_flexible"]]
+    flexible_secs = [s for s in secretaries if s.is_flexible]
 
     for sec in flexible_secs:
-        sid = sec["id_staff"]
+        sid = sec.id_staff
         for d in week_dates:
             avail = availability_map.get(sid, {}).get(d, set())
-            if sec["full_day_only"]:
+            if sec.full_day_only:
                 if "AM" in avail and "PM" in avail:
                     y[(sid, d)] = model.new_bool_var(f"y_{sid}_{d}")
             else:
@@ -214,14 +243,14 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
 
     # C2: Each need filled at most gap times
     for need in all_needs:
-        ni = need["_index"]
+        ni = need.index
         eligible = eligible_by_need.get(ni, [])
         if eligible:
-            model.add(sum(x[(sid, ni)] for sid in eligible if (sid, ni) in x) <= need["gap"])
+            hard(sum(x[(sid, ni)] for sid in eligible if (sid, ni) in x) <= need.gap, "C2", ni)
 
     # C3: Flexible full_day_only — linked via y variables
     for sec in flexible_secs:
-        sid = sec["id_staff"]
+        sid = sec.id_staff
         for d in week_dates:
             if (sid, d) not in y:
                 continue
@@ -235,28 +264,28 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
                 for ni in needs_by_staff_slot.get((sid, d, "PM"), [])
                 if (sid, ni) in x
             ]
-            if sec["full_day_only"]:
-                model.add(sum(am_vars) == y[(sid, d)])
-                model.add(sum(pm_vars) == y[(sid, d)])
+            if sec.full_day_only:
+                hard(sum(am_vars) == y[(sid, d)], "C3", sid)
+                hard(sum(pm_vars) == y[(sid, d)], "C3", sid)
             else:
-                model.add(sum(am_vars) + sum(pm_vars) >= y[(sid, d)])
-                model.add(sum(am_vars) + sum(pm_vars) <= 2 * y[(sid, d)])
+                hard(sum(am_vars) + sum(pm_vars) >= y[(sid, d)], "C3", sid)
+                hard(sum(am_vars) + sum(pm_vars) <= 2 * y[(sid, d)], "C3", sid)
 
     # C4: Flexible — exact number of working days (HARD constraint)
     for sec in flexible_secs:
-        sid = sec["id_staff"]
+        sid = sec.id_staff
         available_days = [d for d in week_dates if (sid, d) in y]
         if not available_days:
             continue
-        target = round(len(available_days) * float(sec["flexibility_pct"]))
-        model.add(sum(y[(sid, d)] for d in available_days) == target)
+        target = round(len(available_days) * float(sec.flexibility_pct))
+        hard(sum(y[(sid, d)] for d in available_days) == target, "C4", sid)
 
     # C5: Non-flexible full_day_only — if assigned AM, must also be assigned PM
     non_flex_full_day = [
-        s for s in secretaries if not s["is_flexible"] and s["full_day_only"]
+        s for s in secretaries if not s.is_flexible and s.full_day_only
     ]
     for sec in non_flex_full_day:
-        sid = sec["id_staff"]
+        sid = sec.id_staff
         for d in week_dates:
             am_vars = [
                 x[(sid, ni)]
@@ -269,15 +298,15 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
                 if (sid, ni) in x
             ]
             if am_vars and pm_vars:
-                model.add(sum(am_vars) == sum(pm_vars))
+                hard(sum(am_vars) == sum(pm_vars), "C5", sid)
             elif am_vars and not pm_vars:
-                model.add(sum(am_vars) == 0)
+                hard(sum(am_vars) == 0, "C5", sid)
             elif pm_vars and not am_vars:
-                model.add(sum(pm_vars) == 0)
+                hard(sum(pm_vars) == 0, "C5", sid)
 
     # C6: Mandatory assignment — every available slot must be filled (medical or admin)
     for sec in secretaries:
-        sid = sec["id_staff"]
+        sid = sec.id_staff
         for d in week_dates:
             for period in ["AM", "PM"]:
                 avail = availability_map.get(sid, {}).get(d, set())
@@ -294,21 +323,21 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
                 if not slot_vars:
                     continue
 
-                if sec["is_flexible"]:
+                if sec.is_flexible:
                     if (sid, d) in y:
-                        model.add(sum(slot_vars) == y[(sid, d)])
+                        hard(sum(slot_vars) == y[(sid, d)], "C6", sid)
                 else:
-                    model.add(sum(slot_vars) == 1)
+                    hard(sum(slot_vars) == 1, "C6", sid)
 
     # C7: Same person AM/PM for same (department, role) when role in {2, 3}
     needs_by_dept_role_day = defaultdict(lambda: {"AM": [], "PM": []})
     for need in all_needs:
-        if need["_type"] != "MEDICAL":
+        if need.kind != "MEDICAL":
             continue
-        if need["id_role"] not in (2, 3):
+        if need.id_role not in (2, 3):
             continue
-        key = (need["date"], need["id_department"], need["id_role"])
-        needs_by_dept_role_day[key][need["period"]].append(need["_index"])
+        key = (need.date, need.id_department, need.id_role)
+        needs_by_dept_role_day[key][need.period].append(need.index)
 
     for (d, dept_id, role_id), periods in needs_by_dept_role_day.items():
         am_needs = periods["AM"]
@@ -335,27 +364,30 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
             am_vars = [x[(sid, ni)] for ni in am_needs if (sid, ni) in x]
             pm_vars = [x[(sid, ni)] for ni in pm_needs if (sid, ni) in x]
             if am_vars and pm_vars:
-                model.add(sum(am_vars) == sum(pm_vars))
+                hard(sum(am_vars) == sum(pm_vars), "C7", sid)
 
         # Block secretaries that can only do one period
         for sid in am_eligible - pm_eligible:
             am_vars = [x[(sid, ni)] for ni in am_needs if (sid, ni) in x]
             if am_vars:
-                model.add(sum(am_vars) == 0)
+                hard(sum(am_vars) == 0, "C7", sid)
         for sid in pm_eligible - am_eligible:
             pm_vars = [x[(sid, ni)] for ni in pm_needs if (sid, ni) in x]
             if pm_vars:
-                model.add(sum(pm_vars) == 0)
+                hard(sum(pm_vars) == 0, "C7", sid)
 
     # === OBJECTIVE ===
 
     objective_terms = []
+    # The same terms by stage of solve_staged: medical fill count, quality
+    # (skills, PREFERE, site continuity, admin), fairness (O4/O9)
+    stage_terms = {"fill": [], "quality": [], "fairness": []}
 
     # O1+O2+O6: Medical fill + skill preference + PREFERE bonus (decomposed)
     for need in all_needs:
-        if need["_type"] != "MEDICAL":
+        if need.kind != "MEDICAL":
             continue
-        ni = need["_index"]
+        ni = need.index
         for sid in eligible_by_need.get(ni, []):
             key = (sid, ni)
             if key not in x:
@@ -364,43 +396,60 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
             prefere = prefere_score_map.get(key, 0)
             score = FILL_BONUS + skill * SKILL_MULT + prefere * PREFERE_MULT
             objective_terms.append(score * x[key])
+            stage_terms["fill"].append(x[key])
+            stage_terms["quality"].append((score - FILL_BONUS) * x[key])
 
     # O3: Site continuity — bonus same site, penalty cross-site
-    needs_by_date_site_period = defaultdict(list)
-    for need in all_needs:
-        if need["_type"] != "MEDICAL":
-            continue
-        ni = need["_index"]
-        needs_by_date_site_period[(need["date"], need["id_site"], need["period"])].append(ni)
-
-    site_ids = [s["id_site"] for s in data["sites"]]
+    o3_start = model_stats(model)
+    site_order = {s["id_site"]: i for i, s in enumerate(data["sites"])}
+    # Sites of each (secretary, day, period)'s medical variables: only
+    # those are visited, not every site of the week
+    slot_sites = defaultdict(list)
+    for sid, d, period, site_id in medical_vars_by_slot_site:
+        if site_id in site_order:
+            slot_sites[(sid, d, period)].append(site_id)
 
     for sec in secretaries:
-        sid = sec["id_staff"]
+        sid = sec.id_staff
+        if sid not in medical_vars_by_staff:
+            continue
         for d in week_dates:
-            am_by_site = {}
-            pm_by_site = {}
-            for site_id in site_ids:
-                am_nis = needs_by_date_site_period.get((d, site_id, "AM"), [])
-                pm_nis = needs_by_date_site_period.get((d, site_id, "PM"), [])
-                am_vars = [x[(sid, ni)] for ni in am_nis if (sid, ni) in x]
-                pm_vars = [x[(sid, ni)] for ni in pm_nis if (sid, ni) in x]
-                if am_vars:
-                    am_by_site[site_id] = am_vars
-                if pm_vars:
-                    pm_by_site[site_id] = pm_vars
+            am_by_site = {
+                site_id: medical_vars_by_slot_site[(sid, d, "AM", site_id)]
+                for site_id in sorted(slot_sites.get((sid, d, "AM"), ()), key=site_order.get)
+            }
+            pm_by_site = {
+                site_id: medical_vars_by_slot_site[(sid, d, "PM", site_id)]
+                for site_id in sorted(slot_sites.get((sid, d, "PM"), ()), key=site_order.get)
+            }
 
             if not am_by_site or not pm_by_site:
                 continue
 
             # Same-site bonus
+            same_vars = []
             for site_id in set(am_by_site) & set(pm_by_site):
                 both = model.new_bool_var(f"same_{sid}_{d}_{site_id}")
                 model.add(sum(am_by_site[site_id]) >= both)
                 model.add(sum(pm_by_site[site_id]) >= both)
                 objective_terms.append(SITE_SAME_BONUS * both)
+                stage_terms["quality"].append(SITE_SAME_BONUS * both)
+                same_vars.append(both)
 
             # Cross-site penalty
+            if site_model == "compact":
+                # C1 makes each period's site sum 0/1, so AM medical + PM
+                # medical without a same-site day means a site change.
+                if len(am_by_site) == 1 and am_by_site.keys() == pm_by_site.keys():
+                    continue  # a single shared site: no change possible
+                cross = model.new_bool_var(f"cross_{sid}_{d}")
+                am_all = [v for vs in am_by_site.values() for v in vs]
+                pm_all = [v for vs in pm_by_site.values() for v in vs]
+                model.add(cross >= sum(am_all) + sum(pm_all) - 1 - sum(same_vars))
+                objective_terms.append(SITE_CROSS_PENALTY * cross)
+                stage_terms["quality"].append(SITE_CROSS_PENALTY * cross)
+                continue
+
             for site_a in am_by_site:
                 for site_b in pm_by_site:
                     if site_a == site_b:
@@ -413,6 +462,10 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
                     model.add(cross <= sum(am_by_site[site_a]))
                     model.add(cross <= sum(pm_by_site[site_b]))
                     objective_terms.append(SITE_CROSS_PENALTY * cross)
+                    stage_terms["quality"].append(SITE_CROSS_PENALTY * cross)
+
+    o3_end = model_stats(model)
+    o3_stats = {k: o3_end[k] - o3_start[k] for k in o3_end}
 
     # O4: Combined pénibilité — EVITER violations + hardship (role weights)
     # Single score per secretary: penibilite = sum(hardship_weight * medical) + sum(eviter_count * EVITER_WEIGHT)
@@ -429,19 +482,14 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
     # Build combined penibilite per secretary
     penibilite_loads = {}
     for sec in secretaries:
-        sid = sec["id_staff"]
+        sid = sec.id_staff
         terms = []
 
         # Hardship from role weights (Standard=0, Aide fermeture=2, Fermeture=3) — loaded from DB
-        for need in all_needs:
-            if need["_type"] != "MEDICAL":
-                continue
-            ni = need["_index"]
-            if (sid, ni) not in x:
-                continue
-            w = role_weight.get(need["id_role"], 0)
+        for ni, var in medical_vars_by_staff.get(sid, []):
+            w = role_weight.get(all_needs[ni].id_role, 0)
             if w > 0:
-                terms.append(w * x[(sid, ni)])
+                terms.append(w * var)
 
         # EVITER violations
         for ev_var in eviter_vars_by_staff.get(sid, []):
@@ -450,72 +498,70 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
         if terms:
             penibilite_loads[sid] = sum(terms)
 
+    avg_penibilite = None
     if penibilite_loads:
         # Estimate average penibilite
         total_hardship = sum(
-            n["gap"] * role_weight.get(n["id_role"], 0)
-            for n in all_needs if n["_type"] == "MEDICAL"
+            n.gap * role_weight.get(n.id_role, 0)
+            for n in all_needs if n.kind == "MEDICAL"
         )
         num_active = len(penibilite_loads)
         avg_penibilite = total_hardship // max(num_active, 1)
+        if averages and averages.get("penibilite") is not None:
+            avg_penibilite = averages["penibilite"]
 
         for sid, load_expr in penibilite_loads.items():
             deviation = model.new_int_var(0, 50, f"pen_dev_{sid}")
-            model.add(deviation >= load_expr - avg_penibilite)
-            model.add(deviation >= avg_penibilite - load_expr)
+            hard(deviation >= load_expr - avg_penibilite, "O4", sid)
+            hard(deviation >= avg_penibilite - load_expr, "O4", sid)
             objective_terms.append(PENIBILITE_DEV_PENALTY * deviation)
+            stage_terms["fairness"].append(PENIBILITE_DEV_PENALTY * deviation)
 
     # O7: Admin assignment (low weight — fill remaining slots)
     for need in all_needs:
-        if need["_type"] != "ADMIN":
+        if need.kind != "ADMIN":
             continue
-        ni = need["_index"]
+        ni = need.index
         for sid in eligible_by_need.get(ni, []):
             if (sid, ni) in x:
                 objective_terms.append(ADMIN_FILL_BONUS * x[(sid, ni)])
+                stage_terms["quality"].append(ADMIN_FILL_BONUS * x[(sid, ni)])
 
     # O8: Admin target — penalty if not met
     for sec in secretaries:
-        sid = sec["id_staff"]
-        if sec["admin_target"] <= 0:
+        sid = sec.id_staff
+        if sec.admin_target <= 0:
             continue
-        admin_vars = []
-        for need in all_needs:
-            if need["_type"] != "ADMIN":
-                continue
-            ni = need["_index"]
-            if (sid, ni) in x:
-                admin_vars.append(x[(sid, ni)])
+        admin_vars = admin_vars_by_staff.get(sid)
         if admin_vars:
             admin_load = sum(admin_vars)
             admin_deficit = model.new_int_var(0, 10, f"admin_def_{sid}")
-            model.add(admin_deficit >= sec["admin_target"] - admin_load)
+            hard(admin_deficit >= sec.admin_target - admin_load, "O8", sid)
             objective_terms.append(ADMIN_TARGET_PENALTY * admin_deficit)
+            stage_terms["quality"].append(ADMIN_TARGET_PENALTY * admin_deficit)
 
     # O9: Workload balance (count-based)
     loads = {}
     for sec in secretaries:
-        sid = sec["id_staff"]
-        medical_vars = []
-        for need in all_needs:
-            if need["_type"] != "MEDICAL":
-                continue
-            ni = need["_index"]
-            if (sid, ni) in x:
-                medical_vars.append(x[(sid, ni)])
+        sid = sec.id_staff
+        medical_vars = medical_vars_by_staff.get(sid)
         if medical_vars:
-            loads[sid] = sum(medical_vars)
+            loads[sid] = sum(var for _ni, var in medical_vars)
 
+    avg_load = None
     if loads:
-        total_medical_needs = sum(n["gap"] for n in all_needs if n["_type"] == "MEDICAL")
+        total_medical_needs = sum(n.gap for n in all_needs if n.kind == "MEDICAL")
         num_active = len(loads)
         avg_load = total_medical_needs // max(num_active, 1)
+        if averages and averages.get("workload") is not None:
+            avg_load = averages["workload"]
 
         for sid, load_expr in loads.items():
             deviation = model.new_int_var(0, 20, f"wl_dev_{sid}")
-            model.add(deviation >= load_expr - avg_load)
-            model.add(deviation >= avg_load - load_expr)
+            hard(deviation >= load_expr - avg_load, "O9", sid)
+            hard(deviation >= avg_load - load_expr, "O9", sid)
             objective_terms.append(WORKLOAD_DEV_PENALTY * deviation)
+            stage_terms["fairness"].append(WORKLOAD_DEV_PENALTY * deviation)
 
     # Maximize objective
     model.maximize(sum(objective_terms))
@@ -527,113 +573,391 @@ def build_model(data, availability_map, admin_blocks, verbose=False):
         "admin_need_start": admin_need_start,
         "week_dates": week_dates,
         "role_weight": role_weight,
+        "o3_stats": o3_stats,
+        "averages": {"penibilite": avg_penibilite, "workload": avg_load},
+        "objective_terms": objective_terms,
+        "stage_terms": stage_terms,
     }
 
     if verbose:
         print(f"  Variables: {len(x)} x-vars, {len(y)} y-vars")
-        med_count = len([n for n in all_needs if n["_type"] == "MEDICAL"])
-        adm_count = len([n for n in all_needs if n["_type"] == "ADMIN"])
+        med_count = len([n for n in all_needs if n.kind == "MEDICAL"])
+        adm_count = len([n for n in all_needs if n.kind == "ADMIN"])
         print(f"  Needs: {med_count} medical, {adm_count} admin")
         print(f"  EVITER groups: {len(eviter_groups)}")
         print(f"  Objective terms: {len(objective_terms)}")
+        print(
+            f"  O3 ({site_model}): {o3_stats['variables']} variables, "
+            f"{o3_stats['constraints']} constraints"
+        )
 
     return model, x, y, meta
 
 
-def solve_model(model, x, y, data, meta, time_limit=30, verbose=False):
-    """Solve the CP-SAT model and extract assignments."""
+def model_stats(model):
+    """Variable and constraint counts of a CP-SAT model."""
+    proto = model.proto
+    return {"variables": len(proto.variables), "constraints": len(proto.constraints)}
+
+
+def compare_site_models(data, availability_map, admin_blocks):
+    """Build the model with every O3 encoding and return their sizes.
+
+    Returns {site_model: {"variables", "constraints", "o3_variables",
+    "o3_constraints"}}.
+    """
+    stats = {}
+    for site_model in SITE_MODELS:
+        model, _x, _y, meta = build_model(
+            data, availability_map, admin_blocks, site_model=site_model
+        )
+        stats[site_model] = {
+            **model_stats(model),
+            "o3_variables": meta["o3_stats"]["variables"],
+            "o3_constraints": meta["o3_stats"]["constraints"],
+        }
+    return stats
+
+
+def add_solution_hints(model, x, y, meta, hints, complete=True):
+    """Seed the solver with a previous plan (warm start).
+
+    `hints` are assignment rows (id_staff, id_block, id_skill, id_role, date,
+    period, id_department). A row is matched to its need by block first, then
+    by (date, period, department, skill, role) so that rows from another week
+    shifted onto this one still find their need. Earlier rows win when two
+    rows hint the same staff slot. Every x/y variable gets a hint: 1 for the
+    matched assignments and worked flexible days, 0 otherwise; with
+    `complete`, auxiliary variables are completed from those values when
+    they are feasible (not worth its solve when fix_outside_window already
+    fixed most of the model).
+
+    Returns the number of matched assignments.
+    """
+    hinted = _match_plan(x, meta, hints)
+
+    worked_days = {(sid, meta["all_needs"][ni].date) for sid, ni in hinted}
+    values = [(var, 1 if key in hinted else 0) for key, var in x.items()]
+    values += [(var, 1 if key in worked_days else 0) for key, var in y.items()]
+
+    if not complete or not _complete_hint(model, values):
+        # Old plan no longer feasible as-is: hint the decisions only
+        for var, value in values:
+            model.add_hint(var, value)
+
+    meta["hinted"] = len(hinted)
+    return len(hinted)
+
+
+def _match_plan(x, meta, rows):
+    """(id_staff, need index) keys of the x variables matching assignment
+    rows (see add_solution_hints for the matching rules)."""
+    by_block = {}
+    by_pattern = {}
+    for need in meta["all_needs"]:
+        role = need.id_role if need.id_role is not None else 1
+        by_block.setdefault((need.id_block, need.id_skill, role), need.index)
+        by_pattern.setdefault(
+            (need.date, need.period, need.id_department, need.id_skill, role),
+            need.index,
+        )
+
+    matched = set()
+    matched_slots = set()
+    for h in rows:
+        sid = h["id_staff"]
+        d = _to_date(h["date"])
+        slot = (sid, d, h["period"])
+        if slot in matched_slots:
+            continue
+        role = h["id_role"] if h["id_role"] is not None else 1
+        ni = by_block.get((h["id_block"], h["id_skill"], role))
+        if ni is None or (sid, ni) not in x:
+            ni = by_pattern.get((d, h["period"], h["id_department"], h["id_skill"], role))
+        if ni is None or (sid, ni) not in x:
+            continue
+        matched.add((sid, ni))
+        matched_slots.add(slot)
+    return matched
+
+
+def fix_outside_window(model, x, y, meta, plan, window):
+    """Fix the model to the stored `plan` outside `window` (local repair).
+
+    `plan` are assignment rows as for add_solution_hints; `window` is a set
+    of (date, period) left free. x variables outside the window are fixed
+    to 1 for the plan's assignments and 0 otherwise, and flexible days with
+    no free period keep whether they were worked.
+
+    Returns the number of assignments kept.
+    """
+    kept = _match_plan(x, meta, plan)
+    fixed = 0
+    for key, var in x.items():
+        need = meta["all_needs"][key[1]]
+        if (need.date, need.period) in window:
+            continue
+        model.add(var == (1 if key in kept else 0))
+        fixed += key in kept
+
+    worked_days = {(sid, meta["all_needs"][ni].date) for sid, ni in kept}
+    for (sid, d), var in y.items():
+        if (d, "AM") in window or (d, "PM") in window:
+            continue
+        model.add(var == (1 if (sid, d) in worked_days else 0))
+    return fixed
+
+
+def _complete_hint(model, values, time_limit=2.0):
+    """Hint every model variable, auxiliaries included.
+
+    CP-SAT makes little use of a hint that only covers x/y, so the auxiliary
+    values (site continuity, deviations) are derived by solving a copy of the
+    model with x/y fixed. Returns False if that copy is infeasible.
+    """
+    probe = model.clone()
+    for var, value in values:
+        probe.add(probe.get_int_var_from_proto_index(var.index) == value)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    status = solver.solve(probe)
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return False
+
+    for i in range(len(model.proto.variables)):
+        model.add_hint(
+            model.get_int_var_from_proto_index(i),
+            solver.value(probe.get_int_var_from_proto_index(i)),
+        )
+    return True
+
+
+def solve_model(model, x, y, data, meta, time_limit=30, num_workers=4, verbose=False,
+                callback=None, stop=None, cancel=None):
+    """Solve the CP-SAT model and extract assignments.
+
+    `callback` is an optional cp_model.CpSolverSolutionCallback called on
+    every improving solution. `stop` is an optional lib.progress.StopRule
+    (early stopping); result["stopped_by"] names the rule that fired.
+    `cancel` is an optional lib.progress.Cancellation.
+    """
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = time_limit
-    solver.parameters.num_workers = 4
+    solver.parameters.num_workers = num_workers
 
     if verbose:
         solver.parameters.log_search_progress = True
 
-    status = solver.solve(model)
+    if stop is not None:
+        stop.start(solver)
+    try:
+        with phase("solve"), _running(cancel, solver):
+            status = solver.solve(model, callback)
+    except BaseException:
+        if stop is not None:
+            stop.finish()  # ends its watchdog
+        raise
+    extract_start = time.perf_counter()
 
-    status_name = {
-        cp_model.OPTIMAL: "OPTIMAL",
-        cp_model.FEASIBLE: "FEASIBLE",
-        cp_model.INFEASIBLE: "INFEASIBLE",
-        cp_model.MODEL_INVALID: "MODEL_INVALID",
-        cp_model.UNKNOWN: "UNKNOWN",
-    }.get(status, "UNKNOWN")
+    status_name = _STATUS_NAMES.get(status, "UNKNOWN")
 
     result = {
         "status": status_name,
         "objective": solver.objective_value if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None,
+        "best_bound": solver.best_objective_bound if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None,
         "wall_time": solver.wall_time,
         "assignments": [],
         "admin_assignments": [],
         "unfilled": [],
         "flexible_days": {},
+        "stopped_by": None,
     }
 
+    if stop is not None:
+        stop.finish(status_name, result["objective"], result["best_bound"])
+        result["stopped_by"] = stop.reason
+
     if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
         return result
 
+    result.update(extract_solution(solver.value, x, y, data, meta))
+
+    record_phase("extract", time.perf_counter() - extract_start)
+    return result
+
+
+def solve_staged(model, x, y, data, meta, time_limit=30, num_workers=4, verbose=False,
+                 callback=None, cancel=None):
+    """Solve the objectives of STAGES lexicographically instead of their
+    weighted sum: maximize the medical fill, fix it as a constraint and
+    maximize quality (skills, PREFERE, site continuity, admin), fix that
+    and maximize fairness (O4/O9).
+
+    Each stage gets its share of what remains of `time_limit` and starts
+    from the previous stage's solution as hint. `model` is modified. The
+    result is shaped like solve_model's; "objective" is the weighted
+    objective of the final solution, for comparison with a flat solve, and
+    result["stages"] lists each stage's status, value and time. `callback`
+    sees every stage's solutions, with that stage's objective; `cancel`
+    (lib.progress.Cancellation) stops whichever stage is running.
+    """
+    solver = cp_model.CpSolver()
+    solver.parameters.num_workers = num_workers
+    if verbose:
+        solver.parameters.log_search_progress = True
+
+    stages = []
+    status = cp_model.UNKNOWN
+    best = None  # (values of every variable, weighted objective) of the last solved stage
+    remaining = time_limit
+    shares = sum(share for _name, share in STAGES)
+    with phase("solve"):
+        for name, share in STAGES:
+            expr = sum(meta["stage_terms"][name])
+            model.maximize(expr)
+            solver.parameters.max_time_in_seconds = max(remaining * share / shares, 0.1)
+            # Later stages start from a complete, feasible hint: presolving
+            # the whole model again can take their entire budget on large weeks
+            solver.parameters.cp_model_presolve = best is None
+            shares -= share
+            with _running(cancel, solver):
+                stage_status = solver.solve(model, callback)
+            remaining -= solver.wall_time
+            solved = stage_status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+            stages.append({
+                "stage": name,
+                "status": _STATUS_NAMES.get(stage_status, "UNKNOWN"),
+                "objective": solver.objective_value if solved else None,
+                "wall_time": solver.wall_time,
+            })
+            if not solved:
+                # A later stage out of time keeps the previous stage's solution
+                status = stage_status if best is None else cp_model.FEASIBLE
+                break
+            status = cp_model.FEASIBLE if cp_model.FEASIBLE in (status, stage_status) else cp_model.OPTIMAL
+            best = (
+                [solver.value(model.get_int_var_from_proto_index(i))
+                 for i in range(len(model.proto.variables))],
+                float(solver.value(sum(meta["objective_terms"]))),
+            )
+            # Keep this stage's level and start the next one from its solution
+            model.add(expr >= int(round(solver.objective_value)))
+            model.clear_hints()
+            for i, value in enumerate(best[0]):
+                model.add_hint(model.get_int_var_from_proto_index(i), value)
+    extract_start = time.perf_counter()
+
+    result = {
+        "status": _STATUS_NAMES.get(status, "UNKNOWN"),
+        "objective": best[1] if best else None,
+        "best_bound": None,
+        "wall_time": sum(stage["wall_time"] for stage in stages),
+        "assignments": [],
+        "admin_assignments": [],
+        "unfilled": [],
+        "flexible_days": {},
+        "stopped_by": None,
+        "stages": stages,
+    }
+    if best is None:
+        return result
+
+    values = best[0]
+    result.update(extract_solution(lambda var: values[var.index], x, y, data, meta))
+
+    record_phase("extract", time.perf_counter() - extract_start)
+    return result
+
+
+def _running(cancel, solver):
+    return cancel.running(solver) if cancel is not None else contextlib.nullcontext()
+
+
+def extract_solution(value, x, y, data, meta):
+    """Read a solution through `value` (CpSolver.value, or a solution
+    callback's value while it runs).
+
+    Returns {"assignments", "admin_assignments", "flexible_days", "unfilled"}.
+    """
     all_needs = meta["all_needs"]
+    solution = {
+        "assignments": [],
+        "admin_assignments": [],
+        "unfilled": [],
+        "flexible_days": {},
+    }
 
     # Extract assignments
+    filled_by_need = defaultdict(int)
     for (sid, ni), var in x.items():
-        if solver.value(var) == 1:
+        if value(var) == 1:
+            filled_by_need[ni] += 1
             need = all_needs[ni]
-            assignment = {
-                "id_block": need["id_block"],
-                "id_staff": sid,
-                "id_role": need["id_role"],
-                "id_skill": need.get("id_skill"),
-                "date": need["date"],
-                "period": need["period"],
-                "block_type": need["block_type"],
-                "department": need.get("department", "Admin"),
-                "site": need.get("site", "N/A"),
-                "skill_name": need.get("skill_name", "Admin"),
-                "role_name": need.get("role_name", "Standard"),
-                "_type": need["_type"],
-            }
-            if need["_type"] == "ADMIN":
-                result["admin_assignments"].append(assignment)
+            assignment = Assignment(
+                id_block=need.id_block,
+                id_staff=sid,
+                id_role=need.id_role,
+                id_skill=need.id_skill,
+                date=need.date,
+                period=need.period,
+                block_type=need.block_type,
+                department=need.department,
+                site=need.site,
+                skill_name=need.skill_name,
+                role_name=need.role_name,
+                kind=need.kind,
+            )
+            if need.kind == "ADMIN":
+                solution["admin_assignments"].append(assignment)
             else:
-                result["assignments"].append(assignment)
+                solution["assignments"].append(assignment)
 
     # Extract flexible day selections
     for (sid, d), var in y.items():
-        if solver.value(var) == 1:
-            if sid not in result["flexible_days"]:
-                result["flexible_days"][sid] = []
-            result["flexible_days"][sid].append(d)
+        if value(var) == 1:
+            if sid not in solution["flexible_days"]:
+                solution["flexible_days"][sid] = []
+            solution["flexible_days"][sid].append(d)
 
     # Find unfilled medical needs
-    for need in all_needs:
-        if need["_type"] != "MEDICAL":
+    solution["unfilled"] = unfilled_needs(meta, filled_by_need)
+
+    # Post-processing: link surgery secretaries to doctors
+    _link_surgery_secretaries(solution, data)
+
+    return solution
+
+
+def unfilled_needs(meta, filled_by_need):
+    """Medical needs filled fewer than `gap` times.
+
+    `filled_by_need` maps need index -> number of assigned secretaries.
+    """
+    unfilled = []
+    for need in meta["all_needs"]:
+        if need.kind != "MEDICAL":
             continue
-        ni = need["_index"]
+        ni = need.index
         eligible = meta["eligible_by_need"].get(ni, [])
-        filled = sum(
-            1 for sid in eligible if (sid, ni) in x and solver.value(x[(sid, ni)]) == 1
-        )
-        if filled < need["gap"]:
-            result["unfilled"].append(
+        filled = filled_by_need.get(ni, 0)
+        if filled < need.gap:
+            unfilled.append(
                 {
-                    "id_block": need["id_block"],
-                    "date": need["date"],
-                    "period": need["period"],
-                    "department": need.get("department"),
-                    "site": need.get("site"),
-                    "skill_name": need.get("skill_name"),
-                    "role_name": need.get("role_name"),
-                    "gap": need["gap"],
+                    "id_block": need.id_block,
+                    "date": need.date,
+                    "period": need.period,
+                    "department": need.department,
+                    "site": need.site,
+                    "skill_name": need.skill_name,
+                    "role_name": need.role_name,
+                    "gap": need.gap,
                     "filled": filled,
-                    "remaining": need["gap"] - filled,
+                    "remaining": need.gap - filled,
                     "eligible_count": len(eligible),
                 }
             )
-
-    # Post-processing: link surgery secretaries to doctors
-    _link_surgery_secretaries(result, data)
-
-    return result
+    return unfilled
 
 
 def _link_surgery_secretaries(result, data):
@@ -653,14 +977,11 @@ def _link_surgery_secretaries(result, data):
             block_skill_to_doctor[key] = da["id_assignment"]
 
     for a in result["assignments"]:
-        if a.get("block_type") != "SURGERY":
-            continue
-        id_skill = a.get("id_skill")
-        if id_skill is None:
+        if a.block_type != "SURGERY" or a.id_skill is None:
             continue
-        doctor_id = block_skill_to_doctor.get((a["id_block"], id_skill))
+        doctor_id = block_skill_to_doctor.get((a.id_block, a.id_skill))
         if doctor_id:
-            a["id_linked_doctor"] = doctor_id
+            a.id_linked_doctor = doctor_id
 
 
 def _to_date(val) -> date:
@@ -0,0 +1,287 @@
+"""Live progress of a running solve: improving solutions as events.
+
+SolutionMonitor is the CP-SAT solution callback: on every improving
+solution it builds a small event (objective, bound, medical needs filled,
+timestamps) and hands it to the listeners with a function that extracts
+the full solution. That function only works during the call, and is only
+called by listeners that need it (IncumbentWriter), so plain progress
+events stay cheap.
+"""
+
+import contextlib
+import threading
+import time
+from collections import defaultdict
+
+import psycopg2
+from ortools.sat.python import cp_model
+
+from lib.db import publish_run, stage_run
+from lib.model import extract_solution
+
+
+class SolutionMonitor(cp_model.CpSolverSolutionCallback):
+    """Publish every improving solution of a solve to `listeners`.
+
+    Each listener is called as listener(event, extract) from a CP-SAT
+    worker thread; it must return quickly.
+    """
+
+    def __init__(self, x, y, data, meta, listeners, week_start=None):
+        super().__init__()
+        self.x = x
+        self.y = y
+        self.data = data
+        self.meta = meta
+        self.listeners = listeners
+        self.week = week_start.isoformat() if week_start else None
+        self.medical_vars_by_staff = defaultdict(list)
+        for (sid, ni), var in x.items():
+            if meta["all_needs"][ni].kind == "MEDICAL":
+                self.medical_vars_by_staff[sid].append(var)
+        medical = [n for n in meta["all_needs"] if n.kind == "MEDICAL"]
+        self.needs = sum(n.gap for n in medical)
+        # Needs are capped by their eligible secretaries: the best possible fill
+        self.fillable = sum(
+            min(n.gap, len(meta["eligible_by_need"].get(n.index, []))) for n in medical
+        )
+        self.avg_load = meta["averages"]["workload"]
+        self.solutions = 0
+
+    def on_solution_callback(self):
+        self.solutions += 1
+        loads = [
+            sum(self.value(var) for var in variables)
+            for variables in self.medical_vars_by_staff.values()
+        ]
+        event = {
+            "event": "solution",
+            "week": self.week,
+            "solution": self.solutions,
+            "objective": self.objective_value,
+            "bound": self.best_objective_bound,
+            "filled": sum(loads),
+            "needs": self.needs,
+            "fillable": self.fillable,
+            # Largest distance of a secretary's medical load from the O9 target
+            "max_deviation": max(
+                (abs(load - self.avg_load) for load in loads), default=0
+            ) if self.avg_load is not None else None,
+            "wall_time": self.wall_time,
+            "timestamp": time.time(),
+        }
+
+        def extract():
+            return extract_solution(self.value, self.x, self.y, self.data, self.meta)
+
+        for listener in self.listeners:
+            listener(event, extract)
+
+
+def print_progress(event, _extract):
+    """Listener printing one progress line per improving solution."""
+    print(
+        f"  Solution {event['solution']}: objectif={event['objective']:.0f} "
+        f"(borne {event['bound']:.0f}), {event['filled']}/{event['needs']} besoins remplis "
+        f"après {event['wall_time']:.1f}s"
+    )
+
+
+class IncumbentWriter:
+    """Listener publishing the best solution so far as a solver run, at
+    most once every `interval` seconds, so a usable plan is in the database
+    long before the time limit.
+
+    Writes happen on a background thread (the callback must not wait on the
+    database); the final solution is still published by publish_week. Each
+    incumbent run replaces the previous one (publish_run(replaces=...)),
+    and publish_week replaces the last one, `run_id`: whether the solve
+    ends, fails or is cancelled, the week's rows are those of its PUBLISHED
+    run, and rollback_week goes back to the plan from before the solve.
+    With `slots`, only those half-days are written (see stage_run).
+    """
+
+    def __init__(self, conn, week_start, interval=5.0, slots=None):
+        self.conn = conn
+        self.week_start = week_start
+        self.interval = interval
+        self.slots = slots
+        self.written = 0
+        self.run_id = None
+        self._last = None
+        self._pending = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+        return False
+
+    def __call__(self, event, extract):
+        now = time.monotonic()
+        if self._last is not None and now - self._last < self.interval:
+            return
+        self._last = now
+        solution = extract()
+        with self._lock:
+            self._pending = (event, solution)
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                pending, self._pending = self._pending, None
+            if pending is not None:
+                event, solution = pending
+                try:
+                    run_id = stage_run(
+                        self.conn, self.week_start,
+                        solution["assignments"] + solution["admin_assignments"],
+                        slots=self.slots,
+                        solver_status="FEASIBLE",
+                        objective=event["objective"],
+                    )
+                    publish_run(self.conn, run_id, replaces=self.run_id)
+                except psycopg2.Error as e:
+                    # Not fatal: the final solution is written by publish_week
+                    self.conn.rollback()
+                    print(f"  Solution {event['solution']} non enregistrée: {e}")
+                else:
+                    self.run_id = run_id
+                    self.written += 1
+                    print(f"  Solution {event['solution']} enregistrée (run {run_id})")
+            if self._stop:
+                return
+
+
+class StopRule:
+    """Stopping criteria on top of the time limit.
+
+    - `relative_gap` / `absolute_gap`: CP-SAT stops once the objective is
+      that close to the bound (relative_gap_limit / absolute_gap_limit).
+    - `plateau`: stop when no better solution was found for that many
+      seconds (checked by a watchdog thread).
+    - `fill_all`: stop as soon as every fillable medical need is filled,
+      and, with `fairness_gap`, no secretary's medical load is further than
+      that from the O9 workload target.
+    - `target`: stop as soon as a solution's objective reaches it.
+
+    Used as a SolutionMonitor listener; solve_model calls start(solver)
+    before solving and finish() after. `reason` tells which rule fired.
+    """
+
+    def __init__(self, relative_gap=None, absolute_gap=None, plateau=None,
+                 fill_all=False, fairness_gap=None, target=None):
+        self.relative_gap = relative_gap
+        self.absolute_gap = absolute_gap
+        self.plateau = plateau
+        self.fill_all = fill_all
+        self.fairness_gap = fairness_gap
+        self.target = target
+        self.reason = None
+        self._solver = None
+        self._last_improvement = None
+        self._done = threading.Event()
+        self._watchdog = None
+
+    @property
+    def needs_callback(self):
+        return bool(self.plateau or self.fill_all or self.target is not None)
+
+    def start(self, solver):
+        self._solver = solver
+        if self.relative_gap is not None:
+            solver.parameters.relative_gap_limit = self.relative_gap
+        if self.absolute_gap is not None:
+            solver.parameters.absolute_gap_limit = self.absolute_gap
+        if self.plateau:
+            self._watchdog = threading.Thread(target=self._watch, daemon=True)
+            self._watchdog.start()
+
+    def finish(self, status_name=None, objective=None, bound=None):
+        self._done.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+        # CP-SAT reports OPTIMAL when a gap limit ends the search early
+        if self.reason is None and status_name in ("OPTIMAL", "FEASIBLE") and objective is not None:
+            gap = abs(bound - objective)
+            if gap == 0:
+                return
+            if self.absolute_gap is not None and gap <= self.absolute_gap:
+                self.reason = "gap"
+            elif self.relative_gap is not None and gap <= self.relative_gap * max(abs(bound), 1):
+                self.reason = "gap"
+
+    def __call__(self, event, _extract):
+        self._last_improvement = time.monotonic()
+        if self.target is not None and event["objective"] >= self.target:
+            self._stop("target")
+            return
+        if not self.fill_all or event["filled"] < event["fillable"]:
+            return
+        if self.fairness_gap is not None and (
+            event["max_deviation"] is None or event["max_deviation"] > self.fairness_gap
+        ):
+            return
+        self._stop("filled")
+
+    def _stop(self, reason):
+        if self.reason is None:
+            self.reason = reason
+            self._solver.stop_search()
+
+    def _watch(self):
+        while not self._done.wait(0.1):
+            last = self._last_improvement
+            if last is not None and time.monotonic() - last >= self.plateau:
+                self._stop("plateau")
+                return
+
+
+class SolveCancelled(Exception):
+    """Raised out of a solve stopped through a Cancellation."""
+
+
+class Cancellation:
+    """Cancels a solve from another thread (daemon jobs).
+
+    The solve functions run every CP-SAT search inside running(solver);
+    cancel() calls stop_search() on the searches in progress and makes
+    running() raise SolveCancelled, so nothing is published.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._solvers = set()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            for solver in self._solvers:
+                solver.stop_search()
+
+    @contextlib.contextmanager
+    def running(self, solver):
+        with self._lock:
+            if self.cancelled:
+                raise SolveCancelled()
+            self._solvers.add(solver)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._solvers.discard(solver)
+        # A cancel() just before the search started is not seen by CP-SAT
+        if self.cancelled:
+            raise SolveCancelled()
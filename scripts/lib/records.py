@@ -0,0 +1,90 @@
+"""Compact records of the solver's in-memory data.
+
+Needs, secretaries and assignments are created once per model or solution
+and read many times; a class with __slots__ stores them as fixed fields
+instead of a dict per object. Fields are read as attributes (need.gap,
+a.id_staff); as_dict() gives the plain dict for JSON documents and from_row()
+builds a record from a database or JSON row.
+
+Eligibility rows are stored by column instead (lib.eligibility).
+"""
+
+
+class Record:
+    """Base class: subclasses only list their fields in __slots__."""
+
+    __slots__ = ()
+
+    # Field -> key in rows and as_dict(), where they differ
+    ROW_KEYS = {}
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError(f"{type(self).__name__} has no field {', '.join(sorted(fields))}")
+
+    @classmethod
+    def from_row(cls, row):
+        """Record of the matching keys of a row (extra keys are ignored)."""
+        keys = cls.ROW_KEYS
+        return cls(**{
+            name: row[keys.get(name, name)]
+            for name in cls.__slots__ if keys.get(name, name) in row
+        })
+
+    @classmethod
+    def of(cls, value):
+        """`value` as a record: records are returned as they are."""
+        return value if isinstance(value, cls) else cls.from_row(value)
+
+    def as_dict(self):
+        return {self.ROW_KEYS.get(name, name): getattr(self, name) for name in self.__slots__}
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._values() == other._values()
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Need(Record):
+    """A need of the model: medical (one per (block, skill, role)) or admin.
+
+    `index` is its position in meta["all_needs"], `kind` "MEDICAL" or "ADMIN".
+    """
+
+    __slots__ = (
+        "index", "kind", "id_block", "date", "period", "block_type",
+        "id_department", "id_site", "id_skill", "id_role", "gap",
+        "department", "site", "skill_name", "role_name",
+    )
+
+
+class Secretary(Record):
+    """A secretary available in the week, with the settings the model uses."""
+
+    __slots__ = (
+        "id_staff", "lastname", "firstname", "is_flexible", "flexibility_pct",
+        "full_day_only", "admin_target",
+    )
+
+
+class Assignment(Record):
+    """A secretary assigned to a need in a solution (`kind` of the need)."""
+
+    __slots__ = (
+        "id_block", "id_staff", "id_role", "id_skill", "date", "period", "block_type",
+        "department", "site", "skill_name", "role_name", "kind", "id_linked_doctor",
+    )
+
+    # Key of result documents (lib.report.result_document)
+    ROW_KEYS = {"kind": "_type"}
@@ -1,19 +1,18 @@
-"""Console report for secretary assignment results."""
+"""Console report and JSON result document for secretary assignment results."""
 
 from collections import defaultdict
 
+EVITER_WEIGHT = 3  # Must match model.py
 
-def print_report(data, result, availability):
-    """Print a summary report of the assignment results."""
-    secretaries = {s["id_staff"]: s for s in data["secretaries"]}
-    role_weight = {r["id_role"]: r.get("hardship_weight", 1) for r in data["roles"]}
 
-    print(f"\n{'='*60}")
-    print(f"  Assignation Secrétaires")
-    print(f"{'='*60}")
-    print(f"Solver: {result['status']} en {result['wall_time']:.1f}s")
-    if result["objective"] is not None:
-        print(f"Objectif: {result['objective']:.0f}")
+def summarize_result(data, result, availability):
+    """Compute the report statistics of a solver result.
+
+    Returns {"summary", "secretaries", "site_continuity", "eviter_violations",
+    "no_skills"}, shared by print_report and result_document.
+    """
+    secretaries = {s.id_staff: s for s in data["secretaries"]}
+    role_weight = {r["id_role"]: r.get("hardship_weight", 1) for r in data["roles"]}
 
     # Summary counts
     total_medical_needs = sum(n["gap"] for n in data["needs"])
@@ -21,17 +20,6 @@ def print_report(data, result, availability):
     unfilled_count = sum(u["remaining"] for u in result["unfilled"])
     admin_count = len(result["admin_assignments"])
 
-    print(f"\nBesoins médicaux: {total_medical_needs} total | {filled} remplis | {unfilled_count} non remplis")
-    print(f"Assignations admin: {admin_count}")
-    print(f"Total assignations: {filled + admin_count}")
-
-    # Per-secretary breakdown
-    print(f"\n--- Par secrétaire ---")
-    print(f"{'Nom':<25} {'Méd':>4} {'Admin':>5} {'Cible':>5} {'Total':>5} {'Pénib':>5}  Status")
-    print("-" * 80)
-
-    EVITER_WEIGHT = 3  # Must match model.py
-
     # Count assignments per secretary
     medical_by_staff = defaultdict(int)
     admin_by_staff = defaultdict(int)
@@ -39,11 +27,11 @@ def print_report(data, result, availability):
     eviter_violations = []
 
     for a in result["assignments"]:
-        medical_by_staff[a["id_staff"]] += 1
-        hardship_by_staff[a["id_staff"]] += int(role_weight.get(a["id_role"], 0))
+        medical_by_staff[a.id_staff] += 1
+        hardship_by_staff[a.id_staff] += int(role_weight.get(a.id_role, 0))
 
     for a in result["admin_assignments"]:
-        admin_by_staff[a["id_staff"]] += 1
+        admin_by_staff[a.id_staff] += 1
 
     # Site continuity stats
     site_same = 0
@@ -53,13 +41,13 @@ def print_report(data, result, availability):
     staff_day_admin = defaultdict(lambda: defaultdict(bool))  # sid -> date -> has_admin
 
     for a in result["assignments"]:
-        sid = a["id_staff"]
-        d = a["date"]
-        site = a.get("site", "?")
+        sid = a.id_staff
+        d = a.date
+        site = a.site
         staff_day_sites[sid][d].add(site)
 
     for a in result["admin_assignments"]:
-        staff_day_admin[a["id_staff"]][a["date"]] = True
+        staff_day_admin[a.id_staff][a.date] = True
 
     for sid, days in staff_day_sites.items():
         for d, sites in days.items():
@@ -87,8 +75,8 @@ def print_report(data, result, availability):
     eviter_by_staff = defaultdict(int)
 
     for a in result["assignments"]:
-        sid = a["id_staff"]
-        block_need = need_lookup.get(a["id_block"], {})
+        sid = a.id_staff
+        block_need = need_lookup.get(a.id_block, {})
         assignment_site_id = block_need.get("id_site")
         assignment_dept_id = block_need.get("id_department")
 
@@ -107,50 +95,164 @@ def print_report(data, result, availability):
                 sec = secretaries[sid]
                 eviter_by_staff[sid] += 1
                 eviter_violations.append({
-                    "name": f"{sec['lastname']} {sec['firstname']}",
+                    "id_staff": sid,
+                    "name": f"{sec.lastname} {sec.firstname}",
                     "target": target_name,
-                    "date": a["date"],
-                    "period": a["period"],
+                    "date": a.date,
+                    "period": a.period,
                 })
 
-    for sec in sorted(data["secretaries"], key=lambda s: s["lastname"]):
-        sid = sec["id_staff"]
+    per_secretary = []
+    for sec in sorted(data["secretaries"], key=lambda s: s.lastname):
+        sid = sec.id_staff
         med = medical_by_staff.get(sid, 0)
         adm = admin_by_staff.get(sid, 0)
-        target = sec["admin_target"]
-        total = med + adm
         hardship = hardship_by_staff.get(sid, 0)
         eviter_count = eviter_by_staff.get(sid, 0)
-        penibilite = hardship + eviter_count * EVITER_WEIGHT
+
+        flex_days = None
+        available_days = None
+        if sec.is_flexible:
+            flex_days = len(result["flexible_days"].get(sid, []))
+            available_days = sum(
+                1 for periods in availability.get(sid, {}).values() if periods
+            )
+
+        per_secretary.append({
+            "id_staff": sid,
+            "name": f"{sec.lastname} {sec.firstname}",
+            "medical": med,
+            "admin": adm,
+            "admin_target": sec.admin_target,
+            "total": med + adm,
+            "penibilite": hardship + eviter_count * EVITER_WEIGHT,
+            "eviter": eviter_count,
+            "is_flexible": sec.is_flexible,
+            "flexible_days": flex_days,
+            "available_days": available_days,
+        })
+
+    # Secretaries with no skills (inactive)
+    staff_with_skills = {sk["id_staff"] for sk in data["skills"]}
+    no_skills = [
+        {"id_staff": s.id_staff, "name": f"{s.lastname} {s.firstname}"}
+        for s in data["secretaries"]
+        if s.id_staff not in staff_with_skills
+    ]
+
+    return {
+        "summary": {
+            "medical_needs": total_medical_needs,
+            "filled": filled,
+            "unfilled": unfilled_count,
+            "admin": admin_count,
+            "total": filled + admin_count,
+        },
+        "secretaries": per_secretary,
+        "site_continuity": {
+            "same_site_days": site_same,
+            "cross_site_days": site_cross,
+            "medical_admin_days": site_admin_half,
+        },
+        "eviter_violations": eviter_violations,
+        "no_skills": no_skills,
+    }
+
+
+def result_document(week_start, data, result, availability):
+    """JSON-serializable document of a solved week (--output json, daemon).
+
+    Dates are ISO strings; flexible_days is keyed by id_staff as a string.
+    """
+    stats = summarize_result(data, result, availability)
+
+    def iso(value):
+        return value.isoformat() if hasattr(value, "isoformat") else value
+
+    def rows(items):
+        return [{k: iso(v) for k, v in item.items()} for item in items]
+
+    return {
+        "week": iso(week_start),
+        "status": result["status"],
+        "objective": result["objective"],
+        "best_bound": result.get("best_bound"),
+        "wall_time": result["wall_time"],
+        "stopped_by": result.get("stopped_by"),
+        "cached": result.get("cached", False),
+        "stages": result.get("stages"),
+        "written": result.get("written"),
+        **stats,
+        "eviter_violations": rows(stats["eviter_violations"]),
+        "assignments": rows(a.as_dict() for a in result["assignments"]),
+        "admin_assignments": rows(a.as_dict() for a in result["admin_assignments"]),
+        "unfilled": rows(result["unfilled"]),
+        "flexible_days": {
+            str(sid): sorted(iso(d) for d in days)
+            for sid, days in result["flexible_days"].items()
+        },
+        "infeasibility": result.get("infeasibility") and {
+            "precheck": rows(result["infeasibility"]["precheck"]),
+            "conflict": result["infeasibility"]["conflict"],
+        },
+        "metrics": result.get("metrics"),
+    }
+
+
+def print_report(data, result, availability):
+    """Print a summary report of the assignment results."""
+    stats = summarize_result(data, result, availability)
+    summary = stats["summary"]
+
+    print(f"\n{'='*60}")
+    print(f"  Assignation Secrétaires")
+    print(f"{'='*60}")
+    print(f"Solver: {result['status']} en {result['wall_time']:.1f}s")
+    if result["objective"] is not None:
+        print(f"Objectif: {result['objective']:.0f}")
+
+    print(
+        f"\nBesoins médicaux: {summary['medical_needs']} total | "
+        f"{summary['filled']} remplis | {summary['unfilled']} non remplis"
+    )
+    print(f"Assignations admin: {summary['admin']}")
+    print(f"Total assignations: {summary['total']}")
+
+    # Per-secretary breakdown
+    print(f"\n--- Par secrétaire ---")
+    print(f"{'Nom':<25} {'Méd':>4} {'Admin':>5} {'Cible':>5} {'Total':>5} {'Pénib':>5}  Status")
+    print("-" * 80)
+
+    for sec in stats["secretaries"]:
+        target = sec["admin_target"]
 
         status_parts = []
         if sec["is_flexible"]:
-            flex_days = result["flexible_days"].get(sid, [])
-            unique_avail = set()
-            for d, periods in availability.get(sid, {}).items():
-                if periods:
-                    unique_avail.add(d)
-            status_parts.append(f"Flex: {len(flex_days)}/{len(unique_avail)}j")
+            status_parts.append(f"Flex: {sec['flexible_days']}/{sec['available_days']}j")
 
         if target > 0:
-            if adm >= target:
+            if sec["admin"] >= target:
                 status_parts.append(f"Admin OK")
             else:
-                status_parts.append(f"Admin {adm}/{target} !")
+                status_parts.append(f"Admin {sec['admin']}/{target} !")
 
-        if eviter_by_staff.get(sid, 0) > 0:
-            status_parts.append(f"EVITER x{eviter_by_staff[sid]}")
+        if sec["eviter"] > 0:
+            status_parts.append(f"EVITER x{sec['eviter']}")
 
         target_str = str(target) if target > 0 else "-"
         status_str = ", ".join(status_parts) if status_parts else ""
 
-        print(f"{sec['lastname'] + ' ' + sec['firstname']:<25} {med:>4} {adm:>5} {target_str:>5} {total:>5} {penibilite:>5d}  {status_str}")
+        print(
+            f"{sec['name']:<25} {sec['medical']:>4} {sec['admin']:>5} {target_str:>5} "
+            f"{sec['total']:>5} {sec['penibilite']:>5d}  {status_str}"
+        )
 
     # Site continuity summary
+    continuity = stats["site_continuity"]
     print(f"\n--- Continuité site ---")
-    print(f"  Même site AM/PM: {site_same} jours")
-    print(f"  Changement site: {site_cross} jours")
-    print(f"  Médical + admin: {site_admin_half} jours")
+    print(f"  Même site AM/PM: {continuity['same_site_days']} jours")
+    print(f"  Changement site: {continuity['cross_site_days']} jours")
+    print(f"  Médical + admin: {continuity['medical_admin_days']} jours")
 
     # Unfilled needs
     if result["unfilled"]:
@@ -163,19 +265,15 @@ def print_report(data, result, availability):
             )
 
     # EVITER violations
+    eviter_violations = stats["eviter_violations"]
     if eviter_violations:
         print(f"\n--- Violations EVITER ({len(eviter_violations)}) ---")
         for v in sorted(eviter_violations, key=lambda v: (str(v["date"]), v["period"])):
             print(f"  {v['name']} -> {v['target']} ({v['date']} {v['period']})")
 
-    # Secretaries with no skills (inactive)
-    no_skills = [
-        s for s in data["secretaries"]
-        if not any(sk["id_staff"] == s["id_staff"] for sk in data["skills"])
-    ]
-    if no_skills:
-        print(f"\n--- Secrétaires sans skills ({len(no_skills)}) ---")
-        for s in no_skills:
-            print(f"  {s['lastname']} {s['firstname']} (id={s['id_staff']})")
+    if stats["no_skills"]:
+        print(f"\n--- Secrétaires sans skills ({len(stats['no_skills'])}) ---")
+        for s in stats["no_skills"]:
+            print(f"  {s['name']} (id={s['id_staff']})")
 
     print()
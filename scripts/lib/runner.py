@@ -0,0 +1,655 @@
+"""Solver pipeline shared by the CLI and the solver daemon.
+
+A week goes through three steps: prepare_week (DB reads), compute_week
+(model build + solve, no DB access, safe to run in a worker process) and
+publish_week (report + DB write).
+"""
+
+import contextlib
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from collections import defaultdict
+
+from lib.db import (
+    load_week_data,
+    load_reference_data,
+    create_admin_blocks,
+    load_admin_blocks,
+    load_previous_assignments,
+    load_published_run,
+    stage_run,
+    publish_run,
+    rollback_week,
+    week_lock,
+)
+from lib.model import (
+    build_model,
+    solve_model,
+    solve_staged,
+    add_solution_hints,
+    fix_outside_window,
+    compare_site_models,
+    model_stats,
+)
+from lib.metrics import RunMetrics, collect, phase, record_model
+from lib.decompose import solve_decomposed
+from lib.feasibility import precheck, diagnose as diagnose_conflict
+from lib.progress import SolutionMonitor, IncumbentWriter, StopRule
+from lib.report import print_report, result_document
+from lib.snapshot import save_instance, load_instance, record_path
+from lib.cache import instance_fingerprint
+
+
+# Default time limit of a repair: only a few half-days are free
+REPAIR_TIME_LIMIT = 2
+
+STOP_REASONS = {
+    "gap": "écart à la borne atteint",
+    "plateau": "plus d'amélioration",
+    "filled": "besoins remplis",
+    "target": "objectif du planning actuel atteint",
+}
+
+
+def parse_week(value) -> date:
+    """Parse a week start and check it is a Monday."""
+    week_start = value if isinstance(value, date) else date.fromisoformat(value)
+    if week_start.weekday() != 0:
+        raise ValueError(
+            f"{week_start} is not a Monday (weekday={week_start.weekday()})"
+        )
+    return week_start
+
+
+def build_availability_map(data):
+    """Build availability map from v_secretary_availability rows.
+
+    Returns: {staff_id: {date: set('AM','PM')}}
+    """
+    availability = defaultdict(lambda: defaultdict(set))
+    for row in data["availability"]:
+        sid = row["id_staff"]
+        d = row["date"]
+        if isinstance(d, str):
+            d = date.fromisoformat(d)
+        availability[sid][d].add(row["period"])
+    return dict(availability)
+
+
+def repair_window(dates, period=None):
+    """Half-days re-optimized by a repair: `dates` (ISO strings or dates),
+    both periods unless `period` is given.
+
+    Returns (week_start, {(date, period)}); raises ValueError when the
+    dates are not in the same week.
+    """
+    days = sorted({d if isinstance(d, date) else date.fromisoformat(d) for d in dates})
+    week_start = days[0] - timedelta(days=days[0].weekday())
+    if days[-1] > week_start + timedelta(days=6):
+        raise ValueError(f"{days[0]} and {days[-1]} are not in the same week")
+    periods = [period] if period else ["AM", "PM"]
+    return week_start, {(d, p) for d in days for p in periods}
+
+
+def week_range(first: date, last: date = None, count: int = None):
+    """Mondays from `first` to `last` inclusive, or `count` weeks from `first`."""
+    if count is None:
+        count = (last - first).days // 7 + 1 if last is not None else 1
+    return [first + timedelta(weeks=i) for i in range(count)]
+
+
+def load_hints(conn, week_start: date, hint_previous_week=False):
+    """Previous solver assignments to warm-start the week with.
+
+    The week's own ALGORITHM rows come first; with `hint_previous_week` the
+    previous week's rows, shifted by 7 days, fill the slots they leave open.
+    """
+    hints = list(load_previous_assignments(conn, week_start))
+    if hint_previous_week:
+        for row in load_previous_assignments(conn, week_start - timedelta(weeks=1)):
+            row = dict(row)
+            row["id_block"] = None  # blocks differ between weeks: match by pattern
+            row["date"] = row["date"] + timedelta(weeks=1)
+            hints.append(row)
+    return hints
+
+
+def prepare_week(conn, week_start: date, reference=None, reference_cache=None,
+                 warm_start=False, hint_previous_week=False):
+    """Load the model inputs for one week.
+
+    The week's current SCHEDULE/ALGORITHM rows stay in place until
+    publish_week replaces them. Returns an instance dict: {week_start, data,
+    availability, admin_blocks, hints}.
+    """
+    hints = []
+    if warm_start or hint_previous_week:
+        with phase("load_hints"):
+            hints = load_hints(conn, week_start, hint_previous_week=hint_previous_week)
+        print(f"Warm start: {len(hints)} assignations précédentes chargées")
+
+    # Load all data
+    print("Chargement des données...")
+    with phase("load_week_data"):
+        data = load_week_data(
+            conn, week_start, reference=reference, reference_cache=reference_cache
+        )
+    print(
+        f"  {len(data['secretaries'])} secrétaires, "
+        f"{len(data['needs'])} besoins (gap>0), "
+        f"{len(data['eligibility'])} éligibilités, "
+        f"{len(data['availability'])} disponibilités"
+    )
+
+    # Check admin department exists
+    if data["admin_dept_id"] is None:
+        raise ValueError(
+            "Département 'Administration' non trouvé! "
+            "Exécutez: node run-sql.js prepare-admin-blocks.sql"
+        )
+
+    # Create admin blocks for the week
+    with phase("create_admin_blocks"):
+        created = create_admin_blocks(conn, week_start, data["admin_dept_id"])
+    if created:
+        print(f"  {len(created)} blocs ADMIN créés")
+
+    # Load admin blocks
+    with phase("load_admin_blocks"):
+        admin_blocks = load_admin_blocks(conn, week_start)
+    print(f"  {len(admin_blocks)} blocs ADMIN pour la semaine")
+
+    # Build availability map from view data
+    print("Construction de la carte de disponibilité...")
+    availability = build_availability_map(data)
+
+    # Count available slots
+    total_slots = 0
+    for sid, days in availability.items():
+        for d, periods in days.items():
+            total_slots += len(periods)
+    print(f"  {total_slots} demi-journées disponibles au total")
+
+    return {
+        "week_start": week_start,
+        "data": data,
+        "availability": availability,
+        "admin_blocks": admin_blocks,
+        "hints": hints,
+    }
+
+
+def compute_week(instance, time_limit=30, num_workers=4, site_model="pairwise",
+                 compare_sites=False, decompose=False, balance="global", verbose=False,
+                 relative_gap=None, absolute_gap=None, plateau=None, stop_when_filled=False,
+                 fairness_gap=None, staged=False, diagnose=False, repair=None,
+                 listeners=None, cancel=None):
+    """Build and solve the CP-SAT model for a prepared week (no DB access).
+
+    Keyword arguments are the "solve options" that solve_week, solve_weeks
+    and the daemon pass through. The result carries the phase timings and
+    model size of this step in result["metrics"].
+
+    `relative_gap`, `absolute_gap`, `plateau`, `stop_when_filled` and
+    `fairness_gap` stop the solve before the time limit (see
+    lib.progress.StopRule). `listeners` receive every improving solution;
+    they are not picklable, so only in-process callers pass them. Both are
+    ignored with `decompose`. `staged` solves the fill, quality and fairness
+    objectives in turn (lib.model.solve_staged; no early stopping).
+    `repair` (a set of (date, period)) fixes everything outside those
+    half-days to the current plan, given as the instance's hints, and only
+    re-optimizes inside them (not with `decompose`); it stops as soon as it
+    reaches the instance's "previous_objective" (the plan's, when known). `cancel`
+    (lib.progress.Cancellation) stops the solve from another thread: it
+    then raises lib.progress.SolveCancelled.
+
+    The week is checked for obvious hard-constraint conflicts before
+    solving (lib.feasibility.precheck): on conflict nothing is solved and
+    the result is INFEASIBLE. With `diagnose`, a week left without solution
+    is searched for a minimal set of conflicting constraint groups.
+    result["infeasibility"] holds both findings when there is no solution.
+    """
+    data = instance["data"]
+    metrics = RunMetrics(instance["week_start"])
+
+    with collect(metrics):
+        if compare_sites:
+            with phase("compare_site_models"):
+                stats = compare_site_models(data, instance["availability"], instance["admin_blocks"])
+            print("Taille du modèle par encodage O3:")
+            for name, st in stats.items():
+                print(
+                    f"  {name:<9} {st['variables']:>7} variables {st['constraints']:>7} contraintes"
+                    f"  (O3: {st['o3_variables']} variables, {st['o3_constraints']} contraintes)"
+                )
+
+        # Build CP-SAT model
+        print("Construction du modèle CP-SAT...")
+        with phase("build_model"):
+            model, x, y, meta = build_model(
+                data, instance["availability"], instance["admin_blocks"],
+                site_model=site_model,
+                verbose=verbose,
+            )
+        record_model(
+            **model_stats(model),
+            x_variables=len(x),
+            y_variables=len(y),
+            eligibility_rows=len(data["eligibility"]),
+            secretaries=len(data["secretaries"]),
+        )
+
+        with phase("precheck"):
+            issues = precheck(x, y, data, meta, instance["availability"])
+        if issues:
+            print(f"Pré-vérification: {len(issues)} conflit(s) entre contraintes dures, résolution annulée")
+            for issue in issues:
+                who = f"{issue['name']}: " if issue["name"] else ""
+                print(f"  [{issue['rule']}] {who}{issue['message']}")
+            result = {
+                "status": "INFEASIBLE",
+                "objective": None,
+                "best_bound": None,
+                "wall_time": 0.0,
+                "assignments": [],
+                "admin_assignments": [],
+                "unfilled": [],
+                "flexible_days": {},
+                "stopped_by": None,
+            }
+        elif decompose:
+            print(f"Résolution par composantes (time limit: {time_limit}s, équilibrage: {balance})...")
+            # Component solves run on their own threads: timed as one phase
+            with phase("solve"):
+                result = solve_decomposed(
+                    data, instance["availability"], instance["admin_blocks"], model, x, y, meta,
+                    time_limit=time_limit,
+                    num_workers=num_workers,
+                    site_model=site_model,
+                    balance=balance,
+                    hints=instance.get("hints"),
+                    verbose=verbose,
+                    cancel=cancel,
+                )
+        else:
+            if repair:
+                with phase("fix_outside_window"):
+                    kept = fix_outside_window(model, x, y, meta, instance["hints"], repair)
+                print(f"Réparation: {kept} assignations conservées hors des demi-journées à refaire")
+            if instance.get("hints"):
+                with phase("add_hints"):
+                    # In a repair everything outside the window is fixed:
+                    # completing the hint would cost a solve for nothing
+                    hinted = add_solution_hints(
+                        model, x, y, meta, instance["hints"], complete=not repair,
+                    )
+                print(f"  {hinted} assignations utilisées comme point de départ")
+
+            if staged:
+                print(f"Résolution par étapes remplissage > qualité > équité (time limit: {time_limit}s)...")
+                monitor = None
+                if listeners:
+                    monitor = SolutionMonitor(
+                        x, y, data, meta, listeners, week_start=instance["week_start"]
+                    )
+                result = solve_staged(
+                    model, x, y, data, meta,
+                    time_limit=time_limit,
+                    num_workers=num_workers,
+                    verbose=verbose,
+                    callback=monitor,
+                    cancel=cancel,
+                )
+                for stage in result["stages"]:
+                    value = f"{stage['objective']:.0f}" if stage["objective"] is not None else "-"
+                    print(
+                        f"  Étape {stage['stage']}: {stage['status']} objectif={value} "
+                        f"en {stage['wall_time']:.1f}s"
+                    )
+            else:
+                # Solve
+                print(f"Résolution (time limit: {time_limit}s)...")
+                stop = None
+                # A repair is done once it is as good as the plan it repairs
+                target = instance.get("previous_objective") if repair else None
+                if relative_gap is not None or absolute_gap is not None or plateau \
+                        or stop_when_filled or target is not None:
+                    stop = StopRule(
+                        relative_gap=relative_gap,
+                        absolute_gap=absolute_gap,
+                        plateau=plateau,
+                        fill_all=stop_when_filled,
+                        fairness_gap=fairness_gap,
+                        target=target,
+                    )
+                listeners = list(listeners or [])
+                if stop is not None and stop.needs_callback:
+                    listeners.append(stop)
+                monitor = None
+                if listeners:
+                    monitor = SolutionMonitor(
+                        x, y, data, meta, listeners, week_start=instance["week_start"]
+                    )
+                result = solve_model(
+                    model, x, y, data, meta,
+                    time_limit=time_limit,
+                    num_workers=num_workers,
+                    verbose=verbose,
+                    callback=monitor,
+                    stop=stop,
+                    cancel=cancel,
+                )
+                if result["stopped_by"]:
+                    print(f"  Arrêt anticipé ({STOP_REASONS[result['stopped_by']]}) après {result['wall_time']:.1f}s")
+
+        result["infeasibility"] = None
+        if result["status"] not in ("OPTIMAL", "FEASIBLE"):
+            conflict = None
+            if diagnose:
+                print("Diagnostic: recherche d'un ensemble minimal de contraintes en conflit...")
+                with phase("diagnose"):
+                    conflict = diagnose_conflict(
+                        data, instance["availability"], instance["admin_blocks"],
+                        time_limit=time_limit,
+                    )
+                if conflict is None:
+                    print("  Aucun conflit prouvé dans le temps imparti")
+                for group in conflict or []:
+                    who = group["name"] or group["need"]
+                    print(f"  [{group['rule']}] {group['description']}: {who}")
+            result["infeasibility"] = {"precheck": issues, "conflict": conflict}
+
+    metrics.status = result["status"]
+    result["metrics"] = metrics.to_dict()
+    return result
+
+
+def record_instance(instance, path):
+    """Save a prepared week for --replay (see lib.snapshot)."""
+    path = record_path(path, instance["week_start"])
+    size = save_instance(path, instance)
+    print(f"  Semaine enregistrée dans {path} ({size / 1024:.0f} Ko)")
+
+
+def lookup_result(result_cache, instance, solve_options):
+    """Fingerprint a prepared week and look it up in `result_cache`.
+
+    Returns (fingerprint, stored result or None).
+    """
+    with phase("fingerprint"):
+        fingerprint = instance_fingerprint(instance, solve_options)
+    result = result_cache.get(instance["week_start"], fingerprint)
+    if result is not None:
+        print(f"  Données inchangées depuis le dernier calcul ({fingerprint[:12]}): résultat réutilisé")
+        result["cached"] = True
+    return fingerprint, result
+
+
+def publish_week(conn, instance, result, dry_run=False, slots=None, replaces=None,
+                 fingerprint=None):
+    """Print the report and write the solution (only the `slots` half-days
+    when given) as a solver run: staged first, then swapped into the week
+    in one short transaction (see lib.db.stage_run and publish_run).
+    `replaces` is the run of the solve's last published incumbent.
+
+    A result from the result cache (result["cached"]) whose `fingerprint`
+    is already the week's PUBLISHED run's is not written again: repeated
+    runs on an unchanged week would otherwise push the real previous plan
+    out of the rollback history.
+
+    Returns the publish_run() counts, or None when nothing was written
+    (dry run or no solution: the week keeps its previous plan).
+    """
+    with phase("report"):
+        print_report(instance["data"], result, instance["availability"])
+
+    if result["status"] not in ("OPTIMAL", "FEASIBLE"):
+        print(f"Pas de solution trouvée (status={result['status']}), planning précédent conservé")
+        return None
+
+    all_assignments = result["assignments"] + result["admin_assignments"]
+    if dry_run:
+        print(f"[DRY RUN] {len(all_assignments)} assignations NON écrites")
+        return None
+
+    if result.get("cached") and fingerprint is not None:
+        published = load_published_run(conn, instance["week_start"])
+        if published is not None and published["fingerprint"] == fingerprint:
+            print(f"Run {published['id_run']} déjà publié avec ce résultat: rien à écrire")
+            return {
+                "inserted": 0, "updated": 0, "deleted": 0,
+                "unchanged": len(all_assignments), "run": published["id_run"],
+            }
+
+    with phase("stage_run"):
+        run_id = stage_run(
+            conn, instance["week_start"], all_assignments,
+            slots=slots,
+            solver_status=result["status"],
+            objective=result["objective"],
+            fingerprint=fingerprint,
+        )
+    with phase("publish_run"):
+        written = publish_run(conn, run_id, replaces=replaces)
+    print(
+        f"Écriture du run {run_id} (source=ALGORITHM, status=PROPOSED): "
+        f"{written['inserted']} insérées, {written['updated']} modifiées, "
+        f"{written['deleted']} supprimées, {written['unchanged']} inchangées"
+    )
+    return written
+
+
+def restore_previous_run(conn, week_start: date):
+    """Publish the week's previous solver run again, without solving
+    (lib.db.rollback_week), under the week's lock.
+
+    Returns a result with "written", "metrics" and the document
+    {"week", "status": "ROLLED_BACK", "written"}.
+    """
+    metrics = RunMetrics(week_start)
+    with collect(metrics), week_lock(conn, week_start):
+        with phase("rollback_week"):
+            written = rollback_week(conn, week_start)
+    print(
+        f"Semaine {week_start}: run {written['run']} restauré, "
+        f"{written['inserted']} insérées, {written['updated']} modifiées, "
+        f"{written['deleted']} supprimées, {written['unchanged']} inchangées"
+    )
+    metrics.status = "ROLLED_BACK"
+    return {
+        "written": written,
+        "metrics": metrics.to_dict(),
+        "document": {"week": week_start.isoformat(), "status": "ROLLED_BACK", "written": written},
+    }
+
+
+def solve_week(conn, week_start: date, dry_run=False, reference_cache=None,
+               warm_start=False, hint_previous_week=False, listeners=(),
+               persist_every=None, record=None, result_cache=None, repair=None,
+               **solve_options):
+    """Run the full pipeline for one week and return the solver result.
+
+    `solve_options` are passed to compute_week. result["metrics"] holds the
+    timings of every phase and query of the run (see lib.metrics) and
+    result["document"] the JSON result document (see lib.report).
+
+    `listeners` are called on every improving solution; with
+    `persist_every` (seconds) the best solution so far is also published
+    as a solver run while the solver runs (see lib.progress.IncumbentWriter).
+
+    With `record` (a path, "{week}" is replaced by the Monday) the loaded
+    week is saved for replay_week. With `result_cache` (lib.cache.ResultCache)
+    a week whose inputs are unchanged since its last run is not solved again:
+    the stored result is published instead, unless it already is.
+
+    `repair` (see repair_window) re-optimizes only those half-days around
+    the week's current plan and writes only them.
+
+    Unless `dry_run`, the run holds the week's advisory lock (see
+    lib.db.week_lock) and raises WeekLocked if another session holds it.
+    """
+    week_end = week_start + timedelta(days=6)
+    print(f"Semaine: {week_start} -> {week_end}")
+
+    if repair:
+        # The current plan is loaded as hints; the result depends on it, so
+        # it cannot come from the result cache
+        warm_start = True
+        hint_previous_week = False
+        result_cache = None
+        solve_options["repair"] = repair
+
+    # Dry runs write nothing: they do not need the week to themselves
+    with week_lock(conn, week_start) if not dry_run else contextlib.nullcontext():
+        metrics = RunMetrics(week_start)
+        with collect(metrics):
+            instance = prepare_week(
+                conn, week_start,
+                reference_cache=reference_cache,
+                warm_start=warm_start,
+                hint_previous_week=hint_previous_week,
+            )
+            if repair:
+                published = load_published_run(conn, week_start)
+                instance["previous_objective"] = published["objective"] if published else None
+            fingerprint = result = None
+            if result_cache is not None:
+                fingerprint, result = lookup_result(result_cache, instance, solve_options)
+        if record:
+            record_instance(instance, record)
+        writer = None
+        if result is None:
+            listeners = list(listeners)
+            if persist_every and not dry_run:
+                writer = IncumbentWriter(conn, week_start, interval=persist_every, slots=repair)
+                listeners.append(writer)
+            with writer or contextlib.nullcontext():
+                result = compute_week(instance, listeners=listeners, **solve_options)
+            metrics.merge(result["metrics"])
+            if result_cache is not None:
+                result_cache.put(week_start, fingerprint, result)
+        else:
+            metrics.status = result["status"]
+        with collect(metrics):
+            result["written"] = publish_week(
+                conn, instance, result, dry_run=dry_run, slots=repair,
+                replaces=writer.run_id if writer is not None else None,
+                fingerprint=fingerprint,
+            )
+        result["metrics"] = metrics.to_dict()
+        result["document"] = result_document(
+            week_start, instance["data"], result, instance["availability"]
+        )
+    return result
+
+
+def solve_weeks(conn, weeks, dry_run=False, jobs=None, reference_cache=None,
+                warm_start=False, hint_previous_week=False, record=None,
+                result_cache=None, **solve_options):
+    """Solve several weeks, building and solving models in a process pool.
+
+    Reference data is loaded once. Weeks are prepared sequentially on `conn`
+    (DB access stays in this process) and submitted as soon as they are
+    loaded; results are reported and written as each solve finishes. Weeks
+    found in `result_cache` are published without being solved. Unless
+    `dry_run`, every week's advisory lock is held for the whole batch.
+
+    Returns {week_start: result}, results shaped like solve_week's.
+    """
+    cpus = os.cpu_count() or 1
+    jobs = jobs or min(len(weeks), cpus)
+    # Split the cores between concurrent solves instead of oversubscribing them
+    solve_options["num_workers"] = max(1, cpus // jobs)
+    print(
+        f"{len(weeks)} semaines: {weeks[0]} -> {weeks[-1]} "
+        f"({jobs} processus x {solve_options['num_workers']} workers CP-SAT)"
+    )
+
+    print("Chargement des données de référence...")
+    if reference_cache is not None:
+        reference = reference_cache.refresh(conn)
+    else:
+        reference = load_reference_data(conn)["tables"]
+
+    results = {}
+
+    def finish(instance, metrics, result, fingerprint):
+        week_start = instance["week_start"]
+        print(f"\n### Semaine {week_start} ###")
+        with collect(metrics):
+            result["written"] = publish_week(
+                conn, instance, result, dry_run=dry_run, fingerprint=fingerprint,
+            )
+        result["metrics"] = metrics.to_dict()
+        result["document"] = result_document(
+            week_start, instance["data"], result, instance["availability"]
+        )
+        results[week_start] = result
+
+    with contextlib.ExitStack() as locks, ProcessPoolExecutor(max_workers=jobs) as pool:
+        if not dry_run:
+            for week_start in weeks:
+                locks.enter_context(week_lock(conn, week_start))
+        pending = {}
+        unchanged = []
+        for week_start in weeks:
+            print(f"\nSemaine: {week_start} -> {week_start + timedelta(days=6)}")
+            metrics = RunMetrics(week_start)
+            with collect(metrics):
+                instance = prepare_week(
+                    conn, week_start,
+                    reference=reference,
+                    warm_start=warm_start,
+                    hint_previous_week=hint_previous_week,
+                )
+                fingerprint = result = None
+                if result_cache is not None:
+                    fingerprint, result = lookup_result(result_cache, instance, solve_options)
+            if record:
+                record_instance(instance, record)
+            if result is not None:
+                metrics.status = result["status"]
+                unchanged.append((instance, metrics, result, fingerprint))
+                continue
+            future = pool.submit(compute_week, instance, **solve_options)
+            pending[future] = (instance, metrics, fingerprint)
+
+        # Cached weeks first: they do not wait on the pool
+        for instance, metrics, result, fingerprint in unchanged:
+            finish(instance, metrics, result, fingerprint)
+
+        for future in as_completed(pending):
+            instance, metrics, fingerprint = pending[future]
+            result = future.result()
+            metrics.merge(result["metrics"])
+            if result_cache is not None:
+                result_cache.put(instance["week_start"], fingerprint, result)
+            finish(instance, metrics, result, fingerprint)
+
+    return results
+
+
+def replay_week(path, listeners=(), **solve_options):
+    """Solve a week recorded with `record`, without database access.
+
+    Nothing is written; the result is shaped like solve_week's (with
+    result["written"] None).
+    """
+    metrics = RunMetrics()
+    with collect(metrics):
+        with phase("load_snapshot"):
+            instance = load_instance(path)
+    week_start = instance["week_start"]
+    metrics.week_start = week_start
+    print(f"Semaine: {week_start} -> {week_start + timedelta(days=6)} (rejouée depuis {path})")
+
+    result = compute_week(instance, listeners=list(listeners), **solve_options)
+    metrics.merge(result["metrics"])
+    with collect(metrics):
+        result["written"] = publish_week(None, instance, result, dry_run=True)
+    result["metrics"] = metrics.to_dict()
+    result["document"] = result_document(
+        week_start, instance["data"], result, instance["availability"]
+    )
+    return result
@@ -0,0 +1,330 @@
+"""Long-lived solver daemon.
+
+Keeps the interpreter, OR-Tools and a database connection warm between solves
+and accepts jobs over a small local HTTP API:
+
+    GET    /health                                    -> {"status": "ok"}
+    POST   /solve  {"week", "time_limit", "dry_run", ...} -> result document
+    POST   /jobs   {same job}                         -> 202 job status
+    GET    /jobs                                      -> {"jobs": [job status]}
+    GET    /jobs/<id>[?wait=SECONDS]                  -> job status
+    DELETE /jobs/<id>                                 -> job status (cancels)
+
+Optional job keys: "warm_start", "hint_previous_week", "site_model",
+"decompose", "balance", "persist_every" and the early-stopping keys
+"relative_gap", "absolute_gap", "plateau", "stop_when_filled",
+"fairness_gap", "staged" for a lexicographic solve, "diagnose" to explain
+a week without solution, "force" to solve a week even when its inputs are
+unchanged since its last run, "repair": [dates] with an optional
+"period" to re-optimize only those half-days (instead of "week"), and
+"rollback" to publish the week's previous solver run again instead of
+solving (the response is then {"week", "status": "ROLLED_BACK", "written"}).
+The response is the same document as `assign_secretaries.py --output json`
+(see lib.report.result_document).
+
+With "stream": true, /solve answers with NDJSON instead: one
+{"event": "solution", ...} line per improving solution while the solver
+runs, then {"event": "result", "result": document}.
+
+Jobs go through a queue (lib.jobs) and are processed one at a time: each
+CP-SAT solve already uses several worker threads, so running two at once
+would only make both slower. A job identical to one still queued or running
+joins it instead of solving the week again. /solve waits for its job;
+/jobs returns at once and the job is then polled (with "wait" to block up
+to that many seconds until it finishes) or cancelled. A job status is
+{"id", "week", "state" (queued, running, done, failed, cancelled),
+"requests", "created_at", "started_at", "finished_at", "progress" (last
+solution event), "error", "result"}. Each run holds its week's advisory
+lock (lib.db.week_lock): a week being solved by another process fails
+with 409.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import psycopg2
+
+from lib.db import WeekLocked, get_connection
+from lib.cache import ReferenceCache, ResultCache
+from lib.model import SITE_MODELS
+from lib.decompose import BALANCE_MODES
+from lib.jobs import JobQueue
+from lib.metrics import write_metrics
+from lib.progress import SolveCancelled
+from lib.runner import (
+    REPAIR_TIME_LIMIT, parse_week, repair_window, restore_previous_run, solve_week,
+)
+
+# Longest a status request may block with ?wait=
+MAX_WAIT = 60
+
+
+class SolverDaemon:
+    """Owns the warm connection and the job queue, and runs solve jobs
+    against the connection (from the queue's worker thread only)."""
+
+    def __init__(self, default_time_limit=30, verbose=False, metrics_file=None,
+                 metrics_format="json"):
+        self.default_time_limit = default_time_limit
+        self.verbose = verbose
+        # Every completed job's metrics are exported there (lib.metrics)
+        self.metrics_file = metrics_file
+        self.metrics_format = metrics_format
+        self.conn = None
+        self.reference_cache = ReferenceCache()
+        self.result_cache = ResultCache()
+        self.jobs = JobQueue(self._execute)
+
+    def connection(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = get_connection()
+        return self.conn
+
+    def reset_connection(self):
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.conn = None
+
+    def parse_job(self, job):
+        """Validate a job. Returns (week_start, solve_week options); raises
+        ValueError on bad input."""
+        repair = None
+        if job.get("repair"):
+            if job.get("period") not in (None, "AM", "PM"):
+                raise ValueError("period must be AM or PM")
+            week_start, repair = repair_window(job["repair"], period=job.get("period"))
+        else:
+            week_start = parse_week(job["week"])
+        options = {
+            "time_limit": int(
+                job.get("time_limit") or (REPAIR_TIME_LIMIT if repair else self.default_time_limit)
+            ),
+            "dry_run": bool(job.get("dry_run", False)),
+            "warm_start": bool(job.get("warm_start", False)),
+            "hint_previous_week": bool(job.get("hint_previous_week", False)),
+            "result_cache": None if job.get("force") else self.result_cache,
+        }
+        if job.get("site_model"):
+            if job["site_model"] not in SITE_MODELS:
+                raise ValueError(f"site_model must be one of {', '.join(SITE_MODELS)}")
+            options["site_model"] = job["site_model"]
+        if job.get("decompose"):
+            options["decompose"] = True
+            balance = job.get("balance") or "global"
+            if balance not in BALANCE_MODES:
+                raise ValueError(f"balance must be one of {', '.join(BALANCE_MODES)}")
+            options["balance"] = balance
+        if job.get("persist_every"):
+            options["persist_every"] = float(job["persist_every"])
+        for key in ("relative_gap", "absolute_gap", "plateau", "fairness_gap"):
+            if job.get(key) is not None:
+                options[key] = float(job[key])
+        if job.get("stop_when_filled"):
+            options["stop_when_filled"] = True
+        if options.get("decompose") and any(
+            key in options for key in ("relative_gap", "absolute_gap", "plateau", "stop_when_filled")
+        ):
+            raise ValueError("decompose cannot be combined with early stopping")
+        if repair:
+            options["repair"] = repair
+        if job.get("staged"):
+            options["staged"] = True
+        if job.get("diagnose"):
+            options["diagnose"] = True
+        if job.get("rollback"):
+            if repair:
+                raise ValueError("rollback takes a week, not repair dates")
+            options["rollback"] = True
+        return week_start, options
+
+    def submit(self, job):
+        """Validate and queue a job. Returns (lib.jobs.Job, coalesced);
+        raises ValueError on bad input."""
+        week_start, options = self.parse_job(job)
+        return self.jobs.submit(week_start, options)
+
+    def run_job(self, job, listeners=()):
+        """Queue a job, wait for it and return its result document.
+        `listeners` receive every improving solution (see lib.progress).
+
+        Raises what the solve raised, SolveCancelled if the job was
+        cancelled."""
+        queued, _coalesced = self.submit(job)
+        for listener in listeners:
+            queued.subscribe(listener)
+        try:
+            queued.finished.wait()
+        finally:
+            for listener in listeners:
+                queued.unsubscribe(listener)
+        if queued.state == "cancelled":
+            raise SolveCancelled()
+        if queued.state == "failed":
+            raise queued.exception
+        return queued.document
+
+    def _execute(self, job):
+        """JobQueue worker: solve a queued job, return its result document."""
+        options = dict(job.options, listeners=[job], cancel=job.cancellation)
+        try:
+            result = self._solve(job.week_start, options)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Connection dropped while idle (server restart, pooler timeout):
+            # reconnect once and retry the job.
+            self.reset_connection()
+            result = self._solve(job.week_start, options)
+
+        if self.metrics_file:
+            write_metrics(self.metrics_file, [result["metrics"]], fmt=self.metrics_format)
+        return result["document"]
+
+    def _solve(self, week_start, options):
+        conn = self.connection()
+        try:
+            if options.get("rollback"):
+                return restore_previous_run(conn, week_start)
+            return solve_week(
+                conn, week_start,
+                verbose=self.verbose,
+                reference_cache=self.reference_cache,
+                **options,
+            )
+        except psycopg2.Error:
+            if not conn.closed:
+                conn.rollback()
+            raise
+
+
+def _make_handler(daemon):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/health":
+                self._send(200, {"status": "ok"})
+            elif url.path == "/jobs":
+                self._send(200, {"jobs": [job.status(result=False) for job in daemon.jobs.list()]})
+            elif url.path.startswith("/jobs/"):
+                job = daemon.jobs.get(url.path[len("/jobs/"):])
+                if job is None:
+                    self._send(404, {"error": "Unknown job"})
+                    return
+                try:
+                    wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+                except ValueError:
+                    self._send(400, {"error": "wait must be a number of seconds"})
+                    return
+                if wait > 0:
+                    job.finished.wait(min(wait, MAX_WAIT))
+                self._send(200, job.status())
+            else:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+
+        def do_DELETE(self):
+            path = urlsplit(self.path).path
+            job = daemon.jobs.cancel(path[len("/jobs/"):]) if path.startswith("/jobs/") else None
+            if job is None:
+                self._send(404, {"error": f"Unknown job or path {self.path}"})
+                return
+            self._send(200, job.status())
+
+        def do_POST(self):
+            path = urlsplit(self.path).path
+            if path not in ("/solve", "/jobs"):
+                self._send(404, {"error": f"Unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                job = json.loads(self.rfile.read(length) or b"{}")
+                if "week" not in job and not job.get("repair"):
+                    raise ValueError("week is required")
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+                return
+
+            if path == "/jobs":
+                try:
+                    queued, coalesced = daemon.submit(job)
+                except ValueError as e:
+                    self._send(400, {"error": str(e)})
+                    return
+                self._send(202, dict(queued.status(), coalesced=coalesced))
+                return
+
+            if job.get("stream"):
+                self._stream(job)
+                return
+
+            try:
+                self._send(200, daemon.run_job(job))
+            except (WeekLocked, SolveCancelled) as e:
+                self._send(409, {"error": str(e) or "Job cancelled"})
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+
+        def _stream(self, job):
+            """Answer with NDJSON: one line per improving solution, then
+            {"event": "result", "result": document} or {"event": "error"}."""
+            try:
+                daemon.parse_job(job)
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            lock = threading.Lock()
+
+            def write_line(payload):
+                with lock:
+                    try:
+                        self.wfile.write(json.dumps(payload).encode("utf-8") + b"\n")
+                        self.wfile.flush()
+                    except OSError:
+                        pass  # client went away: the job still completes
+
+            try:
+                document = daemon.run_job(job, listeners=[lambda event, _extract: write_line(event)])
+                write_line({"event": "result", "result": document})
+            except SolveCancelled:
+                write_line({"event": "error", "error": "Job cancelled"})
+            except Exception as e:
+                write_line({"event": "error", "error": str(e)})
+
+        def _send(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8765, default_time_limit=30, verbose=False,
+          metrics_file=None, metrics_format="json"):
+    """Run the solver daemon until interrupted."""
+    daemon = SolverDaemon(
+        default_time_limit=default_time_limit,
+        verbose=verbose,
+        metrics_file=metrics_file,
+        metrics_format=metrics_format,
+    )
+    daemon.connection()  # connect eagerly so the first job is already warm
+    daemon.jobs.start()
+
+    # Status and cancel requests are answered while a job is running
+    httpd = ThreadingHTTPServer((host, port), _make_handler(daemon))
+    print(f"Solveur en écoute sur http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        daemon.reset_connection()
@@ -0,0 +1,92 @@
+"""Recorded week instances, for solving offline without the database.
+
+A snapshot is the output of prepare_week (data, availability map, admin
+blocks, hints) written as a small header followed by a gzip-compressed
+pickle:
+
+    b"SECSNAP" + format version (1 byte) + gzip(pickle(payload))
+
+`--record` writes one after loading a week and `--replay` solves it again
+with no database, e.g. to profile a hard week or to keep a regression
+corpus of real weeks (benchmark_model.py --snapshot).
+
+Snapshots are pickles: only replay files you recorded yourself.
+"""
+
+import gzip
+import os
+import pickle
+import time
+from datetime import date
+
+from lib.records import Secretary
+
+MAGIC = b"SECSNAP"
+# 2: data["eligibility"] is a lib.eligibility.EligibilityTable (a list of
+# row dicts in 1). 3: data["secretaries"] are lib.records.Secretary (dicts
+# before). Older versions are still read.
+FORMAT_VERSION = 3
+
+
+def _plain(value):
+    """Copy of `value` with dict subclasses (psycopg2 RealDictRow,
+    defaultdict) turned into dicts, so loading a snapshot needs neither
+    psycopg2 nor the classes that produced it."""
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+def record_path(path, week_start: date):
+    """Snapshot path of a week: `path` with "{week}" replaced by its Monday."""
+    return path.replace("{week}", week_start.isoformat())
+
+
+def save_instance(path, instance):
+    """Write a prepare_week instance to `path` (atomically)."""
+    payload = {
+        "recorded_at": time.time(),
+        "instance": {
+            "week_start": instance["week_start"],
+            "data": _plain(instance["data"]),
+            "availability": _plain(instance["availability"]),
+            "admin_blocks": _plain(instance["admin_blocks"]),
+            "hints": _plain(instance.get("hints") or []),
+        },
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + bytes([FORMAT_VERSION]))
+        with gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as gz:
+            pickle.dump(payload, gz, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def load_instance(path):
+    """Read an instance written by save_instance.
+
+    Raises ValueError when `path` is not a snapshot or was written by a
+    newer format version.
+    """
+    with open(path, "rb") as f:
+        header = f.read(len(MAGIC) + 1)
+        if len(header) < len(MAGIC) + 1 or header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} n'est pas un snapshot de semaine")
+        version = header[-1]
+        if version > FORMAT_VERSION:
+            raise ValueError(
+                f"{path}: snapshot au format {version}, ce script lit jusqu'au format {FORMAT_VERSION}"
+            )
+        with gzip.GzipFile(fileobj=f, mode="rb") as gz:
+            payload = pickle.load(gz)
+    instance = payload["instance"]
+    if version < 3:
+        data = instance["data"]
+        data["secretaries"] = [Secretary.from_row(s) for s in data["secretaries"]]
+    return instance
@@ -0,0 +1,221 @@
+"""Synthetic weeks for benchmarking the model without a database.
+
+generate_week() returns an instance shaped like runner.prepare_week()'s,
+with `data` keyed and typed like the fn_load_week_data payload (ISO date
+strings included), so build_model, compute_week and print_report run on it
+unchanged.
+"""
+
+import random
+from datetime import date, timedelta
+
+from lib.records import Secretary
+from lib.runner import build_availability_map
+
+DAYS = 5
+PERIODS = ("AM", "PM")
+
+ROLES = [
+    {"id_role": 1, "name": "Standard", "hardship_weight": 0},
+    {"id_role": 2, "name": "Aide fermeture", "hardship_weight": 2},
+    {"id_role": 3, "name": "Fermeture", "hardship_weight": 3},
+]
+
+# Score scale of v_secretary_eligibility
+SKILL_SCORES = {1: 40, 2: 30, 3: 20, 4: 10}  # skill_preference -> skill_score
+EVITER_SCORE = -30
+PREFERE_SCORE = 20
+
+_SECRETARY_FIELDS = (
+    "id_staff", "lastname", "firstname", "is_flexible", "flexibility_pct",
+    "full_day_only", "admin_target",
+)
+
+
+def generate_week(n_secretaries=30, seed=0, week_start=date(2026, 1, 5),
+                  n_sites=3, n_skills=6, sparsity=0.3):
+    """Generate a random but realistic week for `n_secretaries` secretaries.
+
+    The number of departments per site grows with the staff (one per five
+    secretaries, at least two) so medical needs keep up with C6: every
+    available half-day must be worked, and admin blocks take at most 30.
+    `sparsity` is the share of department half-days without a block. The
+    same arguments always give the same week.
+    """
+    rng = random.Random(seed)
+    days = [week_start + timedelta(days=i) for i in range(DAYS)]
+    depts_per_site = max(2, n_secretaries // 5)
+
+    sites = [{"id_site": i + 1, "name": f"Site {i + 1}"} for i in range(n_sites)]
+    departments = []
+    for site in sites:
+        for _ in range(depts_per_site):
+            did = len(departments) + 1
+            departments.append({
+                "id_department": did, "name": f"Service {did}",
+                "id_site": site["id_site"], "site_name": site["name"],
+            })
+    admin_dept_id = len(departments) + 1
+    departments.append({
+        "id_department": admin_dept_id, "name": "Administration",
+        "id_site": 1, "site_name": sites[0]["name"],
+    })
+    medical_depts = departments[:-1]
+
+    # --- Secretaries, skills and preferences ---
+    secretaries = []
+    skill_pref = {}  # sid -> {id_skill: skill_preference}
+    preferences = []
+    eviter = {}  # sid -> {("SITE", id) | ("DEPT", id)}
+    prefere = {}
+    for i in range(n_secretaries):
+        sid = 100 + i
+        flexible = rng.random() < 0.2
+        secretaries.append({
+            "id_staff": sid,
+            "lastname": f"Nom{i:04d}",
+            "firstname": f"Prénom{i:04d}",
+            "is_flexible": flexible,
+            "flexibility_pct": rng.choice([0.4, 0.6, 0.8]) if flexible else 1.0,
+            "full_day_only": rng.random() < 0.3,
+            "admin_target": rng.choice([0, 0, 0, 1, 2]),
+        })
+        skill_pref[sid] = {
+            k: rng.randint(1, 4)
+            for k in rng.sample(range(1, n_skills + 1), rng.randint(1, 3))
+        }
+        eviter[sid] = set()
+        prefere[sid] = set()
+        for kind, targets, key in (
+            ("SITE", sites, "id_site"),
+            ("DEPT", medical_depts, "id_department"),
+        ):
+            if rng.random() < 0.15:
+                target = rng.choice(targets)[key]
+                eviter[sid].add((kind, target))
+                preferences.append(_preference(sid, kind, key, target, "EVITER"))
+            elif rng.random() < 0.15:
+                target = rng.choice(targets)[key]
+                prefere[sid].add((kind, target))
+                preferences.append(_preference(sid, kind, key, target, "PREFERE"))
+
+    # --- Availability: full_day_only secretaries always work both periods ---
+    availability = []
+    for sec in secretaries:
+        for d in days:
+            if rng.random() < 0.1:
+                continue
+            for period in PERIODS:
+                if not sec["full_day_only"] and rng.random() < 0.05:
+                    continue
+                availability.append({
+                    **{f: sec[f] for f in _SECRETARY_FIELDS},
+                    "date": d.isoformat(),
+                    "period": period,
+                })
+    available = {(a["id_staff"], a["date"], a["period"]) for a in availability}
+
+    # --- Blocks, needs and eligibility ---
+    needs = []
+    eligibility = []
+    next_block = 1000
+    for dept in medical_depts:
+        for d in days:
+            for period in PERIODS:
+                if rng.random() < sparsity:
+                    continue
+                next_block += 1
+                for id_skill in rng.sample(range(1, n_skills + 1), rng.randint(1, 2)):
+                    role = rng.choice([1, 1, 1, 2, 3])
+                    gap = rng.randint(1, 2)
+                    need = {
+                        "id_block": next_block, "date": d.isoformat(), "period": period,
+                        "block_type": "CONSULTATION",
+                        "department": dept["name"], "site": dept["site_name"],
+                        "skill_name": f"Compétence {id_skill}",
+                        "role_name": ROLES[role - 1]["name"],
+                        "id_skill": id_skill, "id_role": role,
+                        "needed": gap, "assigned": 0, "gap": gap,
+                        "id_department": dept["id_department"], "id_site": dept["id_site"],
+                    }
+                    needs.append(need)
+                    for sec in secretaries:
+                        sid = sec["id_staff"]
+                        if id_skill not in skill_pref[sid]:
+                            continue
+                        if (sid, need["date"], period) not in available:
+                            continue
+                        eligibility.append(
+                            _eligibility_row(sec, need, skill_pref[sid][id_skill],
+                                             eviter[sid], prefere[sid], rng)
+                        )
+
+    admin_blocks = []
+    for d in days:
+        for period in PERIODS:
+            next_block += 1
+            admin_blocks.append({
+                "id_block": next_block, "date": d.isoformat(),
+                "period": period, "id_department": admin_dept_id,
+            })
+
+    data = {
+        "availability": availability,
+        "eligibility": eligibility,
+        "needs": needs,
+        "existing_assignments": [],
+        "doctor_activities": [],
+        "departments": departments,
+        "sites": sites,
+        "roles": ROLES,
+        "preferences": preferences,
+        "admin_dept_id": admin_dept_id,
+        "all_secretaries": [
+            {f: s[f] for f in ("id_staff", "lastname", "firstname")} for s in secretaries
+        ],
+        "skills": [
+            {"id_staff": sid, "id_skill": k}
+            for sid, skills in skill_pref.items() for k in sorted(skills)
+        ],
+        "secretaries": sorted(map(Secretary.from_row, secretaries), key=lambda s: s.lastname),
+    }
+    return {
+        "week_start": week_start,
+        "data": data,
+        "availability": build_availability_map(data),
+        "admin_blocks": admin_blocks,
+        "hints": [],
+    }
+
+
+def _preference(sid, kind, key, target, preference):
+    row = {
+        "id_staff": sid, "target_type": "DEPARTMENT" if kind == "DEPT" else kind, "id_site": None,
+        "id_department": None, "id_target_staff": None, "preference": preference,
+    }
+    row[key] = target
+    return row
+
+
+def _eligibility_row(sec, need, skill_preference, eviter, prefere, rng):
+    site = ("SITE", need["id_site"])
+    dept = ("DEPT", need["id_department"])
+    return {
+        **{f: sec[f] for f in _SECRETARY_FIELDS},
+        **{f: need[f] for f in (
+            "id_block", "date", "period", "block_type", "department", "site",
+            "skill_name", "role_name", "id_skill", "id_role", "gap",
+            "id_department", "id_site",
+        )},
+        "skill_preference": skill_preference,
+        "skill_score": SKILL_SCORES[skill_preference],
+        "base_score": SKILL_SCORES[skill_preference],
+        "eviter_site_score": EVITER_SCORE if site in eviter else 0,
+        "eviter_dept_score": EVITER_SCORE if dept in eviter else 0,
+        # Working with an avoided colleague: rare, and block-level in the view
+        "eviter_staff_score": EVITER_SCORE if rng.random() < 0.02 else 0,
+        "prefere_site_score": PREFERE_SCORE if site in prefere else 0,
+        "prefere_dept_score": PREFERE_SCORE if dept in prefere else 0,
+        "prefere_staff_score": 0,
+        "need_type": "MEDICAL",
+    }
@@ -0,0 +1,173 @@
+"""Event-driven re-planning: repair the half-days whose inputs changed.
+
+The triggers of scripts/create-fn-notify-replan.mjs notify channel
+"solver_replan" when an absence, a need (DOCTOR assignment) or a MANUAL
+secretary assignment changes, with the affected range of half-days as
+payload. ReplanWatcher LISTENs on that channel, waits for a burst of
+changes to settle (`debounce` seconds without a new notification, at most
+`max_wait` after the first one) and then runs a bounded repair
+(solve_week(repair=...)) of just those half-days in every affected week
+that has a stored plan. Past days and weeks never planned are skipped.
+
+The solver's own writes (source ALGORITHM) do not notify, so a repair does
+not trigger another one.
+"""
+
+import json
+import select
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import psycopg2
+
+from lib.db import WeekLocked, get_connection, load_planned_weeks
+from lib.metrics import write_metrics
+from lib.runner import REPAIR_TIME_LIMIT, solve_week
+
+CHANNEL = "solver_replan"
+
+
+def parse_notification(payload):
+    """Half-days {(date, period)} of a notification payload; empty when
+    the payload is not one of ours."""
+    try:
+        change = json.loads(payload)
+        start = date.fromisoformat(change["start"])
+        end = date.fromisoformat(change["end"] or change["start"])
+    except (ValueError, TypeError, KeyError):
+        return set()
+    periods = [change["period"]] if change.get("period") in ("AM", "PM") else ["AM", "PM"]
+    return {
+        (start + timedelta(days=i), period)
+        for i in range((end - start).days + 1)
+        for period in periods
+    }
+
+
+def group_by_week(slots, today=None):
+    """{week_start: {(date, period)}} of `slots`, without the days before
+    `today`."""
+    today = today or date.today()
+    weeks = defaultdict(set)
+    for d, period in slots:
+        if d >= today:
+            weeks[d - timedelta(days=d.weekday())].add((d, period))
+    return dict(weeks)
+
+
+class ReplanWatcher:
+    """Collects change notifications and repairs the affected half-days."""
+
+    def __init__(self, debounce=2.0, max_wait=30.0, dry_run=False, reference_cache=None,
+                 listeners=(), metrics_file=None, metrics_format="json", **solve_options):
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.dry_run = dry_run
+        self.reference_cache = reference_cache
+        self.listeners = listeners
+        # Every repaired week's metrics are exported there (lib.metrics)
+        self.metrics_file = metrics_file
+        self.metrics_format = metrics_format
+        solve_options.setdefault("time_limit", REPAIR_TIME_LIMIT)
+        self.solve_options = solve_options
+        self.pending = set()
+        self._first = None
+        self._last = None
+
+    def add(self, payload, now=None):
+        """Record one notification payload."""
+        slots = parse_notification(payload)
+        if not slots:
+            return
+        self.defer(slots, now)
+
+    def defer(self, slots, now=None):
+        """Add half-days to re-plan with the next batch."""
+        now = time.monotonic() if now is None else now
+        if self._first is None:
+            self._first = now
+        self._last = now
+        self.pending |= slots
+
+    def due(self, now=None):
+        """Seconds until the pending changes should be re-planned (0: now),
+        None when nothing is pending."""
+        if not self.pending:
+            return None
+        now = time.monotonic() if now is None else now
+        deadline = min(self._last + self.debounce, self._first + self.max_wait)
+        return max(deadline - now, 0.0)
+
+    def take(self):
+        """Pending half-days grouped by week; clears them."""
+        weeks = group_by_week(self.pending)
+        self.pending = set()
+        self._first = self._last = None
+        return weeks
+
+    def replan(self, conn, weeks):
+        """Repair the given {week_start: slots}. Returns {week_start: result}."""
+        if not weeks:
+            return {}
+        planned = load_planned_weeks(conn, min(weeks), max(weeks) + timedelta(days=6))
+        conn.rollback()
+        results = {}
+        for week_start in sorted(weeks):
+            slots = weeks[week_start]
+            if week_start not in planned:
+                print(f"Semaine {week_start}: aucun plan enregistré, ignorée")
+                continue
+            days = sorted({d for d, _period in slots})
+            print(f"Re-planification: {len(slots)} demi-journée(s) du {days[0]} au {days[-1]}")
+            try:
+                results[week_start] = solve_week(
+                    conn, week_start,
+                    dry_run=self.dry_run,
+                    reference_cache=self.reference_cache,
+                    listeners=self.listeners,
+                    repair=slots,
+                    **self.solve_options,
+                )
+            except WeekLocked as e:
+                # Retried after the other run, which may predate the change
+                print(f"  {e}: nouvel essai plus tard")
+                self.defer(slots)
+                continue
+            if self.metrics_file:
+                write_metrics(
+                    self.metrics_file, [results[week_start]["metrics"]], fmt=self.metrics_format,
+                )
+        return results
+
+    def run(self):
+        """LISTEN and re-plan until interrupted."""
+        listen = get_connection()
+        listen.autocommit = True
+        listen.cursor().execute(f"LISTEN {CHANNEL}")
+        conn = get_connection()
+        print(f"En attente de changements sur le canal {CHANNEL}...")
+        try:
+            while True:
+                timeout = self.due()
+                if timeout is None or timeout > 0:
+                    select.select([listen], [], [], timeout)
+                listen.poll()
+                while listen.notifies:
+                    self.add(listen.notifies.pop(0).payload)
+                if self.due() == 0:
+                    weeks = self.take()
+                    try:
+                        self.replan(conn, weeks)
+                    except psycopg2.Error as e:
+                        # Not fatal: the next change re-plans these days again
+                        print(f"ERREUR: re-planification interrompue: {e}")
+                        if conn.closed:
+                            conn = get_connection()
+                        else:
+                            conn.rollback()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listen.close()
+            conn.close()
@@ -26,6 +26,54 @@ function getMondaysForMonth(monthStart: Date): Date[] {
   return mondays;
 }
 
+interface SolutionEvent {
+  filled: number;
+  needs: number;
+  objective: number;
+  bound: number;
+  wall_time: number;
+}
+
+interface SolverResult {
+  summary: { filled: number; unfilled: number };
+  written: { inserted: number; updated: number; deleted: number } | null;
+}
+
+/**
+ * Read an /api/solver response: NDJSON events when the solver daemon streams
+ * (one "solution" line per improving solution, then "result"), plain JSON
+ * otherwise. Returns the result document.
+ */
+async function readSolverResponse(
+  res: Response,
+  onSolution: (event: SolutionEvent) => void
+): Promise<SolverResult> {
+  if (!res.headers.get("Content-Type")?.includes("ndjson") || !res.body) {
+    const data = await res.json();
+    if (!res.ok) throw new Error(data.error);
+    return data.result;
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split("\n");
+    buffer = lines.pop() ?? "";
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const event = JSON.parse(line);
+      if (event.event === "solution") onSolution(event);
+      else if (event.event === "result") return event.result;
+      else if (event.event === "error") throw new Error(event.error);
+    }
+  }
+  throw new Error("Réponse du solveur incomplète");
+}
+
 export function SolverDialog() {
   const { open } = useAppStore((s) => s.solverDialog);
   const close = useAppStore((s) => s.closeSolverDialog);
@@ -46,6 +94,10 @@ export function SolverDialog() {
     setProgress({ current: 0, total: mondays.length });
 
     try {
+      let filled = 0;
+      let unfilled = 0;
+      let changed = false;
+
       for (let i = 0; i < mondays.length; i++) {
         const weekStart = format(mondays[i], "yyyy-MM-dd");
         setMessage(`Semaine ${i + 1}/${mondays.length} — ${weekStart}`);
@@ -57,20 +109,37 @@ export function SolverDialog() {
           body: JSON.stringify({
             weekStart,
             clearProposed: true,
+            stream: true,
           }),
         });
 
-        const data = await res.json();
-        if (!res.ok) throw new Error(`Semaine ${weekStart}: ${data.error}`);
+        const result = await readSolverResponse(res, (event) => {
+          setMessage(
+            `Semaine ${i + 1}/${mondays.length} — ${weekStart} : ` +
+              `${event.filled}/${event.needs} besoins remplis (${event.wall_time.toFixed(1)}s)`
+          );
+        }).catch((err) => {
+          throw new Error(`Semaine ${weekStart}: ${err instanceof Error ? err.message : err}`);
+        });
+
+        // The solver returns its result document: no need to re-query per week
+        const { summary, written } = result;
+        filled += summary.filled;
+        unfilled += summary.unfilled;
+        if (written && written.inserted + written.updated + written.deleted > 0) changed = true;
       }
 
       setStatus("success");
-      setMessage(`${mondays.length} semaines traitées avec succès`);
-
-      // Invalidate monthly planning data
-      queryClient.invalidateQueries({
-        queryKey: ["planning", "month"],
-      });
+      setMessage(
+        `${mondays.length} semaines traitées — ${filled} besoins remplis, ${unfilled} non remplis`
+      );
+
+      // Reload the monthly planning only if the solver changed something
+      if (changed) {
+        queryClient.invalidateQueries({
+          queryKey: ["planning", "month"],
+        });
+      }
     } catch (err) {
       setStatus("error");
       setMessage(err instanceof Error ? err.message : "Erreur inconnue");